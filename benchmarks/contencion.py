@@ -0,0 +1,216 @@
+"""Measure checkout throughput when many tills sell the same few variants.
+
+Every till (a thread with its own test client) posts carts drawn from a
+small set of "hot" variants whose stock is reset to ``--stock`` before each
+mode. The run is repeated with the availability check on and off, to show
+what the row locks cost and what they prevent: without them the final
+balances go negative (oversold units), with them they never do.
+
+Example::
+
+    python -m benchmarks.contencion --database-url postgresql+psycopg://... --skip-seed \\
+        --cajas 32 --calientes 5 --stock 200
+
+SQLite serializes every write anyway, so only Postgres shows real contention.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from sqlalchemy import create_engine, select
+
+from .dataset import Volumes, seed
+from .run import _print_result, _summary
+
+MODOS = {"verificado": False, "sin_verificar": True}
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.database_url
+    if not args.skip_seed:
+        seed(
+            create_engine(args.database_url),
+            Volumes(productos=args.productos, movimientos=0),
+            seed_value=args.seed,
+            bcrypt_rounds=4,
+        )
+
+    from src.API.app import create_app
+
+    app = create_app(interactive=False)
+    calientes = _calientes(app, args.calientes)
+    print(f"Variantes calientes: {calientes}")
+
+    resultados = {}
+    for modo in args.modo or list(MODOS):
+        app.config["STOCK_PERMITIR_NEGATIVO"] = MODOS[modo]
+        _fijar_stock(app, calientes, args.stock)
+        resultado = _medir(app, calientes, args)
+        resultado.update(_verificar(app, calientes, args.stock, resultado.pop("vendidos")))
+        resultados[modo] = resultado
+        _print_result(modo, resultado)
+        print(
+            f"{'':<24} ventas={resultado['ventas_ok']} rechazadas={resultado['sin_stock']} "
+            f"unidades={resultado['unidades_vendidas']} sobreventa={resultado['sobreventa']} "
+            f"consistente={resultado['consistente']}"
+        )
+
+    if args.output:
+        salida = Path(args.output)
+        salida.parent.mkdir(parents=True, exist_ok=True)
+        salida.write_text(
+            json.dumps({"parametros": vars(args), "resultados": resultados}, indent=2),
+            encoding="utf-8",
+        )
+        print(f"Resultados guardados en {salida}")
+
+    verificado = resultados.get("verificado")
+    return 1 if verificado and (verificado["sobreventa"] or not verificado["consistente"]) else 0
+
+
+def _calientes(app, cantidad: int) -> list[int]:
+    from src.API.db import get_session
+    from src.API.models import ProductoVariante
+
+    with app.app_context(), get_session() as session:
+        return list(
+            session.scalars(
+                select(ProductoVariante.idvariante)
+                .where(ProductoVariante.estado.is_(True))
+                .order_by(ProductoVariante.idvariante)
+                .limit(cantidad)
+            )
+        )
+
+
+def _fijar_stock(app, ids: list[int], cantidad: int) -> None:
+    """Bring every variant in ``ids`` to ``cantidad`` through the ledger."""
+
+    from src.API.db import get_session
+    from src.API.models import MovimientoStock, StockVariante
+    from src.API.stock import aplicar_deltas
+
+    with app.app_context(), get_session() as session:
+        actuales = dict(
+            session.execute(
+                select(StockVariante.idvariante, StockVariante.cantidad).where(
+                    StockVariante.idvariante.in_(ids)
+                )
+            ).all()
+        )
+        deltas = {idvariante: cantidad - (actuales.get(idvariante) or 0) for idvariante in ids}
+        deltas = {idvariante: delta for idvariante, delta in deltas.items() if delta}
+        for idvariante, delta in deltas.items():
+            session.add(
+                MovimientoStock(
+                    idvariante=idvariante,
+                    tipo="ENTRADA" if delta > 0 else "SALIDA",
+                    cantidad=abs(delta),
+                    descripcion="benchmark de contención",
+                )
+            )
+        aplicar_deltas(session, deltas)
+
+
+def _medir(app, calientes: list[int], args: argparse.Namespace) -> dict:
+    latencias: list[float] = []
+    estados: Counter[int] = Counter()
+    vendidos: Counter[int] = Counter()
+    lock = threading.Lock()
+    inicio = threading.Barrier(args.cajas + 1)
+
+    def caja(numero: int) -> None:
+        rng = random.Random(args.seed + numero)
+        client = app.test_client()
+        locales: list[float] = []
+        locales_estados: Counter[int] = Counter()
+        locales_vendidos: Counter[int] = Counter()
+        inicio.wait()
+        for _ in range(args.ventas):
+            items = rng.sample(calientes, rng.randint(1, min(args.items, len(calientes))))
+            started = time.perf_counter()
+            response = client.post(
+                "/api/ventas",
+                json={
+                    "metodopago": "efectivo",
+                    "items": [{"idvariante": idvariante, "cantidad": 1} for idvariante in items],
+                },
+            )
+            locales.append(time.perf_counter() - started)
+            locales_estados[response.status_code] += 1
+            if response.status_code == 201:
+                locales_vendidos.update(items)
+        with lock:
+            latencias.extend(locales)
+            estados.update(locales_estados)
+            vendidos.update(locales_vendidos)
+
+    threads = [threading.Thread(target=caja, args=(numero,)) for numero in range(args.cajas)]
+    for thread in threads:
+        thread.start()
+    inicio.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    errores = sum(n for status, n in estados.items() if status not in (201, 409))
+    return {
+        **_summary(latencias, elapsed, errores),
+        "ventas_ok": estados[201],
+        "sin_stock": estados[409],
+        "vendidos": vendidos,
+    }
+
+
+def _verificar(app, ids: list[int], stock: int, vendidos: Counter[int]) -> dict:
+    """Compare final balances with what was sold; negative balances are oversold units."""
+
+    from src.API.db import get_session
+    from src.API.models import StockVariante
+
+    with app.app_context(), get_session() as session:
+        finales = dict(
+            session.execute(
+                select(StockVariante.idvariante, StockVariante.cantidad).where(
+                    StockVariante.idvariante.in_(ids)
+                )
+            ).all()
+        )
+    return {
+        "unidades_vendidas": sum(vendidos.values()),
+        "sobreventa": sum(max(-finales.get(idvariante, 0), 0) for idvariante in ids),
+        "consistente": all(
+            finales.get(idvariante, 0) == stock - vendidos[idvariante] for idvariante in ids
+        ),
+    }
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default="sqlite:///bench.db")
+    parser.add_argument("--skip-seed", action="store_true", help="Reutiliza los datos existentes.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--productos", type=int, default=200)
+    parser.add_argument("--cajas", type=int, default=16, help="Hilos vendiendo a la vez.")
+    parser.add_argument("--ventas", type=int, default=50, help="Ventas por caja.")
+    parser.add_argument("--items", type=int, default=3, help="Máximo de variantes por venta.")
+    parser.add_argument("--calientes", type=int, default=5)
+    parser.add_argument("--stock", type=int, default=100, help="Stock inicial de cada una.")
+    parser.add_argument("--modo", action="append", choices=list(MODOS))
+    parser.add_argument("--output")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
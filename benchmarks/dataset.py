@@ -0,0 +1,359 @@
+"""Synthetic Vivero dataset generator used by the benchmarks.
+
+Rows are generated lazily from a seeded RNG, so the same volumes and seed
+always produce the same database, and streamed into the target in chunks
+(COPY on Postgres, executemany elsewhere) so memory stays flat even for
+millions of movements.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Iterable, Iterator
+
+import bcrypt
+from sqlalchemy import Engine, Table, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from src.API.models import (
+    Atributo,
+    AtributoOpcion,
+    Base,
+    Categoria,
+    Empleado,
+    MovimientoStock,
+    Producto,
+    ProductoVariante,
+    Proveedor,
+    SyncVersion,
+    Usuario,
+    VarianteValor,
+)
+from src.API.stock import recalcular_saldos
+
+CHUNK_SIZE = 10_000
+
+NOMBRES = [
+    "Rosa",
+    "Helecho",
+    "Potus",
+    "Monstera",
+    "Ficus",
+    "Lavanda",
+    "Jazmin",
+    "Cactus",
+    "Orquidea",
+    "Begonia",
+    "Romero",
+    "Albahaca",
+    "Malvon",
+    "Hortensia",
+    "Gardenia",
+]
+COLORES = ["rojo", "blanco", "amarillo", "rosa", "violeta", "verde", "naranja"]
+MACETAS = ["8cm", "10cm", "12cm", "14cm", "16cm", "20cm", "25cm"]
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench-password"
+
+
+@dataclass
+class Volumes:
+    categorias: int = 20
+    proveedores: int = 10
+    productos: int = 1_000
+    variantes_por_producto: int = 3
+    movimientos: int = 10_000
+    dias_historial: int = 365
+
+
+def seed(
+    engine: Engine, volumes: Volumes, *, seed_value: int = 1234, bcrypt_rounds: int = 12
+) -> dict:
+    """Create the schema on ``engine`` and fill it with synthetic data.
+
+    Returns a summary with the row counts written and a few sample values the
+    scenarios need (variant ids, barcodes and the benchmark login).
+    """
+
+    rng = random.Random(seed_value)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    total_variantes = volumes.productos * volumes.variantes_por_producto
+    ahora = datetime.utcnow()
+
+    with engine.begin() as conn:
+        _bulk(
+            conn,
+            Categoria.__table__,
+            (
+                {
+                    "idcategoria": i,
+                    "nombre": f"Categoria {i}",
+                    "slug": f"categoria-{i}",
+                    "descripcion": None,
+                    "estado": True,
+                    "fecha_creacion": ahora,
+                }
+                for i in range(1, volumes.categorias + 1)
+            ),
+        )
+        _bulk(
+            conn,
+            Proveedor.__table__,
+            (
+                {
+                    "idproveedor": i,
+                    "nombre": f"Proveedor {i}",
+                    "telefono": None,
+                    "email": None,
+                    "direccion": None,
+                    "cuit": f"30-{i:08d}-1",
+                    "estado": True,
+                }
+                for i in range(1, volumes.proveedores + 1)
+            ),
+        )
+        _bulk(
+            conn,
+            Atributo.__table__,
+            [
+                {
+                    "idatributo": 1,
+                    "nombre": "Color",
+                    "slug": "color",
+                    "tipo_dato": "opcion",
+                    "es_obligatorio": False,
+                    "orden": 1,
+                    "activo": True,
+                    "fecha_creacion": ahora,
+                },
+                {
+                    "idatributo": 2,
+                    "nombre": "Maceta",
+                    "slug": "maceta",
+                    "tipo_dato": "opcion",
+                    "es_obligatorio": False,
+                    "orden": 2,
+                    "activo": True,
+                    "fecha_creacion": ahora,
+                },
+            ],
+        )
+        opciones = [(1, valor) for valor in COLORES] + [(2, valor) for valor in MACETAS]
+        _bulk(
+            conn,
+            AtributoOpcion.__table__,
+            (
+                {
+                    "idopcion": i,
+                    "idatributo": idatributo,
+                    "valor": valor,
+                    "slug": valor,
+                    "orden": i,
+                    "activo": True,
+                }
+                for i, (idatributo, valor) in enumerate(opciones, start=1)
+            ),
+        )
+        _bulk(
+            conn,
+            Producto.__table__,
+            (
+                {
+                    "idproducto": i,
+                    "nombre": f"{rng.choice(NOMBRES)} {i}",
+                    "preciocompra": Decimal(rng.randint(100, 5000)),
+                    "precioventa": Decimal(rng.randint(5000, 20000)),
+                    "stockactual": None,
+                    "stockminimo": None,
+                    "fechaingreso": ahora.date(),
+                    "descripcion": "Planta generada para benchmarks",
+                    "estado": True,
+                    "idcategoria": rng.randint(1, volumes.categorias),
+                    "idproveedor": rng.randint(1, volumes.proveedores),
+                }
+                for i in range(1, volumes.productos + 1)
+            ),
+        )
+        _bulk(
+            conn,
+            ProductoVariante.__table__,
+            (
+                {
+                    "idvariante": i,
+                    "idproducto": (i - 1) // volumes.variantes_por_producto + 1,
+                    "sku": f"SKU-{i:08d}",
+                    "codigo_barras": f"779{i:010d}",
+                    "precio_compra": Decimal(rng.randint(100, 5000)),
+                    "precio_venta": Decimal(rng.randint(5000, 20000)),
+                    "stock_minimo": rng.randint(0, 10),
+                    "estado": True,
+                    "fecha_creacion": ahora,
+                }
+                for i in range(1, total_variantes + 1)
+            ),
+        )
+        _bulk(conn, VarianteValor.__table__, _valores(rng, total_variantes))
+        _bulk(
+            conn,
+            Empleado.__table__,
+            [
+                {
+                    "idempleado": 1,
+                    "nombre": "Bench",
+                    "apellido": None,
+                    "dni": "00000000",
+                    "rol": "admin",
+                    "telefono": None,
+                    "email": None,
+                    "fechaingreso": ahora.date(),
+                    "estado": True,
+                },
+            ],
+        )
+        password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt(bcrypt_rounds))
+        _bulk(
+            conn,
+            Usuario.__table__,
+            [
+                {
+                    "idusuario": 1,
+                    "username": BENCH_USERNAME,
+                    "password_hash": password_hash.decode(),
+                    "email": None,
+                    "dni_empleado": "00000000",
+                    "rol": "admin",
+                    "activo": True,
+                    "ultimo_login": None,
+                    "fecha_creacion": ahora,
+                },
+            ],
+        )
+        _bulk(conn, MovimientoStock.__table__, _movimientos(rng, volumes, total_variantes, ahora))
+        conn.execute(insert(SyncVersion).values(id=1, version=0))
+        _reset_sequences(conn)
+
+    with Session(engine) as session:
+        recalcular_saldos(session)
+        session.commit()
+
+    return {
+        "categorias": volumes.categorias,
+        "proveedores": volumes.proveedores,
+        "productos": volumes.productos,
+        "variantes": total_variantes,
+        "movimientos": volumes.movimientos,
+        "codigos_barras": [f"779{rng.randint(1, total_variantes):010d}" for _ in range(100)],
+        "usuario": {"username": BENCH_USERNAME, "password": BENCH_PASSWORD},
+    }
+
+
+def describe(engine: Engine, *, seed_value: int = 1234) -> dict:
+    """Summarize an already seeded database in the same shape :func:`seed` returns."""
+
+    rng = random.Random(seed_value)
+    with Session(engine) as session:
+        counts = {
+            "categorias": session.scalar(select(func.count()).select_from(Categoria)),
+            "proveedores": session.scalar(select(func.count()).select_from(Proveedor)),
+            "productos": session.scalar(select(func.count()).select_from(Producto)),
+            "variantes": session.scalar(select(func.max(ProductoVariante.idvariante))) or 1,
+            "movimientos": session.scalar(select(func.count()).select_from(MovimientoStock)),
+        }
+        codigos = session.scalars(
+            select(ProductoVariante.codigo_barras)
+            .where(ProductoVariante.codigo_barras.is_not(None))
+            .limit(1000)
+        ).all()
+    return {
+        **counts,
+        "codigos_barras": rng.sample(codigos, min(len(codigos), 100)),
+        "usuario": {"username": BENCH_USERNAME, "password": BENCH_PASSWORD},
+    }
+
+
+def _valores(rng: random.Random, total_variantes: int) -> Iterator[dict]:
+    for idvariante in range(1, total_variantes + 1):
+        color = rng.randrange(len(COLORES))
+        maceta = rng.randrange(len(MACETAS))
+        yield {
+            "idvariante": idvariante,
+            "idatributo": 1,
+            "valor_texto": COLORES[color],
+            "valor_numero": None,
+            "valor_booleano": None,
+            "idopcion": color + 1,
+        }
+        yield {
+            "idvariante": idvariante,
+            "idatributo": 2,
+            "valor_texto": MACETAS[maceta],
+            "valor_numero": None,
+            "valor_booleano": None,
+            "idopcion": len(COLORES) + maceta + 1,
+        }
+
+
+def _movimientos(
+    rng: random.Random, volumes: Volumes, total_variantes: int, ahora: datetime
+) -> Iterator[dict]:
+    inicio = ahora - timedelta(days=volumes.dias_historial)
+    paso = timedelta(days=volumes.dias_historial) / max(volumes.movimientos, 1)
+    for i in range(1, volumes.movimientos + 1):
+        tipo = rng.choices(("ENTRADA", "SALIDA", "AJUSTE"), weights=(3, 6, 1))[0]
+        yield {
+            "idmovimiento": i,
+            "idvariante": rng.randint(1, total_variantes),
+            "tipo": tipo,
+            "cantidad": rng.randint(1, 20),
+            "referencia_id": None,
+            "referencia_tipo": None,
+            "descripcion": None,
+            "idempleado": 1,
+            "fecha": inicio + paso * i,
+        }
+
+
+def _bulk(conn, table: Table, rows: Iterable[dict]) -> None:
+    """Insert ``rows`` into ``table`` in chunks, using COPY on Postgres."""
+
+    if conn.dialect.name == "postgresql":
+        _copy(conn, table, rows)
+        return
+
+    chunk: list[dict] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            conn.execute(insert(table), chunk)
+            chunk = []
+    if chunk:
+        conn.execute(insert(table), chunk)
+
+
+def _copy(conn, table: Table, rows: Iterable[dict]) -> None:
+    columns = [column.name for column in table.columns]
+    cursor = conn.connection.driver_connection.cursor()
+    with cursor.copy(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row([row.get(column) for column in columns])
+
+
+def _reset_sequences(conn) -> None:
+    if conn.dialect.name != "postgresql":
+        return
+    for table in Base.metadata.sorted_tables:
+        pk = list(table.primary_key.columns)
+        if len(pk) != 1 or not pk[0].autoincrement:
+            continue
+        column = pk[0].name
+        conn.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', '{column}'), "
+                f"COALESCE((SELECT MAX({column}) FROM {table.name}), 0) + 1, false)"
+            )
+        )
@@ -0,0 +1,257 @@
+"""Run the API benchmark scenarios and save the results as JSON.
+
+Example::
+
+    python -m benchmarks.run --database-url sqlite:///bench.db --productos 1000 \\
+        --movimientos 10000 --output benchmarks/results/base.json
+
+    python -m benchmarks.run --database-url postgresql+psycopg://... --skip-seed \\
+        --compare benchmarks/results/base.json
+
+Requests go through Flask's test client, so the numbers cover the
+application and the database but not the network or the WSGI server.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import create_engine
+
+from .dataset import Volumes, describe, seed
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("BCRYPT_ROUNDS", str(args.bcrypt_rounds))
+
+    volumes = Volumes(
+        categorias=args.categorias,
+        productos=args.productos,
+        variantes_por_producto=args.variantes_por_producto,
+        movimientos=args.movimientos,
+    )
+    if args.skip_seed:
+        dataset = describe(create_engine(args.database_url), seed_value=args.seed)
+    else:
+        started = time.perf_counter()
+        dataset = seed(
+            create_engine(args.database_url),
+            volumes,
+            seed_value=args.seed,
+            bcrypt_rounds=args.bcrypt_rounds,
+        )
+        dataset["segundos_seed"] = round(time.perf_counter() - started, 3)
+        print(f"Dataset generado en {dataset['segundos_seed']}s")
+
+    from src.API.app import create_app
+
+    app = create_app(interactive=False)
+    scenarios = _scenarios(app, dataset, args.seed)
+    selected = args.escenario or list(scenarios)
+
+    results = {}
+    for name in selected:
+        iterations = args.login_requests if name == "login" else args.requests
+        results[name] = _measure(app, scenarios[name], iterations, args.concurrency, args.warmup)
+        _print_result(name, results[name])
+
+    report = {
+        "meta": {
+            "fecha": datetime.utcnow().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "dialecto": create_engine(args.database_url).dialect.name,
+            "concurrencia": args.concurrency,
+            "volumenes": {
+                key: value for key, value in dataset.items() if isinstance(value, (int, float))
+            },
+        },
+        "resultados": results,
+    }
+
+    output = (
+        Path(args.output) if args.output else RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Resultados guardados en {output}")
+
+    if args.compare:
+        return _compare(
+            json.loads(Path(args.compare).read_text(encoding="utf-8")), report, args.tolerance
+        )
+    return 0
+
+
+def _scenarios(app, dataset: dict, seed_value: int) -> dict[str, Callable]:
+    """Build one callable per scenario; each takes a test client and issues one request."""
+
+    from src.API.cache import response_cache
+
+    rng = random.Random(seed_value)
+    variantes = max(int(dataset.get("variantes", 1)), 1)
+    codigos = dataset.get("codigos_barras") or ["7790000000001"]
+    usuario = dataset["usuario"]
+
+    def health(client):
+        return client.get("/api/health")
+
+    def list_productos(client):
+        response_cache.clear()
+        return client.get("/api/productos")
+
+    def list_productos_cache(client):
+        return client.get("/api/productos")
+
+    def lookup_variante(client):
+        return client.get(f"/api/variantes/lookup?codigo={rng.choice(codigos)}")
+
+    def registrar_movimiento(client):
+        return client.post(
+            "/api/stock/movimientos",
+            json={"idvariante": rng.randint(1, variantes), "tipo": "ENTRADA", "cantidad": 1},
+        )
+
+    def login(client):
+        return client.post("/api/auth/login", json=usuario)
+
+    return {
+        "health": health,
+        "list_productos": list_productos,
+        "list_productos_cache": list_productos_cache,
+        "lookup_variante": lookup_variante,
+        "registrar_movimiento": registrar_movimiento,
+        "login": login,
+    }
+
+
+def _measure(app, scenario: Callable, iterations: int, concurrency: int, warmup: int) -> dict:
+    warm_client = app.test_client()
+    for _ in range(warmup):
+        scenario(warm_client)
+
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    per_thread = max(iterations // concurrency, 1)
+
+    def worker():
+        nonlocal errors
+        client = app.test_client()
+        local: list[float] = []
+        local_errors = 0
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            response = scenario(client)
+            local.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return _summary(latencies, elapsed, errors)
+
+
+def _summary(latencies: list[float], elapsed: float, errors: int) -> dict:
+    ms = sorted(value * 1000 for value in latencies)
+    cuts = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    return {
+        "n": len(ms),
+        "errores": errors,
+        "p50_ms": round(cuts[49], 3),
+        "p90_ms": round(cuts[89], 3),
+        "p99_ms": round(cuts[98], 3),
+        "max_ms": round(ms[-1], 3),
+        "media_ms": round(statistics.fmean(ms), 3),
+        "throughput_rps": round(len(ms) / elapsed, 1) if elapsed else None,
+    }
+
+
+def _print_result(name: str, result: dict) -> None:
+    print(
+        f"{name:<24} n={result['n']:<6} p50={result['p50_ms']:>9.3f}ms "
+        f"p90={result['p90_ms']:>9.3f}ms p99={result['p99_ms']:>9.3f}ms "
+        f"rps={result['throughput_rps']} errores={result['errores']}"
+    )
+
+
+def _compare(previous: dict, current: dict, tolerance: float) -> int:
+    """Print p50/p99 ratios against ``previous``; return 1 if any regressed."""
+
+    regressed = False
+    for name, result in current["resultados"].items():
+        before = previous.get("resultados", {}).get(name)
+        if not before:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if not before[metric]:
+                continue
+            ratio = result[metric] / before[metric]
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "  <-- regresion"
+                regressed = True
+            print(
+                f"{name:<24} {metric} {before[metric]:>9.3f} -> "
+                f"{result[metric]:>9.3f} (x{ratio:.2f}){flag}"
+            )
+    return 1 if regressed else 0
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default="sqlite:///bench.db")
+    parser.add_argument("--skip-seed", action="store_true", help="Reutiliza los datos existentes.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--categorias", type=int, default=20)
+    parser.add_argument("--productos", type=int, default=1_000)
+    parser.add_argument("--variantes-por-producto", type=int, default=3)
+    parser.add_argument("--movimientos", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--login-requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--escenario", action="append", help="Solo ejecuta estos escenarios.")
+    parser.add_argument("--output")
+    parser.add_argument("--compare", help="JSON de una corrida previa para comparar.")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
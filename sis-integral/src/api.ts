@@ -8,6 +8,8 @@ export interface LoginResponse {
     rol: string | null;
     email: string | null;
   };
+  token: string;
+  expires_in: number;
 }
 
 class ApiError extends Error {
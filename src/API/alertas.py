@@ -0,0 +1,200 @@
+"""Low-stock alerts maintained by the stock write path.
+
+:func:`evaluar_alertas` runs inside every transaction that changes balances
+and re-checks only the variants it touched, so ``stock_alertas`` always
+holds exactly the active variants at or below their ``stock_minimo`` and
+reading it never scans the catalog. Committed changes are also fanned out
+to :data:`alertas_feed` for the server-sent-events stream.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import Select, delete, func, select
+from sqlalchemy.orm import Session
+
+from .db import tabla_instalada, upsert_insert
+from .invalidation import Changes, mark_changed, subscribe
+from .models import Producto, ProductoVariante, StockAlerta, StockVariante
+
+UPSERT_CHUNK = 1000
+AYUDA_INSTALAR = "corré `flask stock recalcular` para activar las alertas de stock"
+
+
+def evaluar_alertas(session: Session, ids: Iterable[int] | None) -> set[int]:
+    """Re-check ``ids`` (every variant when ``None``) and sync ``stock_alertas``.
+
+    Returns the variants whose alert was raised, cleared or updated. Does
+    nothing until ``stock_alertas`` exists, so stock writes keep working on
+    databases that have not run ``flask stock recalcular`` yet.
+    """
+
+    if not tabla_instalada(session, StockAlerta, AYUDA_INSTALAR):
+        return set()
+    if ids is not None:
+        ids = sorted(set(ids))
+        if not ids:
+            return set()
+
+    minimo = func.coalesce(ProductoVariante.stock_minimo, 0)
+    cantidad = func.coalesce(StockVariante.cantidad, 0)
+    query = (
+        select(
+            ProductoVariante.idvariante,
+            ProductoVariante.estado,
+            minimo.label("stock_minimo"),
+            cantidad.label("cantidad"),
+            StockAlerta.cantidad.label("alerta_cantidad"),
+            StockAlerta.stock_minimo.label("alerta_minimo"),
+        )
+        .join(StockVariante, StockVariante.idvariante == ProductoVariante.idvariante, isouter=True)
+        .join(StockAlerta, StockAlerta.idvariante == ProductoVariante.idvariante, isouter=True)
+    )
+    if ids is not None:
+        query = query.where(ProductoVariante.idvariante.in_(ids))
+
+    altas: list[dict] = []
+    bajas: list[int] = []
+    for row in session.execute(query):
+        en_alerta = row.alerta_cantidad is not None
+        if row.estado and row.cantidad <= row.stock_minimo:
+            if (row.alerta_cantidad, row.alerta_minimo) != (row.cantidad, row.stock_minimo):
+                altas.append(
+                    {
+                        "idvariante": row.idvariante,
+                        "cantidad": row.cantidad,
+                        "stock_minimo": row.stock_minimo,
+                    }
+                )
+        elif en_alerta:
+            bajas.append(row.idvariante)
+
+    now = datetime.utcnow()
+    for start in range(0, len(altas), UPSERT_CHUNK):
+        stmt = upsert_insert(session, StockAlerta).values(
+            [
+                {**alta, "fecha_alta": now, "fecha_actualizacion": now}
+                for alta in altas[start : start + UPSERT_CHUNK]
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StockAlerta.idvariante],
+            set_={
+                "cantidad": stmt.excluded.cantidad,
+                "stock_minimo": stmt.excluded.stock_minimo,
+                "fecha_actualizacion": stmt.excluded.fecha_actualizacion,
+            },
+        )
+        session.execute(stmt)
+    for start in range(0, len(bajas), UPSERT_CHUNK):
+        session.execute(
+            delete(StockAlerta).where(
+                StockAlerta.idvariante.in_(bajas[start : start + UPSERT_CHUNK])
+            )
+        )
+
+    cambios = {alta["idvariante"] for alta in altas} | set(bajas)
+    if cambios:
+        mark_changed(session, StockAlerta.__tablename__, cambios)
+    return cambios
+
+
+def alertas_query(ids: Iterable[int] | None = None) -> Select:
+    """Current alerts with product data, the largest shortfall first."""
+
+    query = (
+        select(
+            StockAlerta,
+            ProductoVariante.sku,
+            ProductoVariante.codigo_barras,
+            Producto.idproducto,
+            Producto.nombre,
+        )
+        .join(ProductoVariante, ProductoVariante.idvariante == StockAlerta.idvariante)
+        .join(Producto, Producto.idproducto == ProductoVariante.idproducto)
+    )
+    if ids is not None:
+        query = query.where(StockAlerta.idvariante.in_(list(ids)))
+    return query.order_by(StockAlerta.cantidad - StockAlerta.stock_minimo, StockAlerta.idvariante)
+
+
+def serialize_alerta(row) -> dict:
+    alerta = row.StockAlerta
+    return {
+        "idvariante": alerta.idvariante,
+        "idproducto": row.idproducto,
+        "producto": row.nombre,
+        "sku": row.sku,
+        "codigo_barras": row.codigo_barras,
+        "cantidad": alerta.cantidad,
+        "stock_minimo": alerta.stock_minimo,
+        "faltante": alerta.stock_minimo - alerta.cantidad,
+        "desde": alerta.fecha_alta.isoformat() if alerta.fecha_alta else None,
+    }
+
+
+class AlertasFeed:
+    """Fans committed alert changes out to the connected SSE clients.
+
+    Each client gets a bounded queue of changed variant ids; a client that
+    falls too far behind is sent a ``resync`` instead of the backlog.
+    """
+
+    def __init__(self, max_clientes: int = 32, max_pendientes: int = 1000) -> None:
+        self.max_clientes = max_clientes
+        self.max_pendientes = max_pendientes
+        self._lock = threading.Lock()
+        self._clientes: set[queue.Queue] = set()
+
+    def conectar(self) -> queue.Queue | None:
+        with self._lock:
+            if len(self._clientes) >= self.max_clientes:
+                return None
+            cola: queue.Queue = queue.Queue(self.max_pendientes)
+            self._clientes.add(cola)
+            return cola
+
+    def desconectar(self, cola: queue.Queue) -> None:
+        with self._lock:
+            self._clientes.discard(cola)
+
+    def publicar(self, changes: Changes) -> None:
+        ids = changes.get(StockAlerta.__tablename__)
+        if not ids:
+            return
+        with self._lock:
+            clientes = list(self._clientes)
+        for cola in clientes:
+            try:
+                cola.put_nowait(frozenset(ids))
+            except queue.Full:
+                _resync(cola)
+
+    def resincronizar(self) -> None:
+        """Make every client reload the full list (alert changes may be lost)."""
+
+        with self._lock:
+            clientes = list(self._clientes)
+        for cola in clientes:
+            _resync(cola)
+
+
+def _resync(cola: queue.Queue) -> None:
+    """Replace a lagging client's backlog with a single ``None`` (full reload)."""
+
+    try:
+        while True:
+            cola.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        cola.put_nowait(None)
+    except queue.Full:  # pragma: no cover - refilled concurrently; it will resync later
+        pass
+
+
+alertas_feed = AlertasFeed()
+subscribe(alertas_feed.publicar, on_reset=alertas_feed.resincronizar)
@@ -4,24 +4,75 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 from sqlalchemy import select
 
-from src.config.env_utils import ensureDatabaseUrl
-
+from . import sync  # noqa: F401 - registers the change log commit hook
+from .alertas import alertas_feed
+from .cache import response_cache
+from .commands import register_commands
+from .config import load_config
 from .db import get_session, init_db
+from .diario import DiarioNoDisponible, diario_movimientos
+from .encoding import init_encoding
+from .facturas import Empresa, generador_facturas
+from .metricas import init_metricas
+from .pubsub import invalidation_listener
 from .routes import register_blueprints
+from .security import init_security
+
 
+def create_app(interactive: bool | None = None) -> Flask:
+    """Create and configure a Flask application instance.
 
-def create_app() -> Flask:
-    """Create and configure a Flask application instance."""
+    No database connection is opened here; engines are created on first use
+    in each process. ``interactive`` controls whether a missing DATABASE_URL
+    may be asked for on the terminal (by default only when stdin is a TTY).
+    ``flask --app src.API.app`` finds this factory automatically.
+    """
 
     app = Flask(__name__)
-    app.config["DATABASE_URL"] = ensureDatabaseUrl()
-    app.config["JSON_SORT_KEYS"] = False
+    app.config.update(load_config(interactive))
 
     # Enable CORS so the React frontend can call the API during development.
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
     init_db(app)
+    init_metricas(app)
+    init_encoding(app)
+    init_security(app)
+    response_cache.max_entries = app.config["RESPONSE_CACHE_MAX_ENTRIES"]
+    if app.config["DATABASE_REPLICA_URL"]:
+        response_cache.replica_lag = app.config["DB_REPLICA_MAX_LAG_MS"] / 1000
+    invalidation_listener.configure(app.config)
+    alertas_feed.max_clientes = app.config["ALERTAS_SSE_MAX_CLIENTES"]
+    diario_movimientos.directorio = app.config["MOVIMIENTOS_DIARIO_DIR"]
+    diario_movimientos.lote_max = app.config["MOVIMIENTOS_LOTE"]
+    diario_movimientos.demora = app.config["MOVIMIENTOS_DEMORA_MS"] / 1000
+    generador_facturas.directorio = app.config["FACTURAS_DIR"]
+    generador_facturas.workers = app.config["FACTURAS_WORKERS"]
+    generador_facturas.lote = app.config["FACTURAS_LOTE"]
+    generador_facturas.ttl = app.config["FACTURAS_TTL_HORAS"] * 3600
+    generador_facturas.empresa = Empresa(
+        app.config["FACTURA_EMPRESA"],
+        app.config["FACTURA_CUIT"],
+        app.config["FACTURA_DIRECCION"],
+        app.config["FACTURA_PUNTO_VENTA"],
+    )
+    # Jobs of a previous run that died mid-way would stay "en_curso" forever.
+    generador_facturas.limpiar()
     register_blueprints(app)
+    register_commands(app)
+
+    @app.before_request
+    def start_background_threads():
+        # Started here rather than above so each forked worker gets its own.
+        invalidation_listener.start()
+        if app.config["MOVIMIENTOS_DIFERIDOS"]:
+            # Replays journals left by a crash before any stock is read. A
+            # failure (database down, table missing) must not fail every
+            # request: the deferred POST retries and answers 503 itself.
+            try:
+                diario_movimientos.iniciar()
+            except DiarioNoDisponible:
+                app.logger.warning("No se pudo abrir el diario de movimientos", exc_info=True)
 
     @app.get("/api/health")
     def healthcheck():
@@ -43,10 +94,7 @@ def create_app() -> Flask:
 
     @app.get("/")
     def index():
-        return jsonify({"name": "Vivero API", "endpoints": ["/api/health", "..."]})
+        return jsonify({"name": "Vivero API", "endpoints": ["/api/health", "/api/metrics", "..."]})
 
     return app
 
-
-# Allow "flask --app src.API.app run" usage by exposing a module-level app.
-app = create_app()
@@ -0,0 +1,279 @@
+"""Asyncio serving mode for the read-only endpoints.
+
+Run it next to the Flask app (which keeps every write endpoint) with any ASGI
+server, e.g.::
+
+    uvicorn src.API.asgi:app --workers 2
+
+It serves ``/api/health``, ``/api/metrics``, ``/api/categorias``,
+``/api/productos`` and ``/api/variantes/lookup`` with the same models,
+queries and JSON shapes as the Flask views, but on SQLAlchemy's async engine
+(psycopg async on Postgres), so one process can keep hundreds of slow
+clients waiting on I/O at once.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Awaitable, Callable
+from urllib.parse import parse_qsl
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+
+from .catalog import (
+    STREAM_PAGE_SIZE,
+    categorias_query,
+    decode_cursor,
+    filtros_productos,
+    page_size,
+    pagina_productos_async,
+    parse_bool,
+    serialize_categoria,
+)
+from .config import load_config
+from .db import engine_options
+from .encoding import dumps_bytes
+from .invalidation import subscribe
+from .lookup import VarianteLookup
+from .metricas import CONTENT_TYPE, SIN_RUTA, exponer, instrumentacion
+from .models import StockVariante
+from .pubsub import invalidation_listener
+
+logger = logging.getLogger(__name__)
+
+# Sync driver name -> asyncio driver for the same database.
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+psycopg",
+    "postgresql": "postgresql+psycopg",
+    "postgresql+psycopg": "postgresql+psycopg",
+    "postgresql+psycopg2": "postgresql+psycopg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    if driver is None:
+        raise RuntimeError(f"No hay driver asyncio para {parsed.drivername}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class AsyncReadApp:
+    """Minimal ASGI application; engines are created at lifespan startup."""
+
+    def __init__(self, config: dict | None = None) -> None:
+        self._config = config
+        self._engine: AsyncEngine | None = None
+        self._lookup_engine: AsyncEngine | None = None
+        self._sessions: async_sessionmaker[AsyncSession] | None = None
+        self._lookup_sessions: async_sessionmaker[AsyncSession] | None = None
+        self.lookup: VarianteLookup | None = None
+        self._routes: dict[str, Callable[[dict], Awaitable]] = {
+            "/api/health": self.health,
+            "/api/metrics": self.metrics,
+            "/api/categorias": self.categorias,
+            "/api/productos": self.productos,
+            "/api/variantes/lookup": self.lookup_variante,
+        }
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        await self._startup()
+        ruta = scope["path"] if scope["path"] in self._routes else SIN_RUTA
+        solicitud = instrumentacion.iniciar(ruta)
+        status = 500
+
+        async def enviar(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self._dispatch(scope, enviar)
+        finally:
+            instrumentacion.terminar(solicitud, scope["method"], status)
+
+    async def _dispatch(self, scope, send) -> None:
+        if scope["method"] not in ("GET", "HEAD") or scope["path"] not in self._routes:
+            await _send_json(send, 404, {"error": "Not found"})
+            return
+
+        args = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+        try:
+            result = await self._routes[scope["path"]](args)
+        except HTTPError as exc:
+            await _send_json(send, exc.status, {"error": exc.message})
+            return
+        except Exception:  # pragma: no cover - defensive logging
+            logger.exception("Error atendiendo %s", scope["path"])
+            await _send_json(send, 500, {"error": "Error interno"})
+            return
+
+        if callable(result):
+            await result(send)
+        else:
+            await _send_json(send, 200, result)
+
+    async def health(self, args: dict):
+        try:
+            async with self._sessions() as session:
+                await session.execute(select(1))
+        except Exception:  # pragma: no cover - defensive logging
+            logger.exception("Database health check failed")
+            raise HTTPError(500, "unreachable") from None
+        return {"status": "ok", "database": "ok"}
+
+    async def metrics(self, args: dict):
+        engines = {"primary": self._lookup_engine, "replica": self._engine}
+        if self._engine is self._lookup_engine:
+            del engines["replica"]
+        body = exponer({rol: engine.sync_engine for rol, engine in engines.items()})
+        return lambda send: _send_text(send, body.encode("utf-8"))
+
+    async def categorias(self, args: dict):
+        async with self._sessions() as session:
+            categorias = (await session.scalars(categorias_query())).all()
+        return [serialize_categoria(cat) for cat in categorias]
+
+    async def productos(self, args: dict):
+        try:
+            filtros = filtros_productos(args)
+            cursor = decode_cursor(args.get("cursor"))
+            limit = page_size(args.get("limit"))
+        except ValueError as exc:
+            raise HTTPError(400, str(exc)) from None
+
+        if parse_bool(args.get("stream")):
+            return lambda send: self._stream_productos(send, filtros, cursor)
+
+        async with self._sessions() as session:
+            productos, next_cursor = await pagina_productos_async(session, filtros, cursor, limit)
+        return {"items": productos, "next_cursor": next_cursor}
+
+    async def lookup_variante(self, args: dict):
+        codigo = (args.get("codigo") or "").strip()
+        if not codigo:
+            raise HTTPError(400, "codigo es obligatorio")
+
+        async with self._lookup_sessions() as session:
+            entry = await self.lookup.get_async(session, codigo)
+            if entry is None:
+                raise HTTPError(404, "Variante no encontrada")
+            # This process sees no writes, so stock is always read live.
+            stock = await session.scalar(
+                select(StockVariante.cantidad).where(StockVariante.idvariante == entry["id"])
+            )
+        return {**entry, "stock_actual": int(stock or 0)}
+
+    async def _stream_productos(self, send, filtros: list, cursor) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": _headers("application/json"),
+            }
+        )
+        await send({"type": "http.response.body", "body": b"[", "more_body": True})
+        first = True
+        while True:
+            async with self._sessions() as session:
+                productos, next_cursor = await pagina_productos_async(
+                    session, filtros, cursor, STREAM_PAGE_SIZE
+                )
+            if productos:
+                chunk = b",".join(dumps_bytes(producto) for producto in productos)
+                body = chunk if first else b"," + chunk
+                first = False
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+            if next_cursor is None:
+                break
+            cursor = decode_cursor(next_cursor)
+        await send({"type": "http.response.body", "body": b"]"})
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self._startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self._shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _startup(self) -> None:
+        if self._engine is not None:
+            return
+        config = self._config or load_config(interactive=False)
+        primary_url = config["DATABASE_URL"]
+        read_url = config.get("DATABASE_REPLICA_URL") or primary_url
+
+        self._engine = create_async_engine(
+            async_url(read_url),
+            **engine_options(config, read_url, read_only=read_url != primary_url),
+        )
+        self._lookup_engine = (
+            create_async_engine(async_url(primary_url), **engine_options(config, primary_url))
+            if read_url != primary_url
+            else self._engine
+        )
+        self._sessions = async_sessionmaker(self._engine, expire_on_commit=False)
+        self._lookup_sessions = async_sessionmaker(self._lookup_engine, expire_on_commit=False)
+        self.lookup = VarianteLookup(max_age=config.get("ASYNC_LOOKUP_MAX_AGE", 60))
+        if invalidation_listener.configure(config):
+            # Writes made by the Flask workers now reach the index directly.
+            self.lookup.max_age = None
+            subscribe(self.lookup.invalidate, on_reset=self.lookup.clear)
+            invalidation_listener.start()
+
+    async def _shutdown(self) -> None:
+        for engine in {self._engine, self._lookup_engine}:
+            if engine is not None:
+                await engine.dispose()
+        self._engine = self._lookup_engine = None
+
+
+def _headers(content_type: str) -> list[tuple[bytes, bytes]]:
+    # Mirrors the Flask app's CORS policy for /api/*.
+    return [
+        (b"content-type", content_type.encode("latin-1")),
+        (b"access-control-allow-origin", b"*"),
+    ]
+
+
+async def _send_text(send, body: bytes) -> None:
+    headers = _headers(CONTENT_TYPE)
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status: int, payload) -> None:
+    body = dumps_bytes(payload)
+    headers = _headers("application/json")
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+app = AsyncReadApp()
@@ -0,0 +1,391 @@
+"""In-process typeahead index over product names, descriptions and SKUs.
+
+Text is folded to lowercase ASCII (``"Jazmín"`` matches ``"jazmin"``) and
+split into tokens. A sorted vocabulary answers prefix queries with two
+bisects, and a trigram index over the vocabulary catches typos. Commits
+touching products or variants only mark those products stale, like the
+lookup and facet indexes, so a keystroke never waits on the database in
+the steady state.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .db import use_primary
+from .invalidation import Changes, subscribe
+from .models import Producto, ProductoVariante
+
+# Field weights: a hit in the name outranks one in the SKU or description.
+PESO_NOMBRE = 3.0
+PESO_SKU = 2.0
+PESO_DESCRIPCION = 1.0
+
+# Match quality multipliers.
+EXACTO = 1.0
+PREFIJO = 0.8
+DIFUSO = 0.6
+
+MIN_SIMILITUD = 0.35
+# Bounds the work per keystroke for very short prefixes ("a", "ro").
+MAX_EXPANSION = 2000
+
+STOPWORDS = {"de", "del", "la", "las", "el", "los", "y", "con", "en", "para", "por", "un", "una"}
+
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+
+def normalizar(texto: str | None) -> str:
+    """Lowercase ``texto`` and strip accents and punctuation."""
+
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return _NO_ALFANUMERICO.sub(" ", sin_acentos).strip()
+
+
+def tokens(texto: str | None) -> list[str]:
+    return normalizar(texto).split()
+
+
+def trigramas(token: str) -> set[str]:
+    padded = f"  {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class _Indice(NamedTuple):
+    docs: dict[int, dict]
+    pesos: dict[int, dict[str, float]]
+    postings: dict[str, dict[int, float]]
+    vocabulario: list[str]
+    trigramas: dict[str, frozenset[str]]
+    producto_de: dict[int, int]
+
+
+class _Recarga(NamedTuple):
+    """What one refresh reindexes: everything (``ids is None``) or some products."""
+
+    generacion: int
+    ids: set[int] | None
+    productos: set[int]
+    variantes: set[int]
+
+
+class BuscadorProductos:
+    """Product search index; see the module docstring.
+
+    Refreshes follow :class:`~.lookup.VarianteLookup`: the stale marks are
+    taken under a short lock, the queries run without it and the new index
+    is published with a single assignment. A failed refresh puts its marks
+    back so the next keystroke retries.
+    """
+
+    def __init__(self) -> None:
+        # Guards the stale sets; never held while querying.
+        self._lock = threading.Lock()
+        # One refresh at a time; held while querying.
+        self._recargando = threading.Lock()
+        self._generacion = 0
+        self._cargada: int | None = None
+        self._indice = _Indice({}, {}, {}, [], {}, {})
+        self._stale_productos: set[int] = set()
+        self._stale_variantes: set[int] = set()
+
+    def buscar(self, session: Session, q: str, limit: int) -> list[dict]:
+        """Active products matching every word of ``q``, best first."""
+
+        self._ensure(session)
+        indice = self._indice
+        palabras = tokens(q)
+        if not palabras:
+            return []
+
+        puntajes: dict[int, float] | None = None
+        for palabra in palabras:
+            coincidencias = _coincidencias(indice, palabra)
+            if puntajes is None:
+                puntajes = coincidencias
+            else:
+                puntajes = {
+                    idproducto: puntaje + coincidencias[idproducto]
+                    for idproducto, puntaje in puntajes.items()
+                    if idproducto in coincidencias
+                }
+            if not puntajes:
+                return []
+
+        docs = indice.docs
+        ranking = sorted(
+            (idproducto for idproducto in puntajes if idproducto in docs),
+            key=lambda idproducto: (-puntajes[idproducto], docs[idproducto]["nombre"]),
+        )
+        return [
+            {**docs[idproducto], "puntaje": round(puntajes[idproducto], 3)}
+            for idproducto in ranking[:limit]
+        ]
+
+    def invalidate(self, changes: Changes) -> None:
+        with self._lock:
+            self._stale_productos.update(changes.get("productos", ()))
+            self._stale_variantes.update(changes.get("producto_variantes", ()))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generacion += 1
+
+    def _ensure(self, session: Session) -> None:
+        if self._cargada == self._generacion and not (
+            self._stale_productos or self._stale_variantes
+        ):
+            return
+        with self._recargando:
+            recarga = self._pendiente()
+            if recarga is None:
+                return
+            try:
+                ids, variantes, productos = self._leer(session, recarga)
+            except BaseException:
+                self._devolver(recarga)
+                raise
+            self._aplicar(recarga, ids, variantes, productos)
+
+    def _pendiente(self) -> _Recarga | None:
+        """Take the stale marks for one refresh (``None`` when already fresh)."""
+
+        with self._lock:
+            if self._cargada != self._generacion:
+                self._stale_productos.clear()
+                self._stale_variantes.clear()
+                return _Recarga(self._generacion, None, set(), set())
+            if not self._stale_productos and not self._stale_variantes:
+                return None
+            productos = set(self._stale_productos)
+            variantes = set(self._stale_variantes)
+            self._stale_productos.clear()
+            self._stale_variantes.clear()
+        producto_de = self._indice.producto_de
+        ids = set(productos)
+        ids.update(producto_de[idvariante] for idvariante in variantes if idvariante in producto_de)
+        return _Recarga(self._generacion, ids, productos, variantes)
+
+    def _devolver(self, recarga: _Recarga) -> None:
+        """Put back the marks of a refresh that failed, so the next query retries."""
+
+        if recarga.ids is None:
+            return
+        with self._lock:
+            self._stale_productos.update(recarga.productos)
+            self._stale_variantes.update(recarga.variantes)
+
+    def _leer(self, session: Session, recarga: _Recarga) -> tuple[set[int] | None, list, list]:
+        with use_primary(session):
+            ids = recarga.ids
+            if ids is not None:
+                nuevas = recarga.variantes - self._indice.producto_de.keys()
+                if nuevas:
+                    ids = ids | set(
+                        session.scalars(
+                            select(ProductoVariante.idproducto).where(
+                                ProductoVariante.idvariante.in_(nuevas)
+                            )
+                        )
+                    )
+                if not ids:
+                    return ids, [], []
+
+            productos_query = select(
+                Producto.idproducto,
+                Producto.nombre,
+                Producto.descripcion,
+                Producto.precioventa,
+                Producto.idcategoria,
+                Producto.estado,
+            )
+            variantes_query = select(
+                ProductoVariante.idvariante, ProductoVariante.idproducto, ProductoVariante.sku
+            )
+            if ids is not None:
+                productos_query = productos_query.where(Producto.idproducto.in_(ids))
+                variantes_query = variantes_query.where(ProductoVariante.idproducto.in_(ids))
+            variantes = session.execute(variantes_query).all()
+            productos = session.execute(productos_query).all()
+        return ids, variantes, productos
+
+    def _aplicar(
+        self, recarga: _Recarga, ids: set[int] | None, variantes: list, productos: list
+    ) -> None:
+        skus: dict[int, list[str]] = defaultdict(list)
+        producto_de: dict[int, int] = {}
+        for idvariante, idproducto, sku in variantes:
+            producto_de[idvariante] = idproducto
+            if sku:
+                skus[idproducto].append(sku)
+
+        docs: dict[int, dict] = {}
+        pesos: dict[int, dict[str, float]] = {}
+        for row in productos:
+            if not row.estado:
+                continue
+            docs[row.idproducto] = {
+                "id": row.idproducto,
+                "nombre": row.nombre,
+                "precio_venta": float(row.precioventa or 0),
+                "categoria_id": row.idcategoria,
+                "skus": skus.get(row.idproducto, []),
+            }
+            pesos[row.idproducto] = _pesos_producto(
+                row.nombre, row.descripcion, skus.get(row.idproducto, ())
+            )
+
+        if ids is None:
+            self._indice = _reemplazar(docs, pesos, producto_de)
+            self._cargada = recarga.generacion
+        elif ids:
+            self._indice = _actualizar(self._indice, ids, docs, pesos, producto_de)
+
+
+def _coincidencias(indice: _Indice, palabra: str) -> dict[int, float]:
+    """Best score per product for one query word (exact, prefix or fuzzy)."""
+
+    calidad: dict[str, float] = {}
+    vocabulario = indice.vocabulario
+    inicio = bisect_left(vocabulario, palabra)
+    fin = bisect_left(vocabulario, palabra + "\x7f")
+    for token in vocabulario[inicio : min(fin, inicio + MAX_EXPANSION)]:
+        calidad[token] = EXACTO if token == palabra else PREFIJO
+
+    if len(palabra) >= 3:
+        buscados = trigramas(palabra)
+        comunes: Counter[str] = Counter()
+        for gram in buscados:
+            comunes.update(indice.trigramas.get(gram, ()))
+        for token, compartidos in comunes.items():
+            if token in calidad:
+                continue
+            # A token of n characters has n + 1 padded trigrams.
+            similitud = compartidos / (len(buscados) + len(token) + 1 - compartidos)
+            if similitud >= MIN_SIMILITUD:
+                calidad[token] = DIFUSO * similitud
+
+    resultado: dict[int, float] = {}
+    postings = indice.postings
+    for token, factor in calidad.items():
+        for idproducto, peso in postings.get(token, {}).items():
+            puntaje = peso * factor
+            if puntaje > resultado.get(idproducto, 0.0):
+                resultado[idproducto] = puntaje
+    return resultado
+
+
+def _reemplazar(docs: dict, pesos: dict, producto_de: dict[int, int]) -> _Indice:
+    postings: dict[str, dict[int, float]] = defaultdict(dict)
+    for idproducto, por_token in pesos.items():
+        for token, peso in por_token.items():
+            postings[token][idproducto] = peso
+    grams: dict[str, set[str]] = defaultdict(set)
+    for token in postings:
+        for gram in trigramas(token):
+            grams[gram].add(token)
+
+    return _Indice(
+        docs,
+        pesos,
+        dict(postings),
+        sorted(postings),
+        {gram: frozenset(tokens_) for gram, tokens_ in grams.items()},
+        producto_de,
+    )
+
+
+def _actualizar(
+    anterior: _Indice, ids: set[int], docs: dict, pesos: dict, producto_de: dict[int, int]
+) -> _Indice:
+    """New index with the entries of ``ids`` swapped; ``anterior`` is left untouched."""
+
+    pesos_actuales = dict(anterior.pesos)
+    tocados: set[str] = set()
+    for idproducto in ids:
+        tocados.update(pesos_actuales.pop(idproducto, {}))
+    for por_token in pesos.values():
+        tocados.update(por_token)
+
+    postings = dict(anterior.postings)
+    grams = dict(anterior.trigramas)
+    vocabulario_cambio = False
+    for token in tocados:
+        posting = {
+            idproducto: peso
+            for idproducto, peso in postings.get(token, {}).items()
+            if idproducto not in ids
+        }
+        for idproducto, por_token in pesos.items():
+            if token in por_token:
+                posting[idproducto] = por_token[token]
+
+        if posting:
+            if token not in postings:
+                vocabulario_cambio = True
+                for gram in trigramas(token):
+                    grams[gram] = grams.get(gram, frozenset()) | {token}
+            postings[token] = posting
+        elif token in postings:
+            vocabulario_cambio = True
+            del postings[token]
+            for gram in trigramas(token):
+                restantes = grams.get(gram, frozenset()) - {token}
+                if restantes:
+                    grams[gram] = restantes
+                else:
+                    grams.pop(gram, None)
+
+    pesos_actuales.update(pesos)
+    return _Indice(
+        {
+            **{
+                idproducto: doc
+                for idproducto, doc in anterior.docs.items()
+                if idproducto not in ids
+            },
+            **docs,
+        },
+        pesos_actuales,
+        postings,
+        sorted(postings) if vocabulario_cambio else anterior.vocabulario,
+        grams,
+        {
+            **{
+                idvariante: idproducto
+                for idvariante, idproducto in anterior.producto_de.items()
+                if idproducto not in ids
+            },
+            **producto_de,
+        },
+    )
+
+
+def _pesos_producto(nombre: str | None, descripcion: str | None, skus: Iterable[str]) -> dict:
+    pesos: dict[str, float] = {}
+    campos = [(tokens(nombre), PESO_NOMBRE), (tokens(descripcion), PESO_DESCRIPCION)]
+    for sku in skus:
+        # The whole SKU is indexed too, so "sku 0001" and "sku0001" both hit.
+        partes = tokens(sku)
+        campos.append((partes + ["".join(partes)], PESO_SKU))
+    for palabras, peso in campos:
+        for token in palabras:
+            if peso == PESO_DESCRIPCION and (token in STOPWORDS or len(token) < 2):
+                continue
+            if peso > pesos.get(token, 0.0):
+                pesos[token] = peso
+    return pesos
+
+
+buscador_productos = BuscadorProductos()
+subscribe(buscador_productos.invalidate, on_reset=buscador_productos.clear)
@@ -0,0 +1,161 @@
+"""Version based response cache with ETag / ``If-None-Match`` support."""
+from __future__ import annotations
+
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import NamedTuple
+
+from flask import Response, current_app, make_response, request
+
+from .encoding import compress_response, negotiate_encoding
+from .invalidation import Changes, subscribe
+
+# Cache group -> tables whose writes make the group's responses stale.
+GROUP_TABLES = {
+    "categorias": {"categorias"},
+    "productos": {
+        "productos",
+        "atributos",
+        "atributo_opciones",
+        "producto_variantes",
+        "variante_valores",
+        "movimientos_stock",
+        "stock_variantes",
+    },
+}
+
+
+class _Entry(NamedTuple):
+    version: int
+    body: bytes
+    mimetype: str
+    encoding: str | None
+
+
+class ResponseCache:
+    """Keeps the last rendered body per ``(group, query)`` for each group version.
+
+    Every commit touching one of a group's tables bumps the group version, so
+    ETags change exactly when the data behind them does and stale bodies are
+    never served. Entries are evicted LRU once ``max_entries`` is reached.
+    """
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        # With a read replica, responses rendered this soon after a write may
+        # still reflect the old data, so they are neither stored nor tagged.
+        self.replica_lag = 0.0
+        # Distinguishes ETags issued before a restart, when versions reset.
+        self._generation = secrets.token_hex(4)
+        self._lock = threading.Lock()
+        self._versions: dict[str, int] = {group: 0 for group in GROUP_TABLES}
+        self._changed_at: dict[str, float] = {group: 0.0 for group in GROUP_TABLES}
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+
+    def version(self, group: str) -> int:
+        return self._versions[group]
+
+    def settled(self, group: str) -> bool:
+        return time.monotonic() - self._changed_at[group] >= self.replica_lag
+
+    def etag(self, group: str, key: str, version: int) -> str:
+        digest = hashlib.blake2s(key.encode("utf-8"), digest_size=6).hexdigest()
+        return f"{group}-{self._generation}-{version}-{digest}"
+
+    def get(self, group: str, key: str) -> _Entry | None:
+        with self._lock:
+            entry = self._entries.get((group, key))
+            if entry is None or entry.version != self._versions[group]:
+                return None
+            self._entries.move_to_end((group, key))
+            return entry
+
+    def store(self, group: str, key: str, entry: _Entry) -> None:
+        with self._lock:
+            if entry.version != self._versions[group]:
+                return
+            self._entries[(group, key)] = entry
+            self._entries.move_to_end((group, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, changes: Changes) -> None:
+        tables = set(changes)
+        with self._lock:
+            for group, deps in GROUP_TABLES.items():
+                if deps & tables:
+                    self._versions[group] += 1
+                    self._changed_at[group] = time.monotonic()
+
+    def clear(self) -> None:
+        with self._lock:
+            for group in self._versions:
+                self._versions[group] += 1
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+subscribe(response_cache.invalidate, on_reset=response_cache.clear)
+
+
+def cached_response(group: str):
+    """Serve a GET view from :data:`response_cache` and answer conditional requests.
+
+    The cache key is the query string plus the request's ``Accept`` header
+    and negotiated ``Content-Encoding``; bodies are stored already compressed,
+    so a hit costs no encoding work at all. Only complete ``200`` responses
+    are stored; streamed ones still get an ETag so clients can revalidate them.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            query = request.query_string.decode("latin-1")
+            min_size = current_app.config["COMPRESS_MIN_SIZE"]
+            encoding = negotiate_encoding() if min_size > 0 else None
+            key = f"{request.path}?{query}|{request.accept_mimetypes}|{encoding}"
+            version = response_cache.version(group)
+            etag = response_cache.etag(group, key, version)
+            settled = response_cache.settled(group)
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+                response.headers["Cache-Control"] = "no-cache"
+                return response
+
+            entry = response_cache.get(group, key)
+            if entry is not None:
+                response = Response(entry.body, mimetype=entry.mimetype)
+                if entry.encoding:
+                    response.headers["Content-Encoding"] = entry.encoding
+                response.vary.update(("Accept", "Accept-Encoding"))
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or not settled:
+                    return response
+                if not response.is_streamed:
+                    if min_size > 0:
+                        compress_response(response, min_size)
+                    response_cache.store(
+                        group,
+                        key,
+                        _Entry(
+                            version,
+                            response.get_data(),
+                            response.mimetype,
+                            response.headers.get("Content-Encoding"),
+                        ),
+                    )
+
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,246 @@
+"""Catalog queries shared by the Flask views and the async read app.
+
+Statements are built and rows are shaped here without touching a session,
+so the synchronous and asyncio code paths only differ in how they execute.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from collections import defaultdict
+from typing import TYPE_CHECKING, Iterable
+
+from sqlalchemy import Float, Select, cast, func, select, tuple_
+from sqlalchemy.orm import Session
+
+from .models import Atributo, Categoria, Producto, ProductoVariante, StockVariante, VarianteValor
+from .serialization import serialize_valor
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+STREAM_PAGE_SIZE = 500
+
+
+def categorias_query() -> Select:
+    return select(Categoria).order_by(Categoria.nombre)
+
+
+def serialize_categoria(cat: Categoria) -> dict:
+    return {
+        "id": cat.idcategoria,
+        "nombre": cat.nombre,
+        "slug": cat.slug,
+        "estado": cat.estado,
+    }
+
+
+def filtros_productos(args) -> list:
+    """Translate query-string filters into WHERE clauses; raises ``ValueError``."""
+
+    filtros = []
+    if args.get("categoria"):
+        filtros.append(Producto.idcategoria == parse_int(args["categoria"], "categoria"))
+    if args.get("proveedor"):
+        filtros.append(Producto.idproveedor == parse_int(args["proveedor"], "proveedor"))
+    if args.get("estado"):
+        filtros.append(Producto.estado.is_(parse_bool(args["estado"])))
+    if args.get("con_stock"):
+        con_stock = (
+            select(ProductoVariante.idvariante)
+            .join(StockVariante, StockVariante.idvariante == ProductoVariante.idvariante)
+            .where(
+                ProductoVariante.idproducto == Producto.idproducto,
+                StockVariante.cantidad > 0,
+            )
+            .exists()
+        )
+        filtros.append(con_stock if parse_bool(args["con_stock"]) else ~con_stock)
+    return filtros
+
+
+def pagina_query(filtros: list, cursor: tuple[str, int] | None, limit: int) -> Select:
+    """Keyset page of product ids ordered by ``(nombre, idproducto)``.
+
+    One extra row is requested so the caller can tell whether a next page exists.
+    """
+
+    query = select(Producto.idproducto, Producto.nombre).where(*filtros)
+    if cursor is not None:
+        query = query.where(tuple_(Producto.nombre, Producto.idproducto) > tuple_(*cursor))
+    return query.order_by(Producto.nombre, Producto.idproducto).limit(limit + 1)
+
+
+def split_pagina(page: list, limit: int) -> tuple[list[int], str | None]:
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1].nombre, page[-1].idproducto)
+    return [row.idproducto for row in page], next_cursor
+
+
+def productos_query(producto_ids: list[int]) -> Select:
+    """Flat rows (one per variant) with exactly the columns the payload needs.
+
+    Selecting columns instead of entities skips ORM object construction and
+    the identity map, and prices are cast to floats by the database rather
+    than built as ``Decimal`` and converted per field.
+    """
+
+    return (
+        select(
+            Producto.idproducto,
+            Producto.nombre,
+            Producto.descripcion,
+            precio_float(Producto.precioventa).label("precio_producto"),
+            Producto.idcategoria,
+            Producto.idproveedor,
+            ProductoVariante.idvariante,
+            ProductoVariante.sku,
+            ProductoVariante.codigo_barras,
+            precio_float(ProductoVariante.precio_venta).label("precio_variante"),
+            ProductoVariante.stock_minimo,
+            func.coalesce(StockVariante.cantidad, 0).label("stock"),
+        )
+        .join(ProductoVariante, Producto.variantes, isouter=True)
+        .join(StockVariante, StockVariante.idvariante == ProductoVariante.idvariante, isouter=True)
+        .where(Producto.idproducto.in_(producto_ids))
+        .order_by(Producto.nombre, Producto.idproducto, ProductoVariante.idvariante)
+    )
+
+
+def valores_query(variantes_ids: list[int]) -> Select:
+    return (
+        select(
+            VarianteValor.idvariante,
+            VarianteValor.valor_texto,
+            VarianteValor.valor_numero,
+            VarianteValor.valor_booleano,
+            Atributo.nombre,
+            Atributo.slug,
+        )
+        .join(Atributo, VarianteValor.idatributo == Atributo.idatributo)
+        .where(VarianteValor.idvariante.in_(variantes_ids))
+    )
+
+
+def agrupar_valores(valores_rows: Iterable) -> dict[int, list[dict]]:
+    """Attribute entries per variant id from :func:`valores_query` rows."""
+
+    valores_map: dict[int, list[dict]] = defaultdict(list)
+    for valor in valores_rows:
+        valores_map[valor.idvariante].append(
+            {"atributo": valor.nombre, "slug": valor.slug, "valor": serialize_valor(valor)}
+        )
+    return valores_map
+
+
+def build_productos(rows: Iterable, valores_rows: Iterable) -> list[dict]:
+    valores_map = agrupar_valores(valores_rows)
+    productos: dict[int, dict] = {}
+    for row in rows:
+        prod_entry = productos.get(row.idproducto)
+        if prod_entry is None:
+            prod_entry = productos[row.idproducto] = {
+                "id": row.idproducto,
+                "nombre": row.nombre,
+                "descripcion": row.descripcion,
+                "precio_venta": row.precio_producto,
+                "categoria_id": row.idcategoria,
+                "proveedor_id": row.idproveedor,
+                "variantes": [],
+            }
+        if row.idvariante is not None:
+            prod_entry["variantes"].append(
+                {
+                    "id": row.idvariante,
+                    "sku": row.sku,
+                    "codigo_barras": row.codigo_barras,
+                    "precio_venta": row.precio_variante,
+                    "stock_actual": row.stock,
+                    "stock_minimo": row.stock_minimo,
+                    "atributos": valores_map.get(row.idvariante, []),
+                }
+            )
+
+    return list(productos.values())
+
+
+def precio_float(columna):
+    """``columna`` as a float computed by the database, ``0.0`` when NULL."""
+
+    return func.coalesce(cast(columna, Float), 0.0)
+
+
+def pagina_productos(
+    session: Session, filtros: list, cursor: tuple[str, int] | None, limit: int
+) -> tuple[list[dict], str | None]:
+    """Return one keyset page of products ordered by ``(nombre, idproducto)``."""
+
+    page = session.execute(pagina_query(filtros, cursor, limit)).all()
+    ids, next_cursor = split_pagina(page, limit)
+    if not ids:
+        return [], next_cursor
+
+    rows = session.execute(productos_query(ids)).all()
+    variantes_ids = [row.idvariante for row in rows if row.idvariante is not None]
+    valores_rows = session.execute(valores_query(variantes_ids)).all() if variantes_ids else []
+    return build_productos(rows, valores_rows), next_cursor
+
+
+async def pagina_productos_async(
+    session: AsyncSession, filtros: list, cursor: tuple[str, int] | None, limit: int
+) -> tuple[list[dict], str | None]:
+    """Async twin of :func:`pagina_productos`."""
+
+    page = (await session.execute(pagina_query(filtros, cursor, limit))).all()
+    ids, next_cursor = split_pagina(page, limit)
+    if not ids:
+        return [], next_cursor
+
+    rows = (await session.execute(productos_query(ids))).all()
+    variantes_ids = [row.idvariante for row in rows if row.idvariante is not None]
+    valores_rows = (
+        (await session.execute(valores_query(variantes_ids))).all() if variantes_ids else []
+    )
+    return build_productos(rows, valores_rows), next_cursor
+
+
+def encode_cursor(nombre: str, idproducto: int) -> str:
+    raw = json.dumps([nombre, idproducto], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(value: str | None) -> tuple[str, int] | None:
+    if not value:
+        return None
+    try:
+        padded = value + "=" * (-len(value) % 4)
+        nombre, idproducto = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("cursor inválido") from None
+    if not isinstance(nombre, str) or not isinstance(idproducto, int):
+        raise ValueError("cursor inválido")
+    return nombre, idproducto
+
+
+def page_size(value: str | None) -> int:
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    limit = parse_int(value, "limit")
+    if limit <= 0:
+        raise ValueError("limit debe ser un entero positivo")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_int(value: str, nombre: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{nombre} debe ser un entero") from None
+
+
+def parse_bool(value: str | None) -> bool:
+    return (value or "").strip().lower() in {"1", "true", "si", "sí", "yes"}
@@ -0,0 +1,170 @@
+"""Flask CLI commands for maintenance tasks."""
+from __future__ import annotations
+
+from datetime import timedelta
+
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup
+
+from .alertas import evaluar_alertas
+from .db import get_engine, get_session
+from .diario import reproducir
+from .importacion import ErrorImportacion, Resolutor, importar, leer_archivo, validar_columnas
+from .kardex import parse_fecha
+from .models import (
+    Base,
+    MovimientoDiario,
+    MovimientoStock,
+    Producto,
+    StockAlerta,
+    StockVariante,
+    SyncCambio,
+    SyncVersion,
+    VentaResumen,
+)
+from .reportes import reconstruir_resumen
+from .stock import recalcular_saldos
+from .sync import inicializar
+
+stock_cli = AppGroup("stock", help="Mantenimiento de saldos de stock.")
+reportes_cli = AppGroup("reportes", help="Mantenimiento de los resúmenes de ventas.")
+catalogo_cli = AppGroup("catalogo", help="Carga masiva del catálogo.")
+sync_cli = AppGroup("sync", help="Registro de cambios para la sincronización de terminales.")
+esquema_cli = AppGroup("esquema", help="Cambios de esquema sobre bases ya existentes.")
+
+# Indexes declared on tables that predate them; ``create_all`` skips existing tables.
+INDICES = (
+    (Producto.__table__, "productos_nombre_idproducto_idx"),
+    (MovimientoStock.__table__, "movimientos_stock_variante_fecha_idx"),
+)
+
+
+@stock_cli.command("recalcular")
+@click.option(
+    "--verificar",
+    is_flag=True,
+    help="Solo informa diferencias entre saldos y movimientos, sin corregirlas.",
+)
+def recalcular_stock(verificar: bool) -> None:
+    """Recompute ``stock_variantes`` from ``movimientos_stock`` and re-check every alert."""
+
+    Base.metadata.create_all(
+        get_engine(), tables=[StockVariante.__table__, StockAlerta.__table__]
+    )
+    with get_session() as session:
+        diferencias = recalcular_saldos(session, solo_verificar=verificar)
+        if not verificar:
+            alertas = evaluar_alertas(session, None)
+
+    for item in diferencias:
+        click.echo(
+            f"variante {item['idvariante']}: "
+            f"almacenado={item['almacenado']} esperado={item['esperado']}"
+        )
+
+    if verificar:
+        click.echo(f"{len(diferencias)} diferencia(s) encontradas.")
+        if diferencias:
+            raise SystemExit(1)
+    else:
+        click.echo(f"{len(diferencias)} saldo(s) corregidos.")
+        click.echo(f"{len(alertas)} alerta(s) de stock actualizadas.")
+
+
+@stock_cli.command("reproducir-diario")
+def reproducir_diario() -> None:
+    """Apply write-behind journals left by processes that are no longer running.
+
+    Also creates ``movimientos_diario``; run it once before enabling
+    MOVIMIENTOS_DIFERIDOS.
+    """
+
+    Base.metadata.create_all(get_engine(), tables=[MovimientoDiario.__table__])
+    aplicados = reproducir(current_app.config["MOVIMIENTOS_DIARIO_DIR"])
+    for nombre, cantidad in aplicados.items():
+        click.echo(f"{nombre}: {cantidad} movimiento(s) aplicados.")
+    click.echo(f"{len(aplicados)} diario(s) revisados.")
+
+
+@reportes_cli.command("reconstruir")
+@click.option("--desde", help="Primer día a reconstruir (AAAA-MM-DD). Por defecto, todo.")
+@click.option("--hasta", help="Último día a reconstruir (AAAA-MM-DD), inclusive.")
+def reconstruir_reportes(desde: str | None, hasta: str | None) -> None:
+    """Rebuild ``ventas_resumen`` from ``ventas`` and ``detalleventa``."""
+
+    try:
+        inicio = parse_fecha(desde, "desde") if desde else None
+        fin = parse_fecha(hasta, "hasta") + timedelta(days=1) if hasta else None
+    except ValueError as exc:
+        raise click.BadParameter(str(exc)) from None
+
+    Base.metadata.create_all(get_engine(), tables=[VentaResumen.__table__])
+    with get_session() as session:
+        procesadas = reconstruir_resumen(session, inicio, fin)
+    click.echo(f"{procesadas} venta(s) procesadas.")
+
+
+@catalogo_cli.command("importar")
+@click.argument("archivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--lote", type=int, help="Filas por transacción (por defecto IMPORTACION_LOTE).")
+def importar_catalogo(archivo: str, lote: int | None) -> None:
+    """Create or update products and variants from a CSV or XLSX file."""
+
+    with open(archivo, "rb") as stream:
+        try:
+            columnas, filas = leer_archivo(stream, archivo)
+            with get_session() as session:
+                resolutor = Resolutor(session)
+            validar_columnas(columnas, resolutor.atributos)
+            for reporte in importar(
+                filas, resolutor, chunk=lote or current_app.config["IMPORTACION_LOTE"]
+            ):
+                if reporte["tipo"] != "progreso":
+                    continue
+                for error in reporte["errores_lote"]:
+                    click.echo(f"fila {error['fila']}: {error['error']}", err=True)
+                click.echo(
+                    f"{reporte['filas']} fila(s) leídas, {reporte['errores']} con errores."
+                )
+            click.echo(
+                f"{reporte.get('productos_creados', 0)} producto(s) creados, "
+                f"{reporte.get('productos_actualizados', 0)} actualizados; "
+                f"{reporte.get('variantes_creadas', 0)} variante(s) creadas, "
+                f"{reporte.get('variantes_actualizadas', 0)} actualizadas."
+            )
+        except ErrorImportacion as exc:
+            raise click.ClickException(str(exc)) from None
+    if reporte["errores"]:
+        raise SystemExit(1)
+
+
+@sync_cli.command("inicializar")
+def inicializar_sync() -> None:
+    """Create the change log tables; running processes pick them up on restart."""
+
+    Base.metadata.create_all(
+        get_engine(), tables=[SyncVersion.__table__, SyncCambio.__table__]
+    )
+    with get_session() as session:
+        inicializar(session)
+    click.echo("Registro de cambios listo.")
+
+
+@esquema_cli.command("indices")
+def crear_indices() -> None:
+    """Create the supporting indexes missing from an existing database."""
+
+    engine = get_engine()
+    for tabla, nombre in INDICES:
+        indice = next(indice for indice in tabla.indexes if indice.name == nombre)
+        indice.create(engine, checkfirst=True)
+        click.echo(f"{nombre}: listo.")
+
+
+def register_commands(app: Flask) -> None:
+    app.cli.add_command(stock_cli)
+    app.cli.add_command(reportes_cli)
+    app.cli.add_command(catalogo_cli)
+    app.cli.add_command(sync_cli)
+    app.cli.add_command(esquema_cli)
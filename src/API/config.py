@@ -0,0 +1,53 @@
+"""API settings read from the environment (and ``.env``)."""
+from __future__ import annotations
+
+import os
+
+from src.config.env_utils import ensureDatabaseUrl, getEnvInt
+
+
+def load_config(interactive: bool | None = None) -> dict:
+    """Return the settings shared by the Flask app and the async read app."""
+
+    return {
+        "DATABASE_URL": ensureDatabaseUrl(interactive),
+        "DATABASE_REPLICA_URL": os.getenv("DATABASE_REPLICA_URL"),
+        "DB_POOL_SIZE": getEnvInt("DB_POOL_SIZE", 5),
+        "DB_MAX_OVERFLOW": getEnvInt("DB_MAX_OVERFLOW", 10),
+        "DB_POOL_TIMEOUT": getEnvInt("DB_POOL_TIMEOUT", 30),
+        "DB_POOL_RECYCLE": getEnvInt("DB_POOL_RECYCLE", 1800),
+        "DB_STATEMENT_TIMEOUT_MS": getEnvInt("DB_STATEMENT_TIMEOUT_MS", 0),
+        "DB_LOCK_TIMEOUT_MS": getEnvInt("DB_LOCK_TIMEOUT_MS", 0),
+        "DB_REPLICA_MAX_LAG_MS": getEnvInt("DB_REPLICA_MAX_LAG_MS", 1000),
+        "DB_SLOW_QUERY_MS": getEnvInt("DB_SLOW_QUERY_MS", 250),
+        "DB_N_PLUS_ONE_THRESHOLD": getEnvInt("DB_N_PLUS_ONE_THRESHOLD", 10),
+        "JSON_SORT_KEYS": False,
+        "JSON_ENCODER": os.getenv("JSON_ENCODER", "orjson"),
+        "COMPRESS_MIN_SIZE": getEnvInt("COMPRESS_MIN_SIZE", 1024),
+        "SECRET_KEY": os.getenv("SECRET_KEY"),
+        "BCRYPT_ROUNDS": getEnvInt("BCRYPT_ROUNDS", 12),
+        "AUTH_HASH_WORKERS": getEnvInt("AUTH_HASH_WORKERS", 2),
+        "AUTH_HASH_MAX_PENDING": getEnvInt("AUTH_HASH_MAX_PENDING", 16),
+        "AUTH_HASH_TIMEOUT": getEnvInt("AUTH_HASH_TIMEOUT", 10),
+        "AUTH_TOKEN_TTL": getEnvInt("AUTH_TOKEN_TTL", 12 * 60 * 60),
+        "RESPONSE_CACHE_MAX_ENTRIES": getEnvInt("RESPONSE_CACHE_MAX_ENTRIES", 256),
+        "INVALIDACION_PG": bool(getEnvInt("INVALIDACION_PG", 1)),
+        "INVALIDACION_CANAL": os.getenv("INVALIDACION_CANAL", "vivero_invalidacion"),
+        "ASYNC_LOOKUP_MAX_AGE": getEnvInt("ASYNC_LOOKUP_MAX_AGE", 60),
+        "ALERTAS_SSE_MAX_CLIENTES": getEnvInt("ALERTAS_SSE_MAX_CLIENTES", 32),
+        "ALERTAS_SSE_KEEPALIVE": getEnvInt("ALERTAS_SSE_KEEPALIVE", 15),
+        "IMPORTACION_LOTE": getEnvInt("IMPORTACION_LOTE", 1000),
+        "STOCK_PERMITIR_NEGATIVO": bool(getEnvInt("STOCK_PERMITIR_NEGATIVO", 0)),
+        "MOVIMIENTOS_DIFERIDOS": bool(getEnvInt("MOVIMIENTOS_DIFERIDOS", 0)),
+        "MOVIMIENTOS_DIARIO_DIR": os.getenv("MOVIMIENTOS_DIARIO_DIR", "diario"),
+        "MOVIMIENTOS_LOTE": getEnvInt("MOVIMIENTOS_LOTE", 500),
+        "MOVIMIENTOS_DEMORA_MS": getEnvInt("MOVIMIENTOS_DEMORA_MS", 20),
+        "FACTURAS_DIR": os.getenv("FACTURAS_DIR", "facturas"),
+        "FACTURAS_WORKERS": getEnvInt("FACTURAS_WORKERS", 0),
+        "FACTURAS_LOTE": getEnvInt("FACTURAS_LOTE", 100),
+        "FACTURAS_TTL_HORAS": getEnvInt("FACTURAS_TTL_HORAS", 24),
+        "FACTURA_EMPRESA": os.getenv("FACTURA_EMPRESA", "Vivero"),
+        "FACTURA_CUIT": os.getenv("FACTURA_CUIT", ""),
+        "FACTURA_DIRECCION": os.getenv("FACTURA_DIRECCION", ""),
+        "FACTURA_PUNTO_VENTA": getEnvInt("FACTURA_PUNTO_VENTA", 1),
+    }
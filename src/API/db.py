@@ -1,32 +1,231 @@
 from __future__ import annotations
 
+import logging
+import os
+import threading
+import time
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Iterator, Mapping
 
-from flask import Flask
-from sqlalchemy import create_engine
+from flask import Flask, current_app, has_request_context, request
+from sqlalchemy import Engine, create_engine, inspect
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import Session, scoped_session, sessionmaker
 
-from .models import Base
+from . import invalidation  # noqa: F401 - registers the session commit hooks
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = {"GET", "HEAD"}
+# How long a missing optional table is trusted to stay missing.
+TABLA_REINTENTO_SEGUNDOS = 30.0
+
+# (engine, table) -> (installed, monotonic time of the last check).
+_tablas: dict[tuple[Engine, str], tuple[bool, float]] = {}
+
+
+class EngineRegistry:
+    """Creates the primary and replica engines lazily, once per process.
+
+    Nothing connects to the database until the first query, so building the
+    app is cheap and safe to do before a pre-fork server forks. If the
+    process id changes, the inherited pools are dropped without closing the
+    parent's connections and fresh engines are created in the child.
+    """
+
+    def __init__(
+        self,
+        primary_url: str,
+        primary_options: dict,
+        replica_url: str | None = None,
+        replica_options: dict | None = None,
+    ) -> None:
+        self.primary_url = primary_url
+        self.replica_url = replica_url
+        self._primary_options = primary_options
+        self._replica_options = replica_options or {}
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._primary: Engine | None = None
+        self._replica: Engine | None = None
+
+    def primary(self) -> Engine:
+        self._check_process()
+        if self._primary is None:
+            with self._lock:
+                if self._primary is None:
+                    self._primary = create_engine(self.primary_url, **self._primary_options)
+        return self._primary
+
+    def replica(self) -> Engine | None:
+        if not self.replica_url:
+            return None
+        self._check_process()
+        if self._replica is None:
+            with self._lock:
+                if self._replica is None:
+                    self._replica = create_engine(self.replica_url, **self._replica_options)
+        return self._replica
+
+    def engines(self) -> dict[str, Engine]:
+        """Engines already created in this process, keyed by role."""
+
+        created = {"primary": self._primary, "replica": self._replica}
+        return {role: engine for role, engine in created.items() if engine is not None}
+
+    def _check_process(self) -> None:
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            for engine in (self._primary, self._replica):
+                if engine is not None:
+                    engine.dispose(close=False)
+            self._primary = None
+            self._replica = None
+            self._pid = pid
+
+
+class RoutingSession(Session):
+    """Session that sends reads issued by GET/HEAD requests to the replica.
+
+    Flushes, DML statements and anything outside a read request always use
+    the primary engine, so write paths need no changes. Reads routed to the
+    replica may lag the primary by the replication delay; code that fills
+    long-lived caches should wrap its reads in :func:`use_primary`.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        registry: EngineRegistry | None = self.info.get("engines")
+        if registry is None:
+            return super().get_bind(mapper=mapper, clause=clause, **kw)
+        if (
+            registry.replica_url
+            and not self.info.get("force_primary")
+            and not self._flushing
+            and not getattr(clause, "is_dml", False)
+            and has_request_context()
+            and request.method in READ_METHODS
+        ):
+            return registry.replica()
+        return registry.primary()
+
 
 # A scoped session is safe to reuse across requests inside Flask.
-SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False))
+SessionLocal = scoped_session(
+    sessionmaker(
+        class_=RoutingSession, autocommit=False, autoflush=False, expire_on_commit=False
+    )
+)
 
 
 def init_db(app: Flask) -> None:
+    """Register the engines for ``app`` without connecting to the database."""
 
     database_url = app.config.get("DATABASE_URL")
     if not database_url:
         raise RuntimeError("DATABASE_URL must be set on the Flask app config")
-    engine = create_engine(database_url, pool_pre_ping=True, future=True)
-    SessionLocal.configure(bind=engine)
-    Base.metadata.bind = engine
+
+    replica_url = app.config.get("DATABASE_REPLICA_URL")
+    registry = EngineRegistry(
+        database_url,
+        engine_options(app.config, database_url),
+        replica_url,
+        engine_options(app.config, replica_url, read_only=True) if replica_url else None,
+    )
+    SessionLocal.configure(info={"engines": registry})
+    app.extensions["db"] = registry
 
     @app.teardown_appcontext
     def cleanup_db(exception: Exception | None) -> None:  # pragma: no cover - Flask hook
         SessionLocal.remove()
 
 
+def engine_options(config: Mapping, url: str, read_only: bool = False) -> dict:
+    """Build ``create_engine`` keyword arguments from an API config mapping."""
+
+    options: dict = {"pool_pre_ping": True, "future": True}
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        return options
+
+    options.update(
+        pool_size=config.get("DB_POOL_SIZE", 5),
+        max_overflow=config.get("DB_MAX_OVERFLOW", 10),
+        pool_timeout=config.get("DB_POOL_TIMEOUT", 30),
+        pool_recycle=config.get("DB_POOL_RECYCLE", 1800),
+    )
+
+    if backend == "postgresql":
+        settings = []
+        if config.get("DB_STATEMENT_TIMEOUT_MS"):
+            settings.append(f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}")
+        if config.get("DB_LOCK_TIMEOUT_MS"):
+            settings.append(f"-c lock_timeout={config['DB_LOCK_TIMEOUT_MS']}")
+        if read_only:
+            settings.append("-c default_transaction_read_only=on")
+        if settings:
+            options["connect_args"] = {"options": " ".join(settings)}
+
+    return options
+
+
+def get_engine() -> Engine:
+    """Return this process's primary engine for the current app."""
+
+    return current_app.extensions["db"].primary()
+
+
+def upsert_insert(session: Session, model):
+    """Return the dialect specific ``insert`` for ``model`` that supports ``ON CONFLICT``."""
+
+    dialect = session.get_bind(mapper=model).dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:  # pragma: no cover - only Postgres (and SQLite for local runs) are supported
+        raise RuntimeError(f"Dialecto no soportado para upserts: {dialect}")
+    return insert(model)
+
+
+def tabla_instalada(session: Session, model, ayuda: str) -> bool:
+    """Whether ``model``'s table exists where ``session`` would write it.
+
+    For tables that a CLI step creates on existing databases: until it runs,
+    callers skip the feature instead of failing every write. A missing table
+    is looked up again every ``TABLA_REINTENTO_SEGUNDOS``, so running the
+    step takes effect without restarting the workers.
+    """
+
+    conexion = session.connection(bind_arguments={"mapper": model})
+    clave = (conexion.engine, model.__tablename__)
+    instalada, verificada = _tablas.get(clave, (False, None))
+    if instalada:
+        return True
+    ahora = time.monotonic()
+    if verificada is None or ahora - verificada >= TABLA_REINTENTO_SEGUNDOS:
+        instalada = inspect(conexion).has_table(model.__tablename__)
+        _tablas[clave] = (instalada, ahora)
+        if not instalada:
+            logger.warning("La tabla %s no existe; %s", model.__tablename__, ayuda)
+    return instalada
+
+
+@contextmanager
+def use_primary(session: Session) -> Iterator[Session]:
+    """Route every statement of ``session`` to the primary inside the block."""
+
+    previous = session.info.get("force_primary", False)
+    session.info["force_primary"] = True
+    try:
+        yield session
+    finally:
+        session.info["force_primary"] = previous
+
+
 @contextmanager
 def get_session() -> Iterator[Session]: 
 
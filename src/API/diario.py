@@ -0,0 +1,493 @@
+"""Write-behind journal for stock movements.
+
+With ``MOVIMIENTOS_DIFERIDOS`` enabled, ``POST /api/stock/movimientos``
+appends the movement to a local journal file and answers as soon as it is
+on disk, instead of waiting for a database transaction. Two threads per
+process do the rest:
+
+* the journal thread writes every record queued since its last pass and
+  covers all of them with a single ``fsync`` (group commit), then wakes
+  the requests waiting on those records;
+* the writer thread inserts journaled movements into ``movimientos_stock``
+  in batches of up to ``MOVIMIENTOS_LOTE`` per transaction. The same
+  transaction advances this journal's checkpoint in ``movimientos_diario``,
+  so after a crash exactly the records past the checkpoint are replayed.
+  A record that can never be applied is set aside in
+  ``diario-<n>.descartados`` instead of blocking the ones behind it.
+
+Each process owns one journal file (``diario-<n>.log``), taken with an
+exclusive ``flock`` so several workers can share the directory. Each
+process opens its journal on its first request of any kind, replaying what
+is left in it, and its writer thread also replays the files of processes
+that died and whose slot nobody took again.
+Records are identified as ``<n>-<lsn>`` and :meth:`DiarioMovimientos.estado`
+tells whether one has reached the database yet.
+"""
+from __future__ import annotations
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DisconnectionError, InterfaceError, OperationalError
+from sqlalchemy.orm import Session
+
+from .db import get_session, upsert_insert
+from .invalidation import mark_changed
+from .models import MovimientoDiario, MovimientoStock, ProductoVariante
+from .stock import acumular_deltas, aplicar_deltas
+
+logger = logging.getLogger(__name__)
+
+# Once everything in the file is applied and it grew past this size, it is
+# truncated so replays stay short.
+ROTAR_BYTES = 16 * 1024 * 1024
+REINTENTO_SEGUNDOS = 1.0
+MAX_REINTENTO_SEGUNDOS = 30.0
+# Failed attempts on one batch before looking for a record that cannot be applied.
+MAX_INTENTOS = 5
+MAX_SLOTS = 64
+# Longest a request waits for its record to reach the disk.
+ESPERA_DISCO_SEGUNDOS = 10.0
+
+
+class DiarioNoDisponible(RuntimeError):
+    """The journal could not confirm a record as durable.
+
+    ``ident`` is set when the record was queued anyway: it may still be
+    written and applied, so clients should check its state before retrying.
+    """
+
+    def __init__(self, mensaje: str, ident: str | None = None) -> None:
+        super().__init__(mensaje)
+        self.ident = ident
+
+
+class DiarioMovimientos:
+    """Durable write-behind queue for stock movements; see the module docstring."""
+
+    def __init__(self) -> None:
+        self.directorio = "diario"
+        self.lote_max = 500
+        self.demora = 0.02
+        self.rechazados: set[int] = set()
+        self._cond = threading.Condition()
+        self._pid: int | None = None
+        self._reintentar_desde = 0.0
+        self._slot: int | None = None
+        self._archivo = None
+        self._lsn = 0
+        self._sincronizado = 0
+        self._aplicado = 0
+        self._error: OSError | None = None
+        self._por_escribir: list[dict] = []
+        self._pendientes: deque[dict] = deque()
+
+    def iniciar(self) -> None:
+        """Open this process' journal so leftovers are replayed without waiting for a POST.
+
+        Raises :class:`DiarioNoDisponible` if it cannot be opened. After a
+        failure, calls within ``MAX_REINTENTO_SEGUNDOS`` return at once; the
+        next :meth:`registrar` still retries.
+        """
+
+        if time.monotonic() < self._reintentar_desde:
+            return
+        self._abrir()
+
+    def registrar(self, movimiento: dict) -> str:
+        """Journal ``movimiento`` and return its id once it is on disk.
+
+        Raises :class:`DiarioNoDisponible` if the journal failed or the record
+        is not on disk within ``ESPERA_DISCO_SEGUNDOS``.
+        """
+
+        self._abrir()
+        limite = time.monotonic() + ESPERA_DISCO_SEGUNDOS
+        with self._cond:
+            if self._error is not None:
+                raise DiarioNoDisponible("El diario de movimientos no está disponible")
+            self._lsn += 1
+            lsn = self._lsn
+            ident = f"{self._slot}-{lsn}"
+            self._por_escribir.append({**movimiento, "lsn": lsn})
+            self._cond.notify_all()
+            while self._sincronizado < lsn:
+                if self._error is not None:
+                    raise DiarioNoDisponible("No se pudo escribir el diario de movimientos")
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise DiarioNoDisponible("El diario de movimientos no responde", ident)
+                self._cond.wait(restante)
+        return ident
+
+    def estado(self, ident: str) -> str | None:
+        """``pendiente``, ``persistido`` or ``rechazado``; ``None`` for unknown ids."""
+
+        try:
+            slot, lsn = (int(parte) for parte in ident.split("-", 1))
+        except ValueError:
+            return None
+        if slot == self._slot and self._pid == os.getpid():
+            if lsn > self._lsn:
+                return None
+            if lsn in self.rechazados:
+                return "rechazado"
+            return "persistido" if lsn <= self._aplicado else "pendiente"
+        with get_session() as session:
+            checkpoint = session.get(MovimientoDiario, f"diario-{slot}.log")
+        return "persistido" if checkpoint and lsn <= checkpoint.lsn else "pendiente"
+
+    def vaciar(self, timeout: float = 10.0) -> bool:
+        """Wait until every journaled movement is in the database."""
+
+        limite = time.monotonic() + timeout
+        with self._cond:
+            while self._aplicado < self._lsn:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                self._cond.wait(restante)
+        return True
+
+    def _abrir(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            # A forked child must not keep the parent's journal open (that
+            # would hold its lock after the parent dies) nor rely on its threads.
+            if self._archivo is not None:
+                self._archivo.close()
+            self._por_escribir.clear()
+            self._pendientes.clear()
+            try:
+                os.makedirs(self.directorio, exist_ok=True)
+                self._slot, self._archivo = tomar_slot(self.directorio)
+                registros, checkpoint = leer_diario(self._archivo, self._nombre())
+            except Exception as exc:
+                # Release the slot so the retry (or another worker) can take it.
+                if self._archivo is not None:
+                    self._archivo.close()
+                self._slot = self._archivo = None
+                self._reintentar_desde = time.monotonic() + MAX_REINTENTO_SEGUNDOS
+                raise DiarioNoDisponible("No se pudo abrir el diario de movimientos") from exc
+            self._pendientes.extend(r for r in registros if r["lsn"] > checkpoint)
+            ultimo = max((r["lsn"] for r in registros), default=0)
+            self._lsn = self._sincronizado = max(ultimo, checkpoint)
+            self._aplicado = checkpoint
+            self.rechazados = set()
+            self._pid = os.getpid()
+            for destino, nombre in ((self._escribir, "diario"), (self._aplicar, "diario-db")):
+                threading.Thread(target=destino, name=nombre, daemon=True).start()
+            # Best effort only: whatever is left is replayed on the next start.
+            atexit.register(self.vaciar, 5.0)
+            if self._pendientes:
+                logger.info(
+                    "Reproduciendo %d movimiento(s) de %s", len(self._pendientes), self._nombre()
+                )
+
+    def _nombre(self) -> str:
+        return f"diario-{self._slot}.log"
+
+    def _escribir(self) -> None:
+        """Journal thread: one write and one fsync for everything queued."""
+
+        while True:
+            with self._cond:
+                while not self._por_escribir:
+                    self._cond.wait()
+                lote, self._por_escribir = self._por_escribir, []
+            datos = b"".join(
+                json.dumps(registro, separators=(",", ":")).encode("utf-8") + b"\n"
+                for registro in lote
+            )
+            inicio = self._archivo.tell()
+            try:
+                self._archivo.write(datos)
+                self._archivo.flush()
+                os.fsync(self._archivo.fileno())
+            except OSError as exc:
+                self._fallar(exc, inicio)
+                return
+            with self._cond:
+                self._sincronizado = lote[-1]["lsn"]
+                self._pendientes.extend(lote)
+                self._cond.notify_all()
+
+    def _fallar(self, exc: OSError, inicio: int) -> None:
+        """Stop journaling after a failed write or fsync.
+
+        After a failed fsync the kernel may already have dropped the dirty
+        pages, so nothing written since the last good fsync can be trusted.
+        The unconfirmed tail is cut so a replay does not apply movements whose
+        requests were told they failed. Every waiting and later request gets
+        :class:`DiarioNoDisponible` until the process restarts.
+        """
+
+        logger.exception(
+            "No se pudo escribir %s; se dejan de aceptar movimientos diferidos", self._nombre()
+        )
+        try:
+            self._archivo.truncate(inicio)
+        except OSError:
+            logger.exception("No se pudo recortar %s", self._nombre())
+        with self._cond:
+            self._error = exc
+            self._cond.notify_all()
+
+    def _aplicar(self) -> None:
+        """Writer thread: batched transactions into ``movimientos_stock``.
+
+        Lost connections, locks and timeouts are retried for as long as they
+        last. Any other error failing a batch ``MAX_INTENTOS`` times points at
+        a record that can never be applied: the batch is then replayed one
+        record at a time and the records that still fail are dead-lettered
+        (see :func:`descartar`), so one bad record cannot stall the journal.
+        """
+
+        # Journals of processes that died and whose slot no process took again.
+        try:
+            for nombre, cantidad in reproducir(self.directorio).items():
+                if cantidad:
+                    logger.info("%s: %d movimiento(s) reproducidos", nombre, cantidad)
+        except Exception:
+            logger.exception("No se pudieron reproducir los diarios huérfanos")
+
+        intentos = 0
+        aislar_hasta = 0
+        while True:
+            with self._cond:
+                while not self._pendientes:
+                    self._cond.wait()
+            # Give concurrent requests a moment to fill the batch.
+            time.sleep(self.demora)
+            with self._cond:
+                aislando = self._pendientes[0]["lsn"] <= aislar_hasta
+                lote = list(islice(self._pendientes, 1 if aislando else self.lote_max))
+            try:
+                if aislando:
+                    rechazados = aplicar_o_descartar(lote, self.directorio, self._nombre())
+                else:
+                    rechazados = aplicar_lote(lote, self._nombre())
+            except Exception as exc:
+                intentos += 1
+                logger.exception(
+                    "No se pudo aplicar %s (intento %d); se reintenta", self._nombre(), intentos
+                )
+                if not transitorio(exc) and intentos >= MAX_INTENTOS:
+                    aislar_hasta = lote[-1]["lsn"]
+                    intentos = 0
+                    continue
+                time.sleep(min(REINTENTO_SEGUNDOS * 2 ** (intentos - 1), MAX_REINTENTO_SEGUNDOS))
+                continue
+            intentos = 0
+            with self._cond:
+                for _ in lote:
+                    self._pendientes.popleft()
+                self.rechazados.update(rechazados)
+                self._aplicado = lote[-1]["lsn"]
+                self._cond.notify_all()
+                self._rotar()
+
+    def _rotar(self) -> None:
+        # Only when every lsn handed out is applied: nothing is queued or mid-write.
+        if self._lsn != self._aplicado:
+            return
+        if self._archivo.tell() < ROTAR_BYTES:
+            return
+        self._archivo.truncate(0)
+        self._archivo.seek(0)
+        os.fsync(self._archivo.fileno())
+
+
+def tomar_slot(directorio: str):
+    """Open and lock the first journal file no other process holds."""
+
+    for slot in range(MAX_SLOTS):
+        archivo = open(os.path.join(directorio, f"diario-{slot}.log"), "a+b")
+        try:
+            fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            archivo.close()
+            continue
+        return slot, archivo
+    raise RuntimeError(f"No hay diarios libres en {directorio}")
+
+
+def leer_diario(archivo, nombre: str) -> tuple[list[dict], int]:
+    """Records in ``archivo`` and the journal's checkpoint in the database.
+
+    A torn last line (a crash in the middle of a write that was never
+    acknowledged) is dropped and cut from the file.
+    """
+
+    archivo.seek(0)
+    registros: list[dict] = []
+    valido = 0
+    for linea in archivo:
+        try:
+            registros.append(json.loads(linea))
+        except ValueError:
+            break
+        valido += len(linea)
+    archivo.truncate(valido)
+    archivo.seek(valido)
+
+    with get_session() as session:
+        checkpoint = session.get(MovimientoDiario, nombre)
+    return registros, checkpoint.lsn if checkpoint else 0
+
+
+def aplicar_lote(lote: list[dict], nombre: str) -> set[int]:
+    """Insert ``lote`` and move ``nombre``'s checkpoint in one transaction.
+
+    Movements whose variant no longer exists are skipped and their lsns
+    returned.
+    """
+
+    with get_session() as session:
+        ids = {registro["idvariante"] for registro in lote}
+        existentes = set(
+            session.scalars(
+                select(ProductoVariante.idvariante).where(ProductoVariante.idvariante.in_(ids))
+            )
+        )
+        validos = [registro for registro in lote if registro["idvariante"] in existentes]
+        if validos:
+            session.execute(
+                insert(MovimientoStock),
+                [
+                    {
+                        "idvariante": registro["idvariante"],
+                        "tipo": registro["tipo"],
+                        "cantidad": registro["cantidad"],
+                        "descripcion": registro.get("descripcion"),
+                        "fecha": datetime.fromisoformat(registro["fecha"]),
+                    }
+                    for registro in validos
+                ],
+            )
+            aplicar_deltas(
+                session,
+                acumular_deltas(
+                    (registro["idvariante"], registro["tipo"], registro["cantidad"])
+                    for registro in validos
+                ),
+            )
+            mark_changed(
+                session, MovimientoStock.__tablename__, {r["idvariante"] for r in validos}
+            )
+
+        avanzar_checkpoint(session, nombre, lote[-1]["lsn"])
+
+    rechazados = {registro["lsn"] for registro in lote if registro["idvariante"] not in existentes}
+    for lsn in sorted(rechazados):
+        logger.error("%s: movimiento %d descartado, la variante ya no existe", nombre, lsn)
+    return rechazados
+
+
+def aplicar_o_descartar(lote: list[dict], directorio: str, nombre: str) -> set[int]:
+    """Apply ``lote`` one record at a time, dead-lettering the ones that fail.
+
+    Transient errors are raised instead: they say nothing about the record.
+    Returns the lsns that were not applied.
+    """
+
+    rechazados: set[int] = set()
+    for registro in lote:
+        try:
+            rechazados |= aplicar_lote([registro], nombre)
+        except Exception as exc:
+            if transitorio(exc):
+                raise
+            descartar(directorio, nombre, registro, exc)
+            rechazados.add(registro["lsn"])
+    return rechazados
+
+
+def descartar(directorio: str, nombre: str, registro: dict, error: Exception) -> None:
+    """Move ``registro`` to ``<journal>.descartados`` and checkpoint past it.
+
+    The dead-letter line is on disk before the checkpoint moves, so a crash
+    in between can duplicate it there but never lose it.
+    """
+
+    ruta = os.path.join(directorio, nombre.removesuffix(".log") + ".descartados")
+    linea = {**registro, "error": f"{type(error).__name__}: {error}".splitlines()[0]}
+    with open(ruta, "ab") as archivo:
+        archivo.write(json.dumps(linea, separators=(",", ":")).encode("utf-8") + b"\n")
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    with get_session() as session:
+        avanzar_checkpoint(session, nombre, registro["lsn"])
+    logger.error(
+        "%s: movimiento %d descartado (%s); guardado en %s",
+        nombre,
+        registro["lsn"],
+        linea["error"],
+        ruta,
+    )
+
+
+def avanzar_checkpoint(session: Session, nombre: str, lsn: int) -> None:
+    stmt = upsert_insert(session, MovimientoDiario).values(
+        diario=nombre, lsn=lsn, fecha_actualizacion=datetime.utcnow()
+    )
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[MovimientoDiario.diario],
+            set_={
+                "lsn": stmt.excluded.lsn,
+                "fecha_actualizacion": stmt.excluded.fecha_actualizacion,
+            },
+        )
+    )
+
+
+def transitorio(exc: Exception) -> bool:
+    """Whether ``exc`` is about the database being unavailable rather than the data."""
+
+    return isinstance(exc, (OperationalError, InterfaceError, DisconnectionError)) or bool(
+        getattr(exc, "connection_invalidated", False)
+    )
+
+
+def reproducir(directorio: str) -> dict[str, int]:
+    """Apply what is left in every journal no running process holds (CLI use)."""
+
+    aplicados: dict[str, int] = {}
+    if not os.path.isdir(directorio):
+        return aplicados
+    for nombre in sorted(os.listdir(directorio)):
+        if not (nombre.startswith("diario-") and nombre.endswith(".log")):
+            continue
+        with open(os.path.join(directorio, nombre), "a+b") as archivo:
+            try:
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            registros, checkpoint = leer_diario(archivo, nombre)
+            pendientes = [registro for registro in registros if registro["lsn"] > checkpoint]
+            for inicio in range(0, len(pendientes), 500):
+                lote = pendientes[inicio : inicio + 500]
+                try:
+                    aplicar_lote(lote, nombre)
+                except Exception as exc:
+                    if transitorio(exc):
+                        raise
+                    aplicar_o_descartar(lote, directorio, nombre)
+            aplicados[nombre] = len(pendientes)
+    return aplicados
+
+
+diario_movimientos = DiarioMovimientos()
@@ -0,0 +1,181 @@
+"""Response encoding: fast JSON, MessagePack negotiation and compression.
+
+``JSON_ENCODER=orjson`` (the default when orjson is installed) swaps Flask's
+JSON provider for one backed by orjson, which serializes straight to bytes.
+Clients that send ``Accept: application/msgpack`` get MessagePack instead of
+JSON from every ``jsonify`` view when msgpack is installed. Bodies of at
+least ``COMPRESS_MIN_SIZE`` bytes are sent with brotli (if installed) or
+gzip, whichever the client accepts.
+"""
+from __future__ import annotations
+
+import dataclasses
+import decimal
+import gzip
+import json
+import typing as t
+import uuid
+from datetime import date
+
+from flask import Flask, Response, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:  # Optional fast paths; everything works without them.
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depends on the environment
+    msgpack = None
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+MSGPACK_MIMETYPE = "application/msgpack"
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, "application/x-msgpack")
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/x-ndjson",
+    MSGPACK_MIMETYPE,
+    "text/csv",
+    "text/plain",
+    "text/html",
+}
+GZIP_LEVEL = 6
+# Brotli's top qualities are meant for static assets; 5 compresses better
+# than gzip -6 at a similar cost for per-request bodies.
+BROTLI_QUALITY = 5
+
+
+def _default(value: t.Any) -> t.Any:
+    """Same conversions as Flask's default provider."""
+
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class NegotiatingJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider plus MessagePack for clients that ask for it."""
+
+    def dumps_bytes(self, obj: t.Any) -> bytes:
+        return self.dumps(obj).encode("utf-8")
+
+    def response(self, *args: t.Any, **kwargs: t.Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        if wants_msgpack():
+            response = self._app.response_class(
+                msgpack.packb(obj, default=_default, datetime=False),
+                mimetype=MSGPACK_MIMETYPE,
+            )
+        else:
+            response = self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+        if msgpack is not None:
+            response.vary.add("Accept")
+        return response
+
+
+class OrjsonProvider(NegotiatingJSONProvider):
+    """orjson-backed provider; output matches the default one (compact form)."""
+
+    def dumps(self, obj: t.Any, **kwargs: t.Any) -> str:
+        return self.dumps_bytes(obj, sort_keys=kwargs.get("sort_keys", self.sort_keys)).decode()
+
+    def dumps_bytes(self, obj: t.Any, sort_keys: bool | None = None) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys if sort_keys is None else sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def loads(self, s: str | bytes, **kwargs: t.Any) -> t.Any:
+        return orjson.loads(s)
+
+
+def dumps_bytes(obj: t.Any) -> bytes:
+    """Compact UTF-8 JSON for code outside a Flask app (e.g. the ASGI app)."""
+
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def wants_msgpack() -> bool:
+    if msgpack is None:
+        return False
+    accept = request.accept_mimetypes
+    best = accept.best_match((*MSGPACK_MIMETYPES, "application/json"))
+    return best in MSGPACK_MIMETYPES and accept[best] > accept["application/json"]
+
+
+def negotiate_encoding() -> str | None:
+    """Content-Encoding to use for this request, if any."""
+
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response: Response, min_size: int) -> Response:
+    """Compress a complete response in place when it is worth it."""
+
+    if (
+        response.is_streamed
+        or response.direct_passthrough
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+
+    response.set_data(compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    # The bytes differ from the identity representation, so a strong ETag
+    # would no longer be valid; weak ones still work for revalidation.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_encoding(app: Flask) -> None:
+    encoder = app.config["JSON_ENCODER"]
+    if encoder == "orjson" and orjson is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        if encoder == "orjson":
+            app.logger.warning("orjson no está instalado; se usa el codificador JSON estándar")
+        app.json = NegotiatingJSONProvider(app)
+    app.json.sort_keys = app.config["JSON_SORT_KEYS"]
+
+    min_size = app.config["COMPRESS_MIN_SIZE"]
+    if min_size > 0:
+
+        @app.after_request
+        def _compress(response: Response) -> Response:
+            return compress_response(response, min_size)
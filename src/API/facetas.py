@@ -0,0 +1,415 @@
+"""In-process inverted index for faceted search over variant attributes.
+
+Each ``(facet, value)`` pair maps to a bitmap of variant ids, stored as a
+Python ``int`` whose bit ``n`` is set when variant ``n`` has that value. A
+filter like ``color=rojo&maceta=12cm`` is then a couple of big-int ANDs and
+per-value counts are ``int.bit_count()`` calls, however many attributes the
+catalog grows. Commits only mark the touched variants stale; they are
+re-indexed on the next query.
+"""
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Iterable, Iterator, Mapping, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .db import use_primary
+from .invalidation import Changes, subscribe
+from .models import (
+    Atributo,
+    AtributoOpcion,
+    Categoria,
+    Producto,
+    ProductoVariante,
+    VarianteValor,
+)
+
+# Facet built from the product category rather than from an attribute.
+FACETA_CATEGORIA = "categoria"
+
+_TABLAS_VARIANTE = ("producto_variantes", "variante_valores")
+# Renaming attributes or options changes keys everywhere: reload in full.
+_TABLAS_RECARGA = ("atributos", "atributo_opciones", "categorias")
+
+
+class _Indice(NamedTuple):
+    postings: dict[tuple[str, str], int]
+    etiquetas: dict[tuple[str, str], str]
+    facetas: dict[str, tuple[int, str]]
+    claves: dict[int, list[tuple[str, str]]]
+    producto_de: dict[int, int]
+    por_producto: dict[int, frozenset[int]]
+    activos: int
+
+
+class _Recarga(NamedTuple):
+    """What one refresh reindexes: everything (``ids is None``) or some variants."""
+
+    generacion: int
+    ids: set[int] | None
+    productos: set[int]
+
+
+class _Lectura(NamedTuple):
+    """Rows read for one refresh; applied afterwards without touching the database."""
+
+    ids: set[int] | None
+    facetas: dict[str, tuple[int, str]] | None
+    etiquetas: dict[tuple[str, str], str]
+    valores: list
+    variantes: list
+
+
+@dataclass
+class Resultado:
+    total: int
+    ids: list[int]
+    next_cursor: int | None
+    facetas: list[dict] = field(default_factory=list)
+
+
+class FacetIndex:
+    """Bitmap postings keyed by ``(facet slug, value key)``; only active variants match.
+
+    Like :class:`~.lookup.VarianteLookup`, a refresh takes the stale marks
+    under a short lock, queries without it, builds a new index on the side
+    and publishes it with a single assignment. A failed refresh puts its
+    marks back so the next query retries.
+    """
+
+    def __init__(self) -> None:
+        # Guards the stale sets; never held while querying.
+        self._lock = threading.Lock()
+        # One refresh at a time; held while querying.
+        self._recargando = threading.Lock()
+        self._generacion = 0
+        self._cargada: int | None = None
+        self._indice = _Indice({}, {}, {}, {}, {}, {}, 0)
+        self._stale: set[int] = set()
+        self._stale_productos: set[int] = set()
+
+    def facetas(self, session: Session) -> set[str]:
+        self._ensure(session)
+        return set(self._indice.facetas)
+
+    def buscar(
+        self,
+        session: Session,
+        filtros: Mapping[str, Iterable[str]],
+        cursor: int | None,
+        limit: int,
+    ) -> Resultado:
+        """Variants matching every facet in ``filtros`` (any value within a facet).
+
+        Counts are disjunctive: each facet's value counts apply the other
+        facets' filters but not its own, so selecting ``rojo`` still shows
+        how many ``blanco`` variants there are.
+        """
+
+        self._ensure(session)
+        indice = self._indice
+        postings = indice.postings
+        activos = indice.activos
+        elegidos = {
+            faceta: {normalizar(valor) for valor in valores} for faceta, valores in filtros.items()
+        }
+        seleccion: dict[str, int] = {}
+        for faceta, valores in elegidos.items():
+            bitmap = 0
+            for valor in valores:
+                bitmap |= postings.get((faceta, valor), 0)
+            seleccion[faceta] = bitmap
+
+        resultado = activos
+        for bitmap in seleccion.values():
+            resultado &= bitmap
+
+        # Base set per facet: every filter except the facet's own.
+        bases: dict[str, int] = {}
+        for faceta in indice.facetas:
+            base = activos
+            for otra, filtro in seleccion.items():
+                if otra != faceta:
+                    base &= filtro
+            bases[faceta] = base
+
+        conteos: dict[str, list[dict]] = defaultdict(list)
+        for (faceta, clave), bitmap in postings.items():
+            cantidad = (bitmap & bases.get(faceta, resultado)).bit_count()
+            if cantidad:
+                conteos[faceta].append(
+                    {
+                        "valor": clave,
+                        "etiqueta": indice.etiquetas.get((faceta, clave), clave),
+                        "cantidad": cantidad,
+                        "seleccionado": clave in elegidos.get(faceta, ()),
+                    }
+                )
+
+        facetas = [
+            {"slug": slug, "nombre": nombre, "valores": sorted(conteos[slug], key=_orden_valor)}
+            for slug, (_, nombre) in sorted(indice.facetas.items(), key=lambda item: item[1])
+            if conteos.get(slug)
+        ]
+
+        desde = 0 if cursor is None else cursor + 1
+        ids = list(_bits(resultado >> desde, desde, limit + 1))
+        next_cursor = None
+        if len(ids) > limit:
+            ids = ids[:limit]
+            next_cursor = ids[-1]
+        return Resultado(resultado.bit_count(), ids, next_cursor, facetas)
+
+    def invalidate(self, changes: Changes) -> None:
+        with self._lock:
+            if any(changes.get(table) is not None for table in _TABLAS_RECARGA):
+                self._generacion += 1
+                return
+            for table in _TABLAS_VARIANTE:
+                self._stale.update(changes.get(table, ()))
+            self._stale_productos.update(changes.get("productos", ()))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generacion += 1
+
+    def _ensure(self, session: Session) -> None:
+        if self._cargada == self._generacion and not (self._stale or self._stale_productos):
+            return
+        with self._recargando:
+            recarga = self._pendiente()
+            if recarga is None:
+                return
+            try:
+                lectura = self._leer(session, recarga)
+            except BaseException:
+                self._devolver(recarga)
+                raise
+            self._aplicar(recarga, lectura)
+
+    def _pendiente(self) -> _Recarga | None:
+        """Take the stale marks for one refresh (``None`` when already fresh)."""
+
+        with self._lock:
+            if self._cargada != self._generacion:
+                self._stale.clear()
+                self._stale_productos.clear()
+                return _Recarga(self._generacion, None, set())
+            if not self._stale and not self._stale_productos:
+                return None
+            ids = set(self._stale)
+            productos = set(self._stale_productos)
+            self._stale.clear()
+            self._stale_productos.clear()
+        por_producto = self._indice.por_producto
+        for idproducto in productos:
+            ids.update(por_producto.get(idproducto, ()))
+        return _Recarga(self._generacion, ids, productos)
+
+    def _devolver(self, recarga: _Recarga) -> None:
+        """Put back the marks of a refresh that failed, so the next query retries."""
+
+        if recarga.ids is None:
+            return
+        with self._lock:
+            self._stale.update(recarga.ids)
+            self._stale_productos.update(recarga.productos)
+
+    def _leer(self, session: Session, recarga: _Recarga) -> _Lectura:
+        with use_primary(session):
+            ids = recarga.ids
+            facetas = None
+            etiquetas: dict[tuple[str, str], str] = {}
+            if ids is None:
+                facetas, etiquetas = _cargar_facetas(session)
+            elif recarga.productos:
+                ids = ids | set(
+                    session.scalars(
+                        select(ProductoVariante.idvariante).where(
+                            ProductoVariante.idproducto.in_(recarga.productos)
+                        )
+                    )
+                )
+            if ids is not None and not ids:
+                return _Lectura(ids, facetas, etiquetas, [], [])
+
+            variantes_query = select(
+                ProductoVariante.idvariante,
+                ProductoVariante.idproducto,
+                ProductoVariante.estado,
+                Producto.estado.label("producto_estado"),
+                Producto.idcategoria,
+            ).join(Producto, Producto.idproducto == ProductoVariante.idproducto)
+            valores_query = (
+                select(
+                    VarianteValor.idvariante,
+                    Atributo.slug,
+                    AtributoOpcion.slug.label("opcion_slug"),
+                    AtributoOpcion.valor.label("opcion_valor"),
+                    VarianteValor.valor_texto,
+                    VarianteValor.valor_numero,
+                    VarianteValor.valor_booleano,
+                )
+                .join(Atributo, Atributo.idatributo == VarianteValor.idatributo)
+                .join(
+                    AtributoOpcion,
+                    AtributoOpcion.idopcion == VarianteValor.idopcion,
+                    isouter=True,
+                )
+                .where(Atributo.activo.is_(True))
+            )
+            if ids is not None:
+                variantes_query = variantes_query.where(ProductoVariante.idvariante.in_(ids))
+                valores_query = valores_query.where(VarianteValor.idvariante.in_(ids))
+            valores = session.execute(valores_query).all()
+            variantes = session.execute(variantes_query).all()
+        return _Lectura(ids, facetas, etiquetas, valores, variantes)
+
+    def _aplicar(self, recarga: _Recarga, lectura: _Lectura) -> None:
+        """(Re)index the rows read into copies of the current index, then swap it in."""
+
+        ids = lectura.ids
+        anterior = self._indice
+        if ids is None:
+            postings: dict[tuple[str, str], int] = {}
+            etiquetas = dict(lectura.etiquetas)
+            facetas = lectura.facetas
+            claves: dict[int, list[tuple[str, str]]] = {}
+            producto_de: dict[int, int] = {}
+            por_producto: dict[int, frozenset[int]] = {}
+            activos = 0
+        else:
+            postings = dict(anterior.postings)
+            etiquetas = dict(anterior.etiquetas)
+            facetas = anterior.facetas
+            claves = dict(anterior.claves)
+            producto_de = dict(anterior.producto_de)
+            por_producto = dict(anterior.por_producto)
+            activos = anterior.activos & ~_bitmap(ids)
+
+        nuevas: dict[int, list[tuple[str, str]]] = defaultdict(list)
+        for row in lectura.valores:
+            clave, etiqueta = _clave_valor(row)
+            if clave:
+                nuevas[row.idvariante].append((row.slug, clave))
+                etiquetas.setdefault((row.slug, clave), etiqueta)
+
+        # Ids are grouped per key first so each bitmap is rebuilt once, not
+        # once per variant.
+        quitar: dict[tuple[str, str], list[int]] = defaultdict(list)
+        agregar: dict[tuple[str, str], list[int]] = defaultdict(list)
+        miembros: dict[int, set[int]] = {}
+        activos_agregar: list[int] = []
+        for idvariante in ids or ():
+            for key in claves.pop(idvariante, ()):
+                quitar[key].append(idvariante)
+            idproducto = producto_de.pop(idvariante, None)
+            if idproducto is not None:
+                miembros.setdefault(idproducto, set(por_producto.get(idproducto, ())))
+                miembros[idproducto].discard(idvariante)
+
+        for row in lectura.variantes:
+            claves_variante = nuevas.get(row.idvariante, [])
+            if row.idcategoria is not None:
+                claves_variante.append((FACETA_CATEGORIA, str(row.idcategoria)))
+            claves[row.idvariante] = claves_variante
+            producto_de[row.idvariante] = row.idproducto
+            miembros.setdefault(row.idproducto, set(por_producto.get(row.idproducto, ())))
+            miembros[row.idproducto].add(row.idvariante)
+            if row.estado and row.producto_estado:
+                activos_agregar.append(row.idvariante)
+            for key in claves_variante:
+                agregar[key].append(row.idvariante)
+
+        for key in quitar.keys() | agregar.keys():
+            bitmap = postings.get(key, 0) & ~_bitmap(quitar.get(key, ()))
+            bitmap |= _bitmap(agregar.get(key, ()))
+            if bitmap:
+                postings[key] = bitmap
+            else:
+                postings.pop(key, None)
+        for idproducto, variantes in miembros.items():
+            if variantes:
+                por_producto[idproducto] = frozenset(variantes)
+            else:
+                por_producto.pop(idproducto, None)
+
+        self._indice = _Indice(
+            postings,
+            etiquetas,
+            facetas,
+            claves,
+            producto_de,
+            por_producto,
+            activos | _bitmap(activos_agregar),
+        )
+        if ids is None:
+            self._cargada = recarga.generacion
+
+
+def _cargar_facetas(
+    session: Session,
+) -> tuple[dict[str, tuple[int, str]], dict[tuple[str, str], str]]:
+    facetas = {FACETA_CATEGORIA: (-1, "Categoría")}
+    for slug, nombre, orden in session.execute(
+        select(Atributo.slug, Atributo.nombre, Atributo.orden).where(Atributo.activo.is_(True))
+    ):
+        facetas[slug] = (orden or 0, nombre)
+    etiquetas = {
+        (FACETA_CATEGORIA, str(idcategoria)): nombre
+        for idcategoria, nombre in session.execute(select(Categoria.idcategoria, Categoria.nombre))
+    }
+    return facetas, etiquetas
+
+
+def normalizar(valor: str) -> str:
+    return str(valor).strip().lower()
+
+
+def _clave_valor(row) -> tuple[str | None, str]:
+    """Index key and display label for one ``VarianteValor`` row."""
+
+    if row.opcion_slug:
+        return normalizar(row.opcion_slug), row.opcion_valor or row.opcion_slug
+    if row.valor_texto is not None:
+        return normalizar(row.valor_texto), row.valor_texto
+    if row.valor_numero is not None:
+        numero = Decimal(row.valor_numero).normalize()
+        texto = format(numero, "f")
+        return texto, texto
+    if row.valor_booleano is not None:
+        return ("true", "Sí") if row.valor_booleano else ("false", "No")
+    return None, ""
+
+
+def _orden_valor(valor: dict):
+    return (-valor["cantidad"], valor["etiqueta"])
+
+
+def _bitmap(ids: Iterable[int]) -> int:
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for idvariante in ids:
+        buffer[idvariante >> 3] |= 1 << (idvariante & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def _bits(bitmap: int, offset: int, limit: int) -> Iterator[int]:
+    """Yield up to ``limit`` set bit positions of ``bitmap`` (plus ``offset``), ascending."""
+
+    while bitmap and limit:
+        low = bitmap & -bitmap
+        yield low.bit_length() - 1 + offset
+        bitmap ^= low
+        limit -= 1
+
+
+indice_facetas = FacetIndex()
+subscribe(indice_facetas.invalidate, on_reset=indice_facetas.clear)
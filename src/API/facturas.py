@@ -0,0 +1,523 @@
+"""Invoice rendering: a PDF and a structured (JSON) export per sale.
+
+Sales are loaded in bulk, lines, products, variant attributes and employee
+included, with three queries per chunk of ``FACTURAS_LOTE`` sales. Single
+invoices are rendered in the request; batch jobs run on a background thread
+that feeds chunks to a process pool (``FACTURAS_WORKERS``, one per core by
+default) whose workers write ``factura-<numero>.pdf`` and ``.json`` files.
+The finished batch is packed into one zip. Progress lives in a small JSON
+file next to it, so any worker process on the host can report it. Both are
+deleted ``FACTURAS_TTL_HORAS`` after the job ends; a job left ``en_curso``
+by a process that died is marked ``error`` when the app starts.
+
+PDFs are written directly (standard Helvetica fonts, Flate-compressed page
+streams), so no PDF library is needed. The parts that never change between
+invoices, the letterhead and the table header, are built once per process.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .catalog import agrupar_valores, valores_query
+from .db import SessionLocal, get_session
+from .models import DetalleVenta, Empleado, Producto, ProductoVariante, Venta
+
+logger = logging.getLogger(__name__)
+
+ANCHO, ALTO = 595, 842  # A4 in points
+FILAS_POR_PAGINA = 36
+MAX_DESCRIPCION = 60
+# A running job rewrites its state file after every chunk; this much silence
+# means the process running it is gone.
+ABANDONO_SEGUNDOS = 10 * 60
+# Helvetica advance widths (1/1000 em) for the characters in amounts.
+ANCHOS_HELVETICA = {**dict.fromkeys("0123456789$", 556), ".": 278, ",": 278, " ": 278, "-": 333}
+
+
+class Empresa(NamedTuple):
+    nombre: str
+    cuit: str
+    direccion: str
+    punto_venta: int
+
+
+def cargar_facturas(session: Session, ids: Iterable[int]) -> list[dict]:
+    """Invoice data for the sales in ``ids`` (missing ones are skipped), in id order."""
+
+    ids = sorted(set(ids))
+    if not ids:
+        return []
+    ventas = session.execute(
+        select(
+            Venta.idventa,
+            Venta.fecha,
+            Venta.total,
+            Venta.metodopago,
+            Empleado.nombre,
+            Empleado.apellido,
+        )
+        .join(Empleado, Empleado.idempleado == Venta.idempleado, isouter=True)
+        .where(Venta.idventa.in_(ids))
+        .order_by(Venta.idventa)
+    ).all()
+    lineas = session.execute(
+        select(
+            DetalleVenta.idventa,
+            DetalleVenta.idproducto,
+            DetalleVenta.idvariante,
+            DetalleVenta.cantidad,
+            DetalleVenta.preciounitario,
+            DetalleVenta.subtotal,
+            Producto.nombre,
+            ProductoVariante.sku,
+        )
+        .join(Producto, Producto.idproducto == DetalleVenta.idproducto, isouter=True)
+        .join(
+            ProductoVariante,
+            ProductoVariante.idvariante == DetalleVenta.idvariante,
+            isouter=True,
+        )
+        .where(DetalleVenta.idventa.in_(ids))
+        .order_by(DetalleVenta.idventa, DetalleVenta.iddetalle)
+    ).all()
+    variantes = [linea.idvariante for linea in lineas if linea.idvariante is not None]
+    atributos = (
+        agrupar_valores(session.execute(valores_query(sorted(set(variantes)))))
+        if variantes
+        else {}
+    )
+
+    facturas = {
+        venta.idventa: {
+            "idventa": venta.idventa,
+            "fecha": venta.fecha,
+            "total": venta.total,
+            "metodopago": venta.metodopago,
+            "empleado": " ".join(filter(None, (venta.nombre, venta.apellido))) or None,
+            "items": [],
+        }
+        for venta in ventas
+    }
+    for linea in lineas:
+        valores = [str(valor["valor"]) for valor in atributos.get(linea.idvariante, ())]
+        descripcion = linea.nombre or "Producto eliminado"
+        if valores:
+            descripcion += f" ({', '.join(valores)})"
+        facturas[linea.idventa]["items"].append(
+            {
+                "idproducto": linea.idproducto,
+                "idvariante": linea.idvariante,
+                "sku": linea.sku,
+                "descripcion": descripcion,
+                "cantidad": linea.cantidad or 0,
+                "precio_unitario": linea.preciounitario or Decimal("0"),
+                "subtotal": linea.subtotal or Decimal("0"),
+            }
+        )
+    return list(facturas.values())
+
+
+def numero_factura(idventa: int, empresa: Empresa) -> str:
+    return f"{empresa.punto_venta:04d}-{idventa:08d}"
+
+
+def serialize_factura(factura: dict, empresa: Empresa) -> dict:
+    """The structured export, in the API's usual JSON shape."""
+
+    return {
+        "numero": numero_factura(factura["idventa"], empresa),
+        "idventa": factura["idventa"],
+        "fecha": factura["fecha"].isoformat() if factura["fecha"] else None,
+        "emisor": {"nombre": empresa.nombre, "cuit": empresa.cuit, "direccion": empresa.direccion},
+        "empleado": factura["empleado"],
+        "metodopago": factura["metodopago"],
+        "items": [
+            {
+                "idproducto": item["idproducto"],
+                "idvariante": item["idvariante"],
+                "sku": item["sku"],
+                "descripcion": item["descripcion"],
+                "cantidad": item["cantidad"],
+                "precio_unitario": float(item["precio_unitario"]),
+                "subtotal": float(item["subtotal"]),
+            }
+            for item in factura["items"]
+        ],
+        "total": float(factura["total"] or 0),
+    }
+
+
+def render_pdf(factura: dict, empresa: Empresa) -> bytes:
+    items = factura["items"]
+    paginas = [
+        items[inicio : inicio + FILAS_POR_PAGINA]
+        for inicio in range(0, max(len(items), 1), FILAS_POR_PAGINA)
+    ]
+    numero = numero_factura(factura["idventa"], empresa)
+    fecha = factura["fecha"].strftime("%d/%m/%Y %H:%M") if factura["fecha"] else ""
+    contenidos = []
+    for indice, filas in enumerate(paginas, 1):
+        partes = [
+            _membrete(empresa),
+            _texto(400, 792, "FACTURA", "F2", 14),
+            _texto(400, 774, f"N° {numero}"),
+            _texto(400, 760, f"Fecha: {fecha}"),
+            _texto(50, 730, f"Vendedor: {factura['empleado'] or '-'}"),
+            _texto(50, 716, f"Forma de pago: {factura['metodopago'] or '-'}"),
+            _ENCABEZADO_TABLA,
+        ]
+        y = 670
+        for item in filas:
+            partes.append(_derecha(90, y, str(item["cantidad"])))
+            partes.append(_texto(100, y, _recortar(item["descripcion"])))
+            partes.append(_derecha(460, y, _moneda(item["precio_unitario"])))
+            partes.append(_derecha(545, y, _moneda(item["subtotal"])))
+            y -= 14
+        if indice == len(paginas):
+            partes.append(b"50 %d m 545 %d l S\n" % (y + 4, y + 4))
+            partes.append(_texto(380, y - 14, "TOTAL", "F2", 12))
+            partes.append(_derecha(545, y - 14, _moneda(factura["total"] or 0), "F2", 12))
+        partes.append(_texto(50, 40, f"Página {indice} de {len(paginas)}", tam=8))
+        contenidos.append(b"".join(partes))
+    return _documento(contenidos)
+
+
+def renderizar_lote(directorio: str, facturas: list[dict], empresa: Empresa) -> int:
+    """Process-pool task: write the PDF and JSON of each invoice to ``directorio``."""
+
+    for factura in facturas:
+        base = os.path.join(directorio, f"factura-{numero_factura(factura['idventa'], empresa)}")
+        with open(base + ".pdf", "wb") as archivo:
+            archivo.write(render_pdf(factura, empresa))
+        with open(base + ".json", "w", encoding="utf-8") as archivo:
+            json.dump(serialize_factura(factura, empresa), archivo, ensure_ascii=False)
+    return len(facturas)
+
+
+class GeneradorFacturas:
+    """Runs batch jobs on a lazily created process pool; see the module docstring."""
+
+    def __init__(self) -> None:
+        self.directorio = "facturas"
+        self.workers = 0
+        self.lote = 100
+        self.ttl = 24 * 3600.0
+        self.empresa = Empresa("Vivero", "", "", 1)
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._pool: ProcessPoolExecutor | None = None
+
+    def iniciar(self, ids: list[int]) -> dict:
+        """Start a batch job for ``ids`` and return its initial state."""
+
+        self.limpiar()
+        ident = uuid.uuid4().hex
+        os.makedirs(self._carpeta(ident), exist_ok=True)
+        estado = {
+            "id": ident,
+            "proceso": _proceso(),
+            "estado": "en_curso",
+            "total": len(ids),
+            "generadas": 0,
+            "errores": 0,
+            "inicio": datetime.utcnow().isoformat(),
+            "fin": None,
+        }
+        self._guardar(estado)
+        threading.Thread(
+            target=self._ejecutar, args=(estado, ids), name=f"facturas-{ident[:8]}", daemon=True
+        ).start()
+        return _publico(estado)
+
+    def estado(self, ident: str) -> dict | None:
+        estado = self._leer(self._ruta_estado(ident))
+        return _publico(estado) if estado is not None else None
+
+    def limpiar(self) -> None:
+        """Delete jobs that ended more than ``ttl`` seconds ago and fail orphaned ones.
+
+        A job is orphaned when the process running it is gone: its pid no
+        longer exists on this host, or its state file has not been touched
+        for ``ABANDONO_SEGUNDOS`` (which also covers other hosts and reused
+        pids).
+        """
+
+        try:
+            nombres = os.listdir(self.directorio)
+        except FileNotFoundError:
+            return
+        ahora = time.time()
+        for nombre in nombres:
+            if not (nombre.startswith("lote-") and nombre.endswith(".json")):
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            estado = self._leer(ruta)
+            try:
+                edad = ahora - os.path.getmtime(ruta)
+            except FileNotFoundError:
+                continue
+            if estado is None:
+                continue
+            if estado["estado"] == "en_curso":
+                if _huerfano(estado.get("proceso"), edad):
+                    logger.warning("Lote de facturas %s abandonado; se marca error", estado["id"])
+                    shutil.rmtree(self._carpeta(estado["id"]), ignore_errors=True)
+                    estado.update(estado="error", fin=datetime.utcnow().isoformat())
+                    self._guardar(estado)
+            elif edad > self.ttl:
+                for ruta_lote in (self.ruta_archivo(estado["id"]), ruta):
+                    try:
+                        os.remove(ruta_lote)
+                    except FileNotFoundError:
+                        pass
+
+    def ruta_archivo(self, ident: str) -> str:
+        return os.path.join(self.directorio, f"lote-{_validar_ident(ident)}.zip")
+
+    def _ejecutar(self, estado: dict, ids: list[int]) -> None:
+        carpeta = self._carpeta(estado["id"])
+        en_vuelo: dict[Future, tuple[int, ProcessPoolExecutor]] = {}
+        # Bounds the invoices held in memory while the workers catch up.
+        limite = 2 * self._max_workers()
+        try:
+            for inicio in range(0, len(ids), self.lote):
+                parte = ids[inicio : inicio + self.lote]
+                with get_session() as session:
+                    facturas = cargar_facturas(session, parte)
+                # Sales deleted since the job was requested.
+                estado["errores"] += len(parte) - len(facturas)
+                while len(en_vuelo) >= limite:
+                    self._recoger(estado, en_vuelo)
+                pool = self._obtener_pool()
+                futuro = pool.submit(renderizar_lote, carpeta, facturas, self.empresa)
+                en_vuelo[futuro] = (len(facturas), pool)
+            while en_vuelo:
+                self._recoger(estado, en_vuelo)
+            _empaquetar(carpeta, self.ruta_archivo(estado["id"]))
+            estado["estado"] = "terminado"
+        except Exception:
+            logger.exception("Falló el lote de facturas %s", estado["id"])
+            estado["estado"] = "error"
+        finally:
+            SessionLocal.remove()
+            shutil.rmtree(carpeta, ignore_errors=True)
+            estado["fin"] = datetime.utcnow().isoformat()
+            self._guardar(estado)
+
+    def _recoger(
+        self, estado: dict, en_vuelo: dict[Future, tuple[int, ProcessPoolExecutor]]
+    ) -> None:
+        hechos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+        for futuro in hechos:
+            cantidad, pool = en_vuelo.pop(futuro)
+            try:
+                estado["generadas"] += futuro.result()
+            except Exception as exc:
+                logger.exception("No se pudieron generar %d factura(s)", cantidad)
+                estado["errores"] += cantidad
+                if isinstance(exc, BrokenProcessPool):
+                    # A worker died (e.g. OOM-killed); start over with a fresh pool.
+                    self._descartar_pool(pool)
+        self._guardar(estado)
+
+    def _descartar_pool(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        # Reaps the surviving workers; other jobs may have replaced it already.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # Spawned, not forked: the web process runs threads of its own.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self._max_workers(),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def _max_workers(self) -> int:
+        return self.workers or os.cpu_count() or 1
+
+    def _carpeta(self, ident: str) -> str:
+        return os.path.join(self.directorio, f"lote-{_validar_ident(ident)}")
+
+    def _ruta_estado(self, ident: str) -> str:
+        return os.path.join(self.directorio, f"lote-{_validar_ident(ident)}.json")
+
+    def _leer(self, ruta: str) -> dict | None:
+        try:
+            with open(ruta, encoding="utf-8") as archivo:
+                return json.load(archivo)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _guardar(self, estado: dict) -> None:
+        ruta = self._ruta_estado(estado["id"])
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(estado, archivo)
+        os.replace(temporal, ruta)
+
+
+def _proceso() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _huerfano(proceso: str | None, edad: float) -> bool:
+    if edad > ABANDONO_SEGUNDOS:
+        return True
+    host, _, pid = (proceso or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _publico(estado: dict) -> dict:
+    return {clave: valor for clave, valor in estado.items() if clave != "proceso"}
+
+
+def _validar_ident(ident: str) -> str:
+    """Job ids become file names, so only our own uuid4 hex strings are accepted."""
+
+    try:
+        if uuid.UUID(hex=ident).hex == ident:
+            return ident
+    except ValueError:
+        pass
+    raise ValueError("lote inválido")
+
+
+def _empaquetar(carpeta: str, destino: str) -> None:
+    temporal = destino + ".tmp"
+    # PDF streams are already deflated; storing is as small and much faster.
+    with zipfile.ZipFile(temporal, "w", zipfile.ZIP_STORED) as archivo:
+        for nombre in sorted(os.listdir(carpeta)):
+            archivo.write(os.path.join(carpeta, nombre), nombre)
+    os.replace(temporal, destino)
+
+
+def _texto(x: float, y: float, texto: str, fuente: str = "F1", tam: int = 10) -> bytes:
+    return b"BT /%s %d Tf %.2f %.2f Td (%s) Tj ET\n" % (
+        fuente.encode(),
+        tam,
+        x,
+        y,
+        _escapar(texto),
+    )
+
+
+def _derecha(x: float, y: float, texto: str, fuente: str = "F1", tam: int = 10) -> bytes:
+    """``texto`` right-aligned at ``x``; meant for amounts, whose widths are known."""
+
+    ancho = sum(ANCHOS_HELVETICA.get(caracter, 556) for caracter in texto) * tam / 1000
+    return _texto(x - ancho, y, texto, fuente, tam)
+
+
+def _escapar(texto: str) -> bytes:
+    crudo = texto.encode("cp1252", "replace")
+    return crudo.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _moneda(valor) -> str:
+    formateado = f"{Decimal(valor):,.2f}"
+    return "$ " + formateado.replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def _recortar(texto: str) -> str:
+    return texto if len(texto) <= MAX_DESCRIPCION else texto[: MAX_DESCRIPCION - 1] + "…"
+
+
+@lru_cache(maxsize=8)
+def _membrete(empresa: Empresa) -> bytes:
+    return b"".join(
+        (
+            _texto(50, 792, empresa.nombre, "F2", 16),
+            _texto(50, 774, f"CUIT: {empresa.cuit}" if empresa.cuit else ""),
+            _texto(50, 760, empresa.direccion),
+            b"0.5 w 50 750 m 545 750 l S\n",
+        )
+    )
+
+
+_ENCABEZADO_TABLA = b"".join(
+    (
+        _derecha(90, 690, "Cant.", "F2"),
+        _texto(100, 690, "Descripción", "F2"),
+        _derecha(460, 690, "P. unitario", "F2"),
+        _derecha(545, 690, "Subtotal", "F2"),
+        b"50 684 m 545 684 l S\n",
+    )
+)
+
+_FUENTES = (
+    b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+)
+
+
+def _documento(contenidos: list[bytes]) -> bytes:
+    """Assemble a PDF 1.4 file; page ``i`` is object ``5 + 2i``, its stream the next one."""
+
+    kids = " ".join(f"{5 + 2 * i} 0 R" for i in range(len(contenidos)))
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(contenidos)} >>".encode(),
+        *_FUENTES,
+    ]
+    for i, contenido in enumerate(contenidos):
+        objetos.append(
+            (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {ANCHO} {ALTO}] "
+                f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {6 + 2 * i} 0 R >>"
+            ).encode()
+        )
+        datos = zlib.compress(contenido)
+        objetos.append(
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(datos), datos)
+        )
+
+    salida = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    posiciones = []
+    for numero, objeto in enumerate(objetos, 1):
+        posiciones.append(len(salida))
+        salida += b"%d 0 obj\n%s\nendobj\n" % (numero, objeto)
+    xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    for posicion in posiciones:
+        salida += b"%010d 00000 n \n" % posicion
+    salida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objetos) + 1,
+        xref,
+    )
+    return bytes(salida)
+
+
+generador_facturas = GeneradorFacturas()
@@ -0,0 +1,671 @@
+"""Streaming catalog import from CSV or XLSX files.
+
+Rows are read one at a time and processed in chunks of ``IMPORT_CHUNK``;
+each chunk is validated, resolved against the catalog and written in its
+own transaction with a handful of multi-row statements, so memory depends
+on the chunk size and not on the file size. Categories, suppliers,
+attribute options and products already seen are kept in
+:class:`Resolutor` caches across chunks.
+
+Expected columns (header names are case-insensitive)::
+
+    producto, descripcion, categoria, proveedor, sku, codigo_barras,
+    precio_compra, precio_venta, stock_minimo, attr:<slug atributo>...
+
+``sku`` identifies the variant: existing SKUs are updated, new ones are
+created. Variants are grouped under the product with the same ``producto``
+name, which is created when missing. Missing categories, suppliers and
+options of ``opcion`` attributes are created too; unknown columns reject the
+whole file before anything is written. Empty cells leave the stored value
+untouched.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import IO, Iterable, Iterator, Mapping
+
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from .alertas import evaluar_alertas
+from .busqueda import normalizar
+from .db import get_session, upsert_insert
+from .invalidation import mark_changed
+from .models import (
+    Atributo,
+    AtributoOpcion,
+    Categoria,
+    Producto,
+    ProductoVariante,
+    Proveedor,
+    VarianteValor,
+)
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK = 1000
+PREFIJO_ATRIBUTO = "attr:"
+COLUMNAS = {
+    "producto",
+    "descripcion",
+    "categoria",
+    "proveedor",
+    "sku",
+    "codigo_barras",
+    "precio_compra",
+    "precio_venta",
+    "stock_minimo",
+}
+# Every new product gets the same keys so the insert runs as one executemany.
+PRODUCTO_VACIO = {
+    "descripcion": None,
+    "preciocompra": None,
+    "precioventa": None,
+    "idcategoria": None,
+    "idproveedor": None,
+    "estado": True,
+}
+VERDADEROS = {"1", "true", "si", "sí", "yes", "x"}
+FALSOS = {"0", "false", "no", ""}
+
+
+class ErrorImportacion(ValueError):
+    """The file as a whole cannot be imported (format, header, unknown attribute)."""
+
+
+@dataclass
+class Fila:
+    numero: int
+    producto: str
+    sku: str
+    descripcion: str | None = None
+    categoria: str | None = None
+    proveedor: str | None = None
+    codigo_barras: str | None = None
+    precio_compra: Decimal | None = None
+    precio_venta: Decimal | None = None
+    stock_minimo: int | None = None
+    atributos: dict[str, str] = field(default_factory=dict)
+
+
+def leer_archivo(stream: IO[bytes], nombre: str) -> tuple[list[str], Iterator[tuple[int, dict]]]:
+    """Read the header of a CSV or XLSX stream.
+
+    Returns the normalized column names and a lazy iterator of
+    ``(row number, {column: value})``; blank rows are skipped.
+    """
+
+    extension = nombre.rsplit(".", 1)[-1].lower() if "." in nombre else ""
+    if extension in ("csv", "txt"):
+        filas = _leer_csv(stream)
+    elif extension == "xlsx":
+        filas = _leer_xlsx(stream)
+    else:
+        raise ErrorImportacion("formato no soportado; usá CSV o XLSX")
+
+    encabezado = next(filas, None)
+    if not encabezado or not any(encabezado):
+        raise ErrorImportacion("el archivo está vacío")
+    columnas = [columna.strip().lower() for columna in encabezado]
+    faltantes = {"producto", "sku"} - set(columnas)
+    if faltantes:
+        raise ErrorImportacion(f"faltan columnas obligatorias: {', '.join(sorted(faltantes))}")
+
+    def registros() -> Iterator[tuple[int, dict]]:
+        for numero, valores in enumerate(filas, start=2):
+            if any(valor.strip() for valor in valores):
+                yield numero, dict(zip(columnas, valores))
+
+    return columnas, registros()
+
+
+def _leer_csv(stream: IO[bytes]) -> Iterator[list[str]]:
+    texto = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        muestra = texto.read(8192)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+        except csv.Error:
+            dialecto = csv.excel
+        yield from csv.reader(texto, dialecto)
+    except UnicodeDecodeError:
+        raise ErrorImportacion("el CSV debe estar codificado en UTF-8") from None
+
+
+def _leer_xlsx(stream: IO[bytes]) -> Iterator[list[str]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:  # pragma: no cover - optional dependency
+        raise ErrorImportacion("para importar XLSX hace falta instalar openpyxl") from None
+
+    libro = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for celdas in libro.active.iter_rows(values_only=True):
+            yield ["" if celda is None else str(celda) for celda in celdas]
+    finally:
+        libro.close()
+
+
+def validar_columnas(columnas: list[str], atributos: Mapping[str, tuple[int, str]]) -> None:
+    """Reject unknown columns before any row is written."""
+
+    desconocidas = []
+    for columna in columnas:
+        if columna.startswith(PREFIJO_ATRIBUTO):
+            if columna[len(PREFIJO_ATRIBUTO) :].strip() not in atributos:
+                desconocidas.append(columna)
+        elif columna and columna not in COLUMNAS:
+            desconocidas.append(columna)
+    if desconocidas:
+        raise ErrorImportacion(f"columnas desconocidas: {', '.join(desconocidas)}")
+
+
+class Resolutor:
+    """Name -> id caches shared by every chunk of one import.
+
+    Ids created by a chunk are only kept once its transaction commits;
+    :meth:`descartar` forgets them when the chunk is rolled back.
+    """
+
+    def __init__(self, session: Session) -> None:
+        self.atributos: dict[str, tuple[int, str]] = {
+            slug: (idatributo, tipo_dato)
+            for idatributo, slug, tipo_dato in session.execute(
+                select(Atributo.idatributo, Atributo.slug, Atributo.tipo_dato)
+            )
+        }
+        self._categorias: dict[str, int] = {}
+        self._proveedores: dict[str, int] = {}
+        self._opciones: dict[tuple[int, str], int] = {}
+        self._productos: dict[str, int] = {}
+        self._pendientes: list[tuple[dict, object]] = []
+
+    def confirmar(self) -> None:
+        self._pendientes.clear()
+
+    def descartar(self) -> None:
+        for cache, clave in self._pendientes:
+            cache.pop(clave, None)
+        self._pendientes.clear()
+
+    def categorias(self, session: Session, nombres: set[str]) -> dict[str, int]:
+        claves = {slugify(nombre): nombre for nombre in nombres}
+        faltan = [slug for slug in claves if slug not in self._categorias]
+        if faltan:
+            for idcategoria, slug in session.execute(
+                select(Categoria.idcategoria, Categoria.slug).where(Categoria.slug.in_(faltan))
+            ):
+                self._categorias[slug] = idcategoria
+            nuevas = [slug for slug in faltan if slug not in self._categorias]
+            if nuevas:
+                creadas = session.execute(
+                    insert(Categoria).returning(Categoria.idcategoria, Categoria.slug),
+                    [{"nombre": claves[slug], "slug": slug, "estado": True} for slug in nuevas],
+                )
+                ids = []
+                for idcategoria, slug in creadas:
+                    self._crear(self._categorias, slug, idcategoria)
+                    ids.append(idcategoria)
+                mark_changed(session, Categoria.__tablename__, ids)
+        # Every spelling that shares a slug resolves to the same category.
+        return {nombre: self._categorias[slugify(nombre)] for nombre in nombres}
+
+    def proveedores(self, session: Session, nombres: set[str]) -> dict[str, int]:
+        claves = {nombre.strip().lower(): nombre for nombre in nombres}
+        faltan = [clave for clave in claves if clave not in self._proveedores]
+        if faltan:
+            for idproveedor, clave in session.execute(
+                select(Proveedor.idproveedor, func.lower(Proveedor.nombre))
+                .where(func.lower(Proveedor.nombre).in_(faltan))
+                .order_by(Proveedor.idproveedor.desc())
+            ):
+                self._proveedores[clave] = idproveedor
+            nuevos = [clave for clave in faltan if clave not in self._proveedores]
+            if nuevos:
+                creados = session.execute(
+                    insert(Proveedor).returning(
+                        Proveedor.idproveedor, Proveedor.nombre, sort_by_parameter_order=True
+                    ),
+                    [{"nombre": claves[clave], "estado": True} for clave in nuevos],
+                )
+                for idproveedor, nombre in creados:
+                    self._crear(self._proveedores, nombre.strip().lower(), idproveedor)
+        return {nombre: self._proveedores[nombre.strip().lower()] for nombre in nombres}
+
+    def opciones(self, session: Session, valores: set[tuple[int, str]]) -> dict[tuple, int]:
+        claves = {(idatributo, slugify(valor)): valor for idatributo, valor in valores}
+        faltan = [clave for clave in claves if clave not in self._opciones]
+        if faltan:
+            atributos = {idatributo for idatributo, _ in faltan}
+            for idopcion, idatributo, slug in session.execute(
+                select(AtributoOpcion.idopcion, AtributoOpcion.idatributo, AtributoOpcion.slug)
+                .where(AtributoOpcion.idatributo.in_(atributos))
+                .order_by(AtributoOpcion.idopcion.desc())
+            ):
+                self._opciones[(idatributo, slug)] = idopcion
+            nuevas = [clave for clave in faltan if clave not in self._opciones]
+            if nuevas:
+                creadas = session.execute(
+                    insert(AtributoOpcion).returning(
+                        AtributoOpcion.idopcion,
+                        AtributoOpcion.idatributo,
+                        AtributoOpcion.slug,
+                    ),
+                    [
+                        {
+                            "idatributo": idatributo,
+                            "valor": claves[(idatributo, slug)],
+                            "slug": slug,
+                            "orden": 0,
+                            "activo": True,
+                        }
+                        for idatributo, slug in nuevas
+                    ],
+                )
+                ids = []
+                for idopcion, idatributo, slug in creadas:
+                    self._crear(self._opciones, (idatributo, slug), idopcion)
+                    ids.append(idopcion)
+                mark_changed(session, AtributoOpcion.__tablename__, ids)
+        return {
+            (idatributo, valor): self._opciones[(idatributo, slugify(valor))]
+            for idatributo, valor in valores
+        }
+
+    def productos(self, session: Session, nombres: set[str]) -> dict[str, int]:
+        """Existing product ids by exact name (the oldest one on duplicates)."""
+
+        faltan = [nombre for nombre in nombres if nombre not in self._productos]
+        if faltan:
+            for idproducto, nombre in session.execute(
+                select(Producto.idproducto, Producto.nombre)
+                .where(Producto.nombre.in_(faltan))
+                .order_by(Producto.idproducto.desc())
+            ):
+                self._productos[nombre] = idproducto
+        return {nombre: self._productos[nombre] for nombre in nombres if nombre in self._productos}
+
+    def registrar_producto(self, nombre: str, idproducto: int) -> None:
+        self._crear(self._productos, nombre, idproducto)
+
+    def _crear(self, cache: dict, clave, valor: int) -> None:
+        cache[clave] = valor
+        self._pendientes.append((cache, clave))
+
+
+def importar(
+    filas: Iterable[tuple[int, dict]], resolutor: Resolutor, *, chunk: int = IMPORT_CHUNK
+) -> Iterator[dict]:
+    """Import ``filas`` chunk by chunk, yielding one progress report per chunk.
+
+    The last item is a ``{"tipo": "resumen", ...}`` with the totals. A chunk
+    that fails in the database is rolled back and reported as errors for
+    all of its rows; the import then carries on with the next chunk. Any
+    other failure is retried row by row, so only the rows that cause it are
+    reported.
+    """
+
+    totales: Counter[str] = Counter(filas=0, errores=0)
+    for lote in _lotes(filas, chunk):
+        validas: list[Fila] = []
+        errores: list[dict] = []
+        for numero, datos in lote:
+            try:
+                validas.append(parse_fila(numero, datos, resolutor.atributos))
+            except ValueError as exc:
+                errores.append({"fila": numero, "error": str(exc)})
+            except Exception as exc:
+                logger.exception("Error inesperado validando la fila %d", numero)
+                errores.append({"fila": numero, "error": _error_interno(exc)})
+
+        conteo: Counter[str] = Counter()
+        if validas:
+            try:
+                conteo, errores_lote = _escribir_lote(validas, resolutor)
+                errores.extend(errores_lote)
+            except SQLAlchemyError as exc:
+                mensaje = str(getattr(exc, "orig", None) or exc).splitlines()[0]
+                errores.extend(
+                    {"fila": fila.numero, "error": f"error de base de datos: {mensaje}"}
+                    for fila in validas
+                )
+            except Exception:
+                logger.exception(
+                    "Error inesperado importando el lote desde la fila %d", validas[0].numero
+                )
+                for fila in validas:
+                    try:
+                        conteo_fila, errores_fila = _escribir_lote([fila], resolutor)
+                    except Exception as exc:
+                        errores.append({"fila": fila.numero, "error": _error_interno(exc)})
+                    else:
+                        conteo.update(conteo_fila)
+                        errores.extend(errores_fila)
+
+        totales["filas"] += len(lote)
+        totales["errores"] += len(errores)
+        totales.update(conteo)
+        errores.sort(key=lambda error: error["fila"])
+        yield {"tipo": "progreso", **totales, "errores_lote": errores}
+
+    yield {"tipo": "resumen", **totales}
+
+
+def _escribir_lote(filas: list[Fila], resolutor: Resolutor) -> tuple[Counter[str], list[dict]]:
+    """Run :func:`importar_lote` in its own transaction, keeping the caches in step."""
+
+    try:
+        with get_session() as session:
+            resultado = importar_lote(session, filas, resolutor)
+    except Exception:
+        resolutor.descartar()
+        raise
+    resolutor.confirmar()
+    return resultado
+
+
+def _error_interno(exc: Exception) -> str:
+    if isinstance(exc, SQLAlchemyError):
+        mensaje = str(getattr(exc, "orig", None) or exc).splitlines()[0]
+        return f"error de base de datos: {mensaje}"
+    return f"error interno ({type(exc).__name__})"
+
+
+def importar_lote(
+    session: Session, filas: list[Fila], resolutor: Resolutor
+) -> tuple[Counter[str], list[dict]]:
+    """Write one chunk of validated rows; returns counters and row errors."""
+
+    errores: list[dict] = []
+    conteo: Counter[str] = Counter()
+
+    # A SKU repeated inside the chunk would hit ON CONFLICT twice: last row wins.
+    ultimas: dict[str, Fila] = {}
+    for fila in filas:
+        if fila.sku in ultimas:
+            errores.append(
+                {"fila": ultimas[fila.sku].numero, "error": "sku repetido más adelante"}
+            )
+        ultimas[fila.sku] = fila
+    filas = list(ultimas.values())
+
+    barcodes = {fila.codigo_barras for fila in filas if fila.codigo_barras}
+    existentes: dict[str, int] = {}
+    duenos_barcode: dict[str, str] = {}
+    condicion = ProductoVariante.sku.in_(ultimas)
+    if barcodes:
+        condicion = or_(condicion, ProductoVariante.codigo_barras.in_(barcodes))
+    for idvariante, sku, codigo in session.execute(
+        select(ProductoVariante.idvariante, ProductoVariante.sku, ProductoVariante.codigo_barras)
+        .where(condicion)
+    ):
+        if sku in ultimas:
+            existentes[sku] = idvariante
+        if codigo:
+            duenos_barcode[codigo] = sku
+    vistos: dict[str, str] = {}
+    validas = []
+    for fila in filas:
+        codigo = fila.codigo_barras
+        if codigo and (
+            duenos_barcode.get(codigo, fila.sku) != fila.sku
+            or vistos.get(codigo, fila.sku) != fila.sku
+        ):
+            errores.append({"fila": fila.numero, "error": "codigo_barras ya usado por otro sku"})
+            continue
+        if codigo:
+            vistos[codigo] = fila.sku
+        validas.append(fila)
+    filas = validas
+    if not filas:
+        return conteo, errores
+
+    categorias = resolutor.categorias(session, {f.categoria for f in filas if f.categoria})
+    proveedores = resolutor.proveedores(session, {f.proveedor for f in filas if f.proveedor})
+
+    # Product columns are merged over the product's rows; later values win.
+    por_producto: dict[str, dict] = {}
+    for fila in filas:
+        datos = por_producto.setdefault(fila.producto, {"nombre": fila.producto})
+        if fila.descripcion is not None:
+            datos["descripcion"] = fila.descripcion
+        if fila.precio_compra is not None:
+            datos["preciocompra"] = fila.precio_compra
+        if fila.precio_venta is not None:
+            datos["precioventa"] = fila.precio_venta
+        if fila.categoria:
+            datos["idcategoria"] = categorias[fila.categoria]
+        if fila.proveedor:
+            datos["idproveedor"] = proveedores[fila.proveedor]
+    productos = resolutor.productos(session, set(por_producto))
+
+    nuevos = [nombre for nombre in por_producto if nombre not in productos]
+    nombres_nuevos = set(nuevos)
+    if nuevos:
+        creados = session.execute(
+            insert(Producto).returning(
+                Producto.idproducto, Producto.nombre, sort_by_parameter_order=True
+            ),
+            [{**PRODUCTO_VACIO, **por_producto[nombre]} for nombre in nuevos],
+        )
+        for idproducto, nombre in creados:
+            productos[nombre] = idproducto
+            resolutor.registrar_producto(nombre, idproducto)
+        conteo["productos_creados"] += len(nuevos)
+    actualizar = [
+        {"idproducto": productos[nombre], **datos}
+        for nombre, datos in por_producto.items()
+        if nombre not in nombres_nuevos
+    ]
+    # ORM bulk UPDATE by primary key needs the same keys in every row.
+    for grupo in _agrupar_por_claves(actualizar):
+        session.execute(update(Producto), grupo)
+    conteo["productos_actualizados"] += len(actualizar)
+
+    ahora = datetime.utcnow()
+    registros = [
+        {
+            "idproducto": productos[fila.producto],
+            "sku": fila.sku,
+            "codigo_barras": fila.codigo_barras,
+            "precio_compra": fila.precio_compra,
+            "precio_venta": fila.precio_venta,
+            "stock_minimo": fila.stock_minimo or 0,
+            "estado": True,
+            "fecha_creacion": ahora,
+        }
+        for fila in filas
+    ]
+    # Executemany rather than one big VALUES: the statement compiles once and
+    # is cached, and the driver batches the rows (insertmanyvalues).
+    # stock_minimo is NOT NULL, so a blank cell cannot travel as NULL for a
+    # coalesce: those rows use a statement that leaves the column out of the
+    # update, keeping the current minimum (new rows get 0).
+    variantes: dict[str, int] = {}
+    for con_minimo in (True, False):
+        grupo = [
+            registro
+            for registro, fila in zip(registros, filas)
+            if (fila.stock_minimo is not None) == con_minimo
+        ]
+        if not grupo:
+            continue
+        stmt = upsert_insert(session, ProductoVariante)
+        actualizar_variante = {
+            "idproducto": stmt.excluded.idproducto,
+            "codigo_barras": func.coalesce(
+                stmt.excluded.codigo_barras, ProductoVariante.codigo_barras
+            ),
+            "precio_compra": func.coalesce(
+                stmt.excluded.precio_compra, ProductoVariante.precio_compra
+            ),
+            "precio_venta": func.coalesce(
+                stmt.excluded.precio_venta, ProductoVariante.precio_venta
+            ),
+        }
+        if con_minimo:
+            actualizar_variante["stock_minimo"] = stmt.excluded.stock_minimo
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ProductoVariante.sku], set_=actualizar_variante
+        ).returning(ProductoVariante.idvariante, ProductoVariante.sku)
+        variantes.update((sku, idvariante) for idvariante, sku in session.execute(stmt, grupo))
+    conteo["variantes_actualizadas"] += len(existentes)
+    conteo["variantes_creadas"] += len(variantes) - len(existentes)
+
+    valores = _valores(session, filas, variantes, resolutor)
+    if valores:
+        stmt = upsert_insert(session, VarianteValor)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[VarianteValor.idvariante, VarianteValor.idatributo],
+            set_={
+                "valor_texto": stmt.excluded.valor_texto,
+                "valor_numero": stmt.excluded.valor_numero,
+                "valor_booleano": stmt.excluded.valor_booleano,
+                "idopcion": stmt.excluded.idopcion,
+            },
+        )
+        session.execute(stmt, valores)
+
+    ids_variantes = set(variantes.values())
+    mark_changed(session, Producto.__tablename__, productos.values())
+    mark_changed(session, ProductoVariante.__tablename__, ids_variantes)
+    mark_changed(session, VarianteValor.__tablename__, {v["idvariante"] for v in valores})
+    evaluar_alertas(session, ids_variantes)
+    return conteo, errores
+
+
+def _valores(
+    session: Session, filas: list[Fila], variantes: dict[str, int], resolutor: Resolutor
+) -> list[dict]:
+    opciones_pedidas = {
+        (resolutor.atributos[slug][0], valor)
+        for fila in filas
+        for slug, valor in fila.atributos.items()
+        if resolutor.atributos[slug][1] == "opcion"
+    }
+    opciones = resolutor.opciones(session, opciones_pedidas) if opciones_pedidas else {}
+
+    valores = []
+    for fila in filas:
+        for slug, valor in fila.atributos.items():
+            idatributo, tipo = resolutor.atributos[slug]
+            registro = {
+                "idvariante": variantes[fila.sku],
+                "idatributo": idatributo,
+                "valor_texto": None,
+                "valor_numero": None,
+                "valor_booleano": None,
+                "idopcion": None,
+            }
+            if tipo == "opcion":
+                registro["valor_texto"] = valor
+                registro["idopcion"] = opciones[(idatributo, valor)]
+            elif tipo == "numero":
+                registro["valor_numero"] = parse_decimal(valor, slug)
+            elif tipo == "booleano":
+                registro["valor_booleano"] = parse_booleano(valor, slug)
+            else:
+                registro["valor_texto"] = valor
+            valores.append(registro)
+    return valores
+
+
+def parse_fila(numero: int, datos: dict, atributos: dict[str, tuple[int, str]]) -> Fila:
+    """Validate one raw row; raises ``ValueError`` with a message for the report."""
+
+    def texto(columna: str) -> str | None:
+        valor = (datos.get(columna) or "").strip()
+        return valor or None
+
+    producto = texto("producto")
+    sku = texto("sku")
+    if not producto:
+        raise ValueError("producto es obligatorio")
+    if not sku:
+        raise ValueError("sku es obligatorio")
+
+    fila = Fila(
+        numero=numero,
+        producto=producto,
+        sku=sku,
+        descripcion=texto("descripcion"),
+        categoria=texto("categoria"),
+        proveedor=texto("proveedor"),
+        codigo_barras=texto("codigo_barras"),
+    )
+    for columna in ("precio_compra", "precio_venta"):
+        if texto(columna):
+            setattr(fila, columna, parse_decimal(texto(columna), columna))
+    if texto("stock_minimo"):
+        try:
+            fila.stock_minimo = int(parse_decimal(texto("stock_minimo"), "stock_minimo"))
+        except (ValueError, ArithmeticError):
+            raise ValueError("stock_minimo debe ser un entero") from None
+
+    for columna, valor in datos.items():
+        if not columna.startswith(PREFIJO_ATRIBUTO):
+            continue
+        slug = columna[len(PREFIJO_ATRIBUTO) :].strip()
+        valor = (valor or "").strip()
+        if valor:
+            _, tipo = atributos[slug]
+            if tipo == "numero":
+                parse_decimal(valor, slug)
+            elif tipo == "booleano":
+                parse_booleano(valor, slug)
+            fila.atributos[slug] = valor
+    return fila
+
+
+def parse_decimal(valor: str, nombre: str) -> Decimal:
+    """Accept ``1234.5``, ``1234,5`` and ``1.234,5``."""
+
+    valor = valor.strip().replace(" ", "")
+    if "," in valor:
+        valor = valor.replace(".", "").replace(",", ".")
+    try:
+        numero = Decimal(valor)
+    except InvalidOperation:
+        raise ValueError(f"{nombre} debe ser un número") from None
+    if not numero.is_finite():
+        raise ValueError(f"{nombre} debe ser un número")
+    return numero
+
+
+def parse_booleano(valor: str, nombre: str) -> bool:
+    valor = valor.strip().lower()
+    if valor in VERDADEROS:
+        return True
+    if valor in FALSOS:
+        return False
+    raise ValueError(f"{nombre} debe ser sí o no")
+
+
+def slugify(texto: str) -> str:
+    return normalizar(texto).replace(" ", "-")
+
+
+def _lotes(filas: Iterable, tamano: int) -> Iterator[list]:
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _agrupar_por_claves(filas: list[dict]) -> Iterable[list[dict]]:
+    grupos: dict[frozenset, list[dict]] = {}
+    for fila in filas:
+        grupos.setdefault(frozenset(fila), []).append(fila)
+    return grupos.values()
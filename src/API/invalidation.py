@@ -0,0 +1,114 @@
+"""Post-commit change notifications used to invalidate in-process caches.
+
+ORM writes to the tracked tables are collected on flush and published once
+the transaction commits; rolled back transactions publish nothing. Core
+statements that bypass the unit of work (bulk inserts, upserts) must report
+what they touched with :func:`mark_changed`.
+
+Changes committed by other processes arrive through :mod:`.pubsub`; when
+some may have been missed, :func:`reset` tells every cache to start over.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from itertools import chain
+from typing import Callable, Iterable, Mapping
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .models import (
+    Atributo,
+    AtributoOpcion,
+    Categoria,
+    MovimientoStock,
+    Producto,
+    ProductoVariante,
+    StockVariante,
+    VarianteValor,
+)
+
+logger = logging.getLogger(__name__)
+
+Changes = Mapping[str, set[int]]
+
+# Mapped class -> attribute holding the id reported for that table.
+TRACKED = {
+    Atributo: "idatributo",
+    AtributoOpcion: "idopcion",
+    Categoria: "idcategoria",
+    Producto: "idproducto",
+    ProductoVariante: "idvariante",
+    VarianteValor: "idvariante",
+    MovimientoStock: "idvariante",
+    StockVariante: "idvariante",
+}
+
+_SESSION_KEY = "pending_changes"
+_subscribers: list[Callable[[Changes], None]] = []
+_resets: list[Callable[[], None]] = []
+
+
+def subscribe(
+    callback: Callable[[Changes], None], on_reset: Callable[[], None] | None = None
+) -> Callable[[Changes], None]:
+    """Register ``callback`` to receive ``{table: ids}`` after every commit.
+
+    ``on_reset`` is called instead when changes may have been lost, and must
+    drop everything derived from the database.
+    """
+
+    _subscribers.append(callback)
+    if on_reset is not None:
+        _resets.append(on_reset)
+    return callback
+
+
+def mark_changed(session: Session, table: str, ids: Iterable[int]) -> None:
+    """Record that ``ids`` of ``table`` were written in the current transaction."""
+
+    pending = session.info.setdefault(_SESSION_KEY, defaultdict(set))
+    pending[table].update(ids)
+
+
+def pending_changes(session: Session) -> Changes:
+    """Changes recorded so far in the current transaction (flush first for ORM ones)."""
+
+    return session.info.get(_SESSION_KEY, {})
+
+
+def publish(changes: Changes) -> None:
+    for callback in list(_subscribers):
+        try:
+            callback(changes)
+        except Exception:  # pragma: no cover - a broken cache must not fail the write
+            logger.exception("Invalidation subscriber %r failed", callback)
+
+
+def reset() -> None:
+    for callback in list(_resets):
+        try:
+            callback()
+        except Exception:  # pragma: no cover - same as publish
+            logger.exception("Invalidation reset %r failed", callback)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session: Session, flush_context) -> None:
+    for obj in chain(session.new, session.dirty, session.deleted):
+        attr = TRACKED.get(type(obj))
+        if attr is not None:
+            mark_changed(session, obj.__tablename__, [getattr(obj, attr)])
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session: Session) -> None:
+    changes = session.info.pop(_SESSION_KEY, None)
+    if changes:
+        publish(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
@@ -0,0 +1,198 @@
+"""Stock card (kardex) queries over the movement ledger.
+
+The running balance is computed by the database with a window function, so
+neither a page nor a full export ever needs the variant's history in Python.
+Pages are keyed on ``(fecha, idmovimiento)`` and the cursor carries the
+balance reached so far, which lets the next page start its window sum from
+there instead of re-reading everything before it.
+"""
+from __future__ import annotations
+
+import base64
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from typing import Iterable, Iterator
+
+from sqlalchemy import Select, func, literal, select, tuple_
+from sqlalchemy.orm import Session
+
+from .catalog import parse_int
+from .models import MovimientoStock
+from .stock import delta_expr
+
+EXPORT_CHUNK = 1000
+
+COLUMNAS = (
+    "idmovimiento",
+    "fecha",
+    "tipo",
+    "cantidad",
+    "delta",
+    "saldo",
+    "referencia_tipo",
+    "referencia_id",
+    "descripcion",
+    "idempleado",
+)
+
+Cursor = tuple[datetime, int, int]
+
+
+def filtros_kardex(args) -> tuple[int, list, datetime | None]:
+    """Parse ``idvariante``, ``desde`` and ``hasta``; raises ``ValueError``.
+
+    Returns the variant id, the WHERE clauses and the lower date bound. A
+    date-only ``hasta`` includes that whole day.
+    """
+
+    if not args.get("idvariante"):
+        raise ValueError("idvariante es obligatorio")
+    idvariante = parse_int(args["idvariante"], "idvariante")
+
+    filtros = [MovimientoStock.idvariante == idvariante]
+    desde = parse_fecha(args["desde"], "desde") if args.get("desde") else None
+    if desde is not None:
+        filtros.append(MovimientoStock.fecha >= desde)
+    if args.get("hasta"):
+        hasta = parse_fecha(args["hasta"], "hasta")
+        if len(args["hasta"].strip()) == 10:
+            filtros.append(MovimientoStock.fecha < hasta + timedelta(days=1))
+        else:
+            filtros.append(MovimientoStock.fecha <= hasta)
+    return idvariante, filtros, desde
+
+
+def saldo_inicial(session: Session, idvariante: int, desde: datetime | None) -> int:
+    """Balance of the variant right before ``desde`` (0 when there is no bound)."""
+
+    if desde is None:
+        return 0
+    return int(
+        session.scalar(
+            select(func.coalesce(func.sum(delta_expr()), 0)).where(
+                MovimientoStock.idvariante == idvariante, MovimientoStock.fecha < desde
+            )
+        )
+    )
+
+
+def kardex_query(filtros: list, cursor: Cursor | None, saldo_base: int) -> Select:
+    """Movements matching ``filtros`` after ``cursor`` with their running balance."""
+
+    orden = (MovimientoStock.fecha, MovimientoStock.idmovimiento)
+    query = select(
+        MovimientoStock.idmovimiento,
+        MovimientoStock.fecha,
+        MovimientoStock.tipo,
+        MovimientoStock.cantidad,
+        delta_expr().label("delta"),
+        (
+            literal(saldo_base) + func.sum(delta_expr()).over(order_by=orden, rows=(None, 0))
+        ).label("saldo"),
+        MovimientoStock.referencia_tipo,
+        MovimientoStock.referencia_id,
+        MovimientoStock.descripcion,
+        MovimientoStock.idempleado,
+    ).where(*filtros)
+    if cursor is not None:
+        query = query.where(tuple_(*orden) > tuple_(cursor[0], cursor[1]))
+    return query.order_by(*orden)
+
+
+def pagina_kardex(
+    session: Session,
+    idvariante: int,
+    filtros: list,
+    desde: datetime | None,
+    cursor: Cursor | None,
+    limit: int,
+) -> tuple[int, list[dict], str | None]:
+    """Return the opening balance, one page of movements and the next cursor."""
+
+    saldo_base = cursor[2] if cursor is not None else saldo_inicial(session, idvariante, desde)
+    rows = session.execute(kardex_query(filtros, cursor, saldo_base).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.fecha, last.idmovimiento, int(last.saldo))
+    return saldo_base, [serialize_movimiento(row) for row in rows], next_cursor
+
+
+def exportar_kardex(
+    session: Session,
+    idvariante: int,
+    filtros: list,
+    desde: datetime | None,
+    cursor: Cursor | None,
+) -> Iterator[dict]:
+    """Yield every matching movement through a server-side cursor."""
+
+    saldo_base = cursor[2] if cursor is not None else saldo_inicial(session, idvariante, desde)
+    result = session.execute(
+        kardex_query(filtros, cursor, saldo_base),
+        execution_options={"yield_per": EXPORT_CHUNK},
+    )
+    for row in result:
+        yield serialize_movimiento(row)
+
+
+def serialize_movimiento(row) -> dict:
+    return {
+        "idmovimiento": row.idmovimiento,
+        "fecha": row.fecha.isoformat() if row.fecha else None,
+        "tipo": row.tipo,
+        "cantidad": row.cantidad,
+        "delta": int(row.delta),
+        "saldo": int(row.saldo),
+        "referencia_tipo": row.referencia_tipo,
+        "referencia_id": row.referencia_id,
+        "descripcion": row.descripcion,
+        "idempleado": row.idempleado,
+    }
+
+
+def csv_chunks(movimientos: Iterable[dict]) -> Iterator[str]:
+    """Render movements as CSV, yielding roughly ``EXPORT_CHUNK`` rows at a time."""
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNAS, lineterminator="\n")
+    writer.writeheader()
+    for count, movimiento in enumerate(movimientos, start=1):
+        writer.writerow(movimiento)
+        if count % EXPORT_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def encode_cursor(fecha: datetime, idmovimiento: int, saldo: int) -> str:
+    raw = json.dumps([fecha.isoformat(), idmovimiento, saldo], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(value: str | None) -> Cursor | None:
+    if not value:
+        return None
+    try:
+        padded = value + "=" * (-len(value) % 4)
+        fecha, idmovimiento, saldo = json.loads(base64.urlsafe_b64decode(padded))
+        fecha = datetime.fromisoformat(fecha)
+    except (ValueError, TypeError):
+        raise ValueError("cursor inválido") from None
+    if not isinstance(idmovimiento, int) or not isinstance(saldo, int):
+        raise ValueError("cursor inválido")
+    return fecha, idmovimiento, saldo
+
+
+def parse_fecha(value: str, nombre: str) -> datetime:
+    value = value.strip()
+    try:
+        if len(value) == 10:
+            return datetime.combine(date.fromisoformat(value), datetime.min.time())
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{nombre} debe ser una fecha ISO (AAAA-MM-DD)") from None
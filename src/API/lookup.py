@@ -0,0 +1,273 @@
+"""In-process barcode/SKU index used by the POS scan path."""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .db import use_primary
+from .invalidation import Changes, subscribe
+from .models import Atributo, Producto, ProductoVariante, StockVariante, VarianteValor
+from .serialization import serialize_valor
+
+_TABLAS_VARIANTE = (
+    "producto_variantes",
+    "variante_valores",
+    "stock_variantes",
+    "movimientos_stock",
+)
+# Attribute names are copied into every entry that uses them: reload in full.
+_TABLAS_RECARGA = ("atributos", "atributo_opciones")
+
+
+class _Indice(NamedTuple):
+    por_codigo: dict[str, int]
+    entries: dict[int, dict]
+    por_producto: dict[int, frozenset[int]]
+
+
+class _Recarga(NamedTuple):
+    """What one refresh reloads: everything (``ids is None``) or some variants."""
+
+    generacion: int
+    ids: set[int] | None
+    productos: set[int]
+
+
+class VarianteLookup:
+    """Maps ``codigo_barras`` and ``sku`` to a ready-to-serve variant entry.
+
+    The index is loaded on first use and then kept warm: commits that touch a
+    variant, its product, its attribute values or its stock only mark the
+    affected variants as stale, and the next lookup reloads just those rows.
+    A scan therefore costs two dict lookups in the steady state.
+
+    Refreshes build new dicts and swap them in with a single assignment, so
+    concurrent lookups see either the old index or the new one, never a
+    half-updated one.
+
+    :meth:`get_async` is the event-loop flavour: concurrent coroutines share
+    a single refresh, awaited without holding any thread lock.
+
+    Processes that never see the writes (and so get no invalidations) can set
+    ``max_age`` in seconds to force a periodic full reload instead.
+    """
+
+    def __init__(self, max_age: float | None = None) -> None:
+        self.max_age = max_age
+        # Guards the stale sets; never held while querying.
+        self._lock = threading.Lock()
+        # One refresh at a time; held while querying.
+        self._recargando = threading.Lock()
+        self._recargando_async = asyncio.Lock()
+        self._generacion = 0
+        self._cargada: int | None = None
+        self._loaded_at = 0.0
+        self._indice = _Indice({}, {}, {})
+        self._stale: set[int] = set()
+        self._stale_productos: set[int] = set()
+
+    def get(self, session: Session, codigo: str) -> dict | None:
+        self._ensure(session)
+        return self._buscar(codigo)
+
+    async def get_async(self, session: AsyncSession, codigo: str) -> dict | None:
+        await self._ensure_async(session)
+        return self._buscar(codigo)
+
+    def get_many(self, session: Session, ids: Iterable[int]) -> list[dict]:
+        """Entries for ``ids`` in the given order, skipping unknown variants."""
+
+        self._ensure(session)
+        entries = self._indice.entries
+        return [entries[idvariante] for idvariante in ids if idvariante in entries]
+
+    def invalidate(self, changes: Changes) -> None:
+        with self._lock:
+            if any(changes.get(table) is not None for table in _TABLAS_RECARGA):
+                self._generacion += 1
+                return
+            for table in _TABLAS_VARIANTE:
+                self._stale.update(changes.get(table, ()))
+            self._stale_productos.update(changes.get("productos", ()))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generacion += 1
+
+    def _buscar(self, codigo: str) -> dict | None:
+        indice = self._indice
+        idvariante = indice.por_codigo.get(codigo)
+        if idvariante is None:
+            return None
+        return indice.entries.get(idvariante)
+
+    def _desactualizado(self) -> bool:
+        return (
+            self._cargada != self._generacion
+            or (self.max_age is not None and time.monotonic() - self._loaded_at > self.max_age)
+            or bool(self._stale or self._stale_productos)
+        )
+
+    def _ensure(self, session: Session) -> None:
+        if not self._desactualizado():
+            return
+        with self._recargando:
+            recarga = self._pendiente()
+            if recarga is None:
+                return
+            try:
+                entries = self._cargar(session, recarga)
+            except BaseException:
+                self._devolver(recarga)
+                raise
+            self._aplicar(recarga, entries)
+
+    async def _ensure_async(self, session: AsyncSession) -> None:
+        if not self._desactualizado():
+            return
+        async with self._recargando_async:
+            recarga = self._pendiente()
+            if recarga is None:
+                return
+            try:
+                entries = await session.run_sync(self._cargar, recarga)
+            except BaseException:
+                self._devolver(recarga)
+                raise
+            self._aplicar(recarga, entries)
+
+    def _pendiente(self) -> _Recarga | None:
+        """Take the stale marks for one refresh (``None`` when already fresh)."""
+
+        with self._lock:
+            vencido = (
+                self.max_age is not None and time.monotonic() - self._loaded_at > self.max_age
+            )
+            if self._cargada != self._generacion or vencido:
+                self._stale.clear()
+                self._stale_productos.clear()
+                return _Recarga(self._generacion, None, set())
+            if not self._stale and not self._stale_productos:
+                return None
+            ids = set(self._stale)
+            productos = set(self._stale_productos)
+            self._stale.clear()
+            self._stale_productos.clear()
+        por_producto = self._indice.por_producto
+        for idproducto in productos:
+            ids.update(por_producto.get(idproducto, ()))
+        return _Recarga(self._generacion, ids, productos)
+
+    def _devolver(self, recarga: _Recarga) -> None:
+        """Put back the marks of a refresh that failed, so the next lookup retries."""
+
+        if recarga.ids is None:
+            return
+        with self._lock:
+            self._stale.update(recarga.ids)
+            self._stale_productos.update(recarga.productos)
+
+    def _cargar(self, session: Session, recarga: _Recarga) -> list[dict]:
+        with use_primary(session):
+            ids = recarga.ids
+            if recarga.productos:
+                ids = ids | set(
+                    session.scalars(
+                        select(ProductoVariante.idvariante).where(
+                            ProductoVariante.idproducto.in_(recarga.productos)
+                        )
+                    )
+                )
+            return _load_entries(session, ids)
+
+    def _aplicar(self, recarga: _Recarga, entries: list[dict]) -> None:
+        if recarga.ids is None:
+            por_codigo: dict[str, int] = {}
+            actuales: dict[int, dict] = {}
+            por_producto: dict[int, frozenset[int]] = {}
+            reemplazados: Iterable[int] = ()
+        else:
+            por_codigo = dict(self._indice.por_codigo)
+            actuales = dict(self._indice.entries)
+            por_producto = dict(self._indice.por_producto)
+            reemplazados = {entry["id"] for entry in entries} | recarga.ids
+
+        miembros: dict[int, set[int]] = {}
+        for idvariante in reemplazados:
+            old = actuales.pop(idvariante, None)
+            if old is None:
+                continue
+            for codigo in (old["codigo_barras"], old["sku"]):
+                if codigo and por_codigo.get(codigo) == idvariante:
+                    del por_codigo[codigo]
+            idproducto = old["producto_id"]
+            miembros.setdefault(idproducto, set(por_producto.get(idproducto, ())))
+            miembros[idproducto].discard(idvariante)
+        for entry in entries:
+            idvariante = entry["id"]
+            actuales[idvariante] = entry
+            idproducto = entry["producto_id"]
+            miembros.setdefault(idproducto, set(por_producto.get(idproducto, ())))
+            miembros[idproducto].add(idvariante)
+            for codigo in (entry["sku"], entry["codigo_barras"]):
+                if codigo:
+                    por_codigo[codigo] = idvariante
+        for idproducto, ids in miembros.items():
+            if ids:
+                por_producto[idproducto] = frozenset(ids)
+            else:
+                por_producto.pop(idproducto, None)
+
+        self._indice = _Indice(por_codigo, actuales, por_producto)
+        if recarga.ids is None:
+            self._cargada = recarga.generacion
+            self._loaded_at = time.monotonic()
+
+
+def _load_entries(session: Session, ids: set[int] | None) -> list[dict]:
+    query = (
+        select(ProductoVariante, Producto.nombre, Producto.precioventa, StockVariante.cantidad)
+        .join(Producto, Producto.idproducto == ProductoVariante.idproducto)
+        .join(StockVariante, StockVariante.idvariante == ProductoVariante.idvariante, isouter=True)
+    )
+    valores_query = select(VarianteValor, Atributo).join(
+        Atributo, VarianteValor.idatributo == Atributo.idatributo
+    )
+    if ids is not None:
+        query = query.where(ProductoVariante.idvariante.in_(ids))
+        valores_query = valores_query.where(VarianteValor.idvariante.in_(ids))
+
+    atributos: dict[int, list[dict]] = defaultdict(list)
+    for valor, atributo in session.execute(valores_query):
+        atributos[valor.idvariante].append(
+            {"atributo": atributo.nombre, "slug": atributo.slug, "valor": serialize_valor(valor)}
+        )
+
+    entries = []
+    for variante, nombre, precio_producto, stock in session.execute(query):
+        entries.append(
+            {
+                "id": variante.idvariante,
+                "producto_id": variante.idproducto,
+                "producto": nombre,
+                "sku": variante.sku,
+                "codigo_barras": variante.codigo_barras,
+                "precio_venta": float(variante.precio_venta or precio_producto or 0),
+                "stock_actual": int(stock or 0),
+                "stock_minimo": variante.stock_minimo,
+                "estado": variante.estado,
+                "atributos": atributos.get(variante.idvariante, []),
+            }
+        )
+    return entries
+
+
+indice_variantes = VarianteLookup()
+subscribe(indice_variantes.invalidate, on_reset=indice_variantes.clear)
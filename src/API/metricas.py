@@ -0,0 +1,312 @@
+"""Per-request SQL and latency instrumentation, exposed for Prometheus.
+
+SQLAlchemy engine events time every statement and attribute it to the
+request being served, found through a context variable so the Flask views,
+background threads and the ASGI app are all covered. At the end of each
+request the app records:
+
+* its latency, per route template, method and status;
+* how many statements it ran and how long each took;
+* statements slower than ``DB_SLOW_QUERY_MS``, logged with the route;
+* the same statement text run ``DB_N_PLUS_ONE_THRESHOLD`` times or more,
+  the signature of an N+1 loop, logged once per request with its count.
+
+``GET /api/metrics`` renders these plus the connection pool state of each
+engine in the Prometheus text format. Numbers are per process: with several
+workers, scrape each one (or aggregate them upstream).
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import partial
+from typing import Iterable, Mapping
+
+from flask import Flask, Response, g, request
+from sqlalchemy import Engine, event
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Label for statements run outside any request (CLI, background threads).
+SIN_SOLICITUD = "-"
+SIN_RUTA = "(sin ruta)"
+MAX_SQL_LOG = 500
+
+LATENCIA_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONSULTA_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+CONSULTAS_POR_SOLICITUD_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple[str, ...]) -> None:
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._lock = threading.Lock()
+
+    def cabecera(self) -> list[str]:
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple[str, ...]) -> None:
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *valores: str, cantidad: float = 1) -> None:
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def lineas(self) -> list[str]:
+        with self._lock:
+            valores = list(self._valores.items())
+        return [
+            f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}"
+            for clave, valor in sorted(valores)
+        ]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(
+        self, nombre: str, ayuda: str, etiquetas: tuple[str, ...], buckets: Iterable[float]
+    ) -> None:
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+        # Labels -> [count per bucket (non cumulative, +Inf last), sum].
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, valor: float, *valores: str) -> None:
+        indice = len(self.buckets)
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                indice = i
+                break
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    def lineas(self) -> list[str]:
+        with self._lock:
+            series = [
+                (clave, list(conteos), suma) for clave, (conteos, suma) in self._series.items()
+            ]
+        lineas = []
+        for clave, conteos, suma in sorted(series):
+            acumulado = 0
+            for limite, conteo in zip((*self.buckets, float("inf")), conteos):
+                acumulado += conteo
+                le = "+Inf" if limite == float("inf") else _numero(limite)
+                etiquetas = _etiquetas((*self.etiquetas, "le"), (*clave, le))
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+            etiquetas = _etiquetas(self.etiquetas, clave)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {acumulado}")
+        return lineas
+
+
+latencia = Histograma(
+    "vivero_http_request_duration_seconds",
+    "Latencia de las solicitudes HTTP.",
+    ("method", "route", "status"),
+    LATENCIA_BUCKETS,
+)
+duracion_consultas = Histograma(
+    "vivero_db_query_duration_seconds",
+    "Duración de cada sentencia SQL, por ruta que la ejecutó.",
+    ("route",),
+    CONSULTA_BUCKETS,
+)
+consultas_por_solicitud = Histograma(
+    "vivero_db_queries_per_request",
+    "Sentencias SQL ejecutadas por solicitud.",
+    ("route",),
+    CONSULTAS_POR_SOLICITUD_BUCKETS,
+)
+consultas_lentas = Contador(
+    "vivero_db_slow_queries_total", "Sentencias más lentas que DB_SLOW_QUERY_MS.", ("route",)
+)
+n_mas_uno = Contador(
+    "vivero_db_n_plus_one_total",
+    "Solicitudes que repitieron una misma sentencia DB_N_PLUS_ONE_THRESHOLD veces o más.",
+    ("route",),
+)
+METRICAS: tuple[_Metrica, ...] = (
+    latencia,
+    duracion_consultas,
+    consultas_por_solicitud,
+    consultas_lentas,
+    n_mas_uno,
+)
+
+
+class Solicitud:
+    """SQL activity of the request being served."""
+
+    __slots__ = ("ruta", "inicio", "consultas", "sentencias")
+
+    def __init__(self, ruta: str) -> None:
+        self.ruta = ruta
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.sentencias: Counter[str] = Counter()
+
+
+class Instrumentacion:
+    """Thresholds for the slow-query log and N+1 detection (0 disables each)."""
+
+    def __init__(self) -> None:
+        self.lenta = 0.25
+        self.repeticiones = 10
+        self._actual: ContextVar[Solicitud | None] = ContextVar("solicitud_sql", default=None)
+
+    def iniciar(self, ruta: str) -> Solicitud:
+        solicitud = Solicitud(ruta)
+        self._actual.set(solicitud)
+        return solicitud
+
+    def terminar(self, solicitud: Solicitud, metodo: str, status: int) -> None:
+        self._actual.set(None)
+        duracion = time.perf_counter() - solicitud.inicio
+        latencia.observe(duracion, metodo, solicitud.ruta, str(status))
+        consultas_por_solicitud.observe(solicitud.consultas, solicitud.ruta)
+        if not self.repeticiones:
+            return
+        repetidas = [(sql, n) for sql, n in solicitud.sentencias.items() if n >= self.repeticiones]
+        if repetidas:
+            n_mas_uno.inc(solicitud.ruta)
+        for sql, veces in repetidas:
+            logger.warning(
+                "Posible N+1 en %s %s: la misma sentencia se ejecutó %d veces: %s",
+                metodo,
+                solicitud.ruta,
+                veces,
+                _recortar(sql),
+            )
+
+    def registrar_consulta(self, sql: str, duracion: float) -> None:
+        solicitud = self._actual.get()
+        ruta = solicitud.ruta if solicitud is not None else SIN_SOLICITUD
+        duracion_consultas.observe(duracion, ruta)
+        if solicitud is not None:
+            solicitud.consultas += 1
+            if self.repeticiones:
+                solicitud.sentencias[sql] += 1
+        if self.lenta and duracion >= self.lenta:
+            consultas_lentas.inc(ruta)
+            logger.warning(
+                "Sentencia lenta (%.0f ms) en %s: %s", duracion * 1000, ruta, _recortar(sql)
+            )
+
+
+instrumentacion = Instrumentacion()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info["metricas_inicio"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _despues(conn, cursor, statement, parameters, context, executemany) -> None:
+    inicio = conn.info.pop("metricas_inicio", None)
+    if inicio is not None:
+        instrumentacion.registrar_consulta(statement, time.perf_counter() - inicio)
+
+
+def exponer(engines: Mapping[str, Engine]) -> str:
+    """Every metric plus the pool state of ``engines`` in Prometheus text format."""
+
+    lineas: list[str] = []
+    for metrica in METRICAS:
+        lineas.extend(metrica.cabecera())
+        lineas.extend(metrica.lineas())
+    lineas.extend(_pool(engines))
+    return "\n".join(lineas) + "\n"
+
+
+def _pool(engines: Mapping[str, Engine]) -> list[str]:
+    gauges = {
+        "vivero_db_pool_size": ("Conexiones que el pool mantiene abiertas.", QueuePool.size),
+        "vivero_db_pool_checked_out": ("Conexiones en uso.", QueuePool.checkedout),
+        "vivero_db_pool_checked_in": ("Conexiones libres en el pool.", QueuePool.checkedin),
+        "vivero_db_pool_overflow": ("Conexiones por encima de pool_size.", QueuePool.overflow),
+    }
+    # SQLite's single-connection pools have nothing comparable to report.
+    pools = {
+        rol: engine.pool for rol, engine in engines.items() if isinstance(engine.pool, QueuePool)
+    }
+    lineas: list[str] = []
+    for nombre, (ayuda, leer) in gauges.items():
+        lineas.extend((f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge"))
+        for rol, pool in sorted(pools.items()):
+            lineas.append(f"{nombre}{_etiquetas(('engine',), (rol,))} {leer(pool)}")
+    return lineas
+
+
+def init_metricas(app: Flask) -> None:
+    instrumentacion.lenta = app.config["DB_SLOW_QUERY_MS"] / 1000
+    instrumentacion.repeticiones = app.config["DB_N_PLUS_ONE_THRESHOLD"]
+
+    @app.before_request
+    def _iniciar() -> None:
+        rule = request.url_rule
+        g.metricas = instrumentacion.iniciar(rule.rule if rule is not None else SIN_RUTA)
+
+    @app.after_request
+    def _terminar(response: Response) -> Response:
+        solicitud = g.pop("metricas", None)
+        if solicitud is None:
+            return response
+        terminar = partial(
+            instrumentacion.terminar, solicitud, request.method, response.status_code
+        )
+        # A streamed body runs its queries after this hook; count them too.
+        if response.is_streamed:
+            response.call_on_close(terminar)
+        else:
+            terminar()
+        return response
+
+    @app.teardown_request
+    def _abortar(exception: BaseException | None) -> None:
+        solicitud = g.pop("metricas", None)
+        if solicitud is not None:
+            instrumentacion.terminar(solicitud, request.method, 500)
+
+    @app.get("/api/metrics")
+    def metrics():
+        return Response(exponer(app.extensions["db"].engines()), content_type=CONTENT_TYPE)
+
+
+def _etiquetas(nombres: tuple[str, ...], valores: tuple[str, ...]) -> str:
+    if not nombres:
+        return ""
+    pares = ",".join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores))
+    return "{" + pares + "}"
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _numero(valor: float) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def _recortar(sql: str) -> str:
+    sql = " ".join(sql.split())
+    return sql if len(sql) <= MAX_SQL_LOG else sql[:MAX_SQL_LOG] + "…"
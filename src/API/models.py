@@ -6,12 +6,14 @@ from decimal import Decimal
 from typing import Optional
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     CheckConstraint,
     Column,
     Date,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
@@ -58,6 +60,7 @@ class Proveedor(Base):
 
 class Producto(Base):
     __tablename__ = "productos"
+    __table_args__ = (Index("productos_nombre_idproducto_idx", "nombre", "idproducto"),)
 
     idproducto: Mapped[int] = mapped_column(primary_key=True)
     nombre: Mapped[str] = mapped_column(String)
@@ -106,6 +109,9 @@ class ProductoVariante(Base):
     detalles_venta: Mapped[list["DetalleVenta"]] = relationship(
         "DetalleVenta", back_populates="variante"
     )
+    saldo: Mapped[Optional["StockVariante"]] = relationship(
+        "StockVariante", back_populates="variante", uselist=False, cascade="all, delete-orphan"
+    )
 
 
 class Atributo(Base):
@@ -182,7 +188,10 @@ class Empleado(Base):
 
     ventas: Mapped[list["Venta"]] = relationship("Venta", back_populates="empleado")
     usuario: Mapped[Optional["Usuario"]] = relationship(
-        "Usuario", back_populates="empleado", uselist=False
+        "Usuario",
+        back_populates="empleado",
+        uselist=False,
+        primaryjoin="Empleado.dni==foreign(Usuario.dni_empleado)",
     )
 
 
@@ -200,7 +209,9 @@ class Usuario(Base):
     fecha_creacion: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     empleado: Mapped[Optional["Empleado"]] = relationship(
-        "Empleado", back_populates="usuario", primaryjoin="Usuario.dni_empleado==Empleado.dni"
+        "Empleado",
+        back_populates="usuario",
+        primaryjoin="foreign(Usuario.dni_empleado)==Empleado.dni",
     )
 
 
@@ -236,10 +247,25 @@ class DetalleVenta(Base):
     )
 
 
+class VentaResumen(Base):
+    """Sales rollup per period and dimension, maintained as sales are recorded."""
+
+    __tablename__ = "ventas_resumen"
+
+    granularidad: Mapped[str] = mapped_column(String(10), primary_key=True)
+    dimension: Mapped[str] = mapped_column(String(20), primary_key=True)
+    periodo: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    clave: Mapped[str] = mapped_column(String(64), primary_key=True)
+    ventas: Mapped[int] = mapped_column(Integer, default=0)
+    unidades: Mapped[int] = mapped_column(Integer, default=0)
+    importe: Mapped[Decimal] = mapped_column(Numeric, default=0)
+
+
 class MovimientoStock(Base):
     __tablename__ = "movimientos_stock"
     __table_args__ = (
         CheckConstraint("cantidad > 0", name="movimientos_stock_cantidad_check"),
+        Index("movimientos_stock_variante_fecha_idx", "idvariante", "fecha", "idmovimiento"),
     )
 
     idmovimiento: Mapped[int] = mapped_column(primary_key=True)
@@ -256,3 +282,61 @@ class MovimientoStock(Base):
         "ProductoVariante", back_populates="movimientos"
     )
     empleado: Mapped[Optional["Empleado"]] = relationship("Empleado")
+
+
+class MovimientoDiario(Base):
+    """Last journal record of each write-behind journal already in ``movimientos_stock``."""
+
+    __tablename__ = "movimientos_diario"
+
+    diario: Mapped[str] = mapped_column(String(50), primary_key=True)
+    lsn: Mapped[int] = mapped_column(BigInteger, default=0)
+    fecha_actualizacion: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class StockVariante(Base):
+    __tablename__ = "stock_variantes"
+
+    idvariante: Mapped[int] = mapped_column(
+        ForeignKey("producto_variantes.idvariante", ondelete="CASCADE"), primary_key=True
+    )
+    cantidad: Mapped[int] = mapped_column(Integer, default=0)
+    fecha_actualizacion: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    variante: Mapped["ProductoVariante"] = relationship(
+        "ProductoVariante", back_populates="saldo"
+    )
+
+
+class StockAlerta(Base):
+    """Variants currently at or below their minimum stock."""
+
+    __tablename__ = "stock_alertas"
+
+    idvariante: Mapped[int] = mapped_column(
+        ForeignKey("producto_variantes.idvariante", ondelete="CASCADE"), primary_key=True
+    )
+    cantidad: Mapped[int] = mapped_column(Integer)
+    stock_minimo: Mapped[int] = mapped_column(Integer)
+    fecha_alta: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    fecha_actualizacion: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class SyncVersion(Base):
+    """Single-row counter bumped each time pending sync changes are stamped."""
+
+    __tablename__ = "sync_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class SyncCambio(Base):
+    """Latest version at which each synced entity changed (one row per entity, 0 = pending)."""
+
+    __tablename__ = "sync_cambios"
+    __table_args__ = (Index("sync_cambios_version_idx", "version", "tipo", "entidad_id"),)
+
+    tipo: Mapped[str] = mapped_column(String(20), primary_key=True)
+    entidad_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger)
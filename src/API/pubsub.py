@@ -0,0 +1,150 @@
+"""Cross-process cache invalidation over Postgres ``LISTEN``/``NOTIFY``.
+
+The in-process bus in :mod:`.invalidation` only reaches caches in the
+process that made the write. On Postgres every transaction that records
+changes also sends them with ``pg_notify`` right before ``COMMIT``;
+notifications are transactional, so other processes hear about a write
+exactly when it becomes visible, and never about one that rolled back.
+
+Each process keeps one dedicated connection (outside the pool) listening on
+``INVALIDACION_CANAL`` in a background thread and republishes what other
+processes sent to its own subscribers. Whenever that connection is
+(re)established, notifications may have been missed, so every subscriber
+is reset. Nothing happens on SQLite, which has a single process anyway.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Iterator, Mapping
+
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from .db import use_primary
+from .invalidation import Changes, pending_changes, publish, reset
+
+logger = logging.getLogger(__name__)
+
+# Postgres caps payloads at 8000 bytes; ids are split across notifications.
+MAX_IDS_POR_AVISO = 250
+# How often an idle listener checks that its connection is still alive.
+ESPERA_SEGUNDOS = 30.0
+REINTENTO_SEGUNDOS = 1.0
+MAX_REINTENTO_SEGUNDOS = 30.0
+
+
+class InvalidationListener:
+    """Per-process ``LISTEN`` thread; started lazily so it survives pre-fork servers."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.url: str | None = None
+        self.canal = "vivero_invalidacion"
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+
+    @property
+    def origen(self) -> str:
+        """Identifies this process' notifications so it skips its own."""
+
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def configure(self, config: Mapping) -> bool:
+        self.url = config["DATABASE_URL"]
+        self.canal = config.get("INVALIDACION_CANAL", self.canal)
+        self.enabled = (
+            bool(config.get("INVALIDACION_PG", True))
+            and make_url(self.url).get_backend_name() == "postgresql"
+        )
+        return self.enabled
+
+    def start(self) -> None:
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="invalidacion-pg", daemon=True).start()
+
+    def _run(self) -> None:
+        import psycopg  # only needed on Postgres
+
+        conninfo = make_url(self.url).set(drivername="postgresql")
+        espera = REINTENTO_SEGUNDOS
+        while True:
+            try:
+                with psycopg.connect(
+                    conninfo.render_as_string(hide_password=False), autocommit=True
+                ) as conn:
+                    conn.execute(f"LISTEN {_identificador(self.canal)}")
+                    # Anything committed while we were not listening is unknown.
+                    reset()
+                    espera = REINTENTO_SEGUNDOS
+                    while True:
+                        for aviso in conn.notifies(timeout=ESPERA_SEGUNDOS):
+                            self.recibir(aviso.payload)
+                        conn.execute("SELECT 1")
+            except Exception:
+                logger.exception("Conexión LISTEN perdida; se reintenta en %.0f s", espera)
+                time.sleep(espera)
+                espera = min(espera * 2, MAX_REINTENTO_SEGUNDOS)
+
+    def recibir(self, payload: str) -> None:
+        try:
+            aviso = json.loads(payload)
+            if aviso["o"] == self.origen:
+                return
+            changes = {table: set(ids) for table, ids in aviso["c"].items()}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            logger.warning("Aviso de invalidación inválido: %.200s", payload)
+            return
+        publish(changes)
+
+    def avisos(self, changes: Changes) -> Iterator[str]:
+        """``changes`` as payloads small enough for ``pg_notify``."""
+
+        aviso: dict[str, list[int]] = {}
+        cantidad = 0
+        for table, ids in changes.items():
+            ids = sorted(ids)
+            # Empty sets are kept: some caches react to the table alone.
+            for inicio in range(0, max(len(ids), 1), MAX_IDS_POR_AVISO):
+                parte = ids[inicio : inicio + MAX_IDS_POR_AVISO]
+                if aviso and cantidad + len(parte) > MAX_IDS_POR_AVISO:
+                    yield self._serializar(aviso)
+                    aviso, cantidad = {}, 0
+                aviso[table] = parte
+                cantidad += len(parte)
+        if aviso:
+            yield self._serializar(aviso)
+
+    def _serializar(self, aviso: dict[str, list[int]]) -> str:
+        return json.dumps({"o": self.origen, "c": aviso}, separators=(",", ":"))
+
+
+def _identificador(nombre: str) -> str:
+    return '"' + nombre.replace('"', '""') + '"'
+
+
+invalidation_listener = InvalidationListener()
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_changes(session: Session) -> None:
+    if not invalidation_listener.enabled:
+        return
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    changes = pending_changes(session)
+    if not changes:
+        return
+    with use_primary(session):
+        for payload in invalidation_listener.avisos(changes):
+            session.execute(select(func.pg_notify(invalidation_listener.canal, payload)))
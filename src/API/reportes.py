@@ -0,0 +1,249 @@
+"""Incrementally maintained sales rollups.
+
+Every sale adds its contribution to ``ventas_resumen`` in the same
+transaction that records it: one row per hour and per day for the store
+total and for each variant, category, employee and payment method involved.
+Reports then read a handful of pre-aggregated rows instead of scanning
+``ventas`` and ``detalleventa``.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import groupby
+from typing import Iterable, Mapping
+
+from sqlalchemy import Select, delete, func, select
+from sqlalchemy.orm import Session
+
+from .db import upsert_insert
+from .invalidation import mark_changed
+from .models import DetalleVenta, Producto, Venta, VentaResumen
+
+GRANULARIDADES = ("hora", "dia")
+DIMENSIONES = ("total", "variante", "categoria", "empleado", "metodopago")
+# Dimensions whose keys are ids and are reported back as integers.
+DIMENSIONES_ID = {"variante", "categoria", "empleado"}
+
+# Widest range a single report may cover, per granularity.
+MAX_RANGO = {"hora": timedelta(days=31), "dia": timedelta(days=366)}
+
+UPSERT_CHUNK = 1000
+# Pending rollup rows kept in memory by a rebuild before they are written.
+RECONSTRUIR_FLUSH = 20_000
+
+Clave = tuple[str, str, datetime, str]
+
+
+def truncar(fecha: datetime, granularidad: str) -> datetime:
+    if granularidad == "hora":
+        return fecha.replace(minute=0, second=0, microsecond=0)
+    return fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class Acumulador:
+    """Collects rollup contributions keyed by ``(granularidad, dimension, periodo, clave)``."""
+
+    def __init__(self) -> None:
+        self.filas: dict[Clave, list] = defaultdict(lambda: [0, 0, Decimal("0")])
+
+    def __len__(self) -> int:
+        return len(self.filas)
+
+    def agregar_venta(
+        self,
+        fecha: datetime,
+        idempleado: int | None,
+        metodopago: str | None,
+        total: Decimal | None,
+        lineas: Iterable[tuple[int | None, int | None, int | None, Decimal | None]],
+    ) -> None:
+        """Add one sale; ``lineas`` holds ``(idvariante, idcategoria, cantidad, subtotal)``."""
+
+        por_dimension: dict[tuple[str, str], list] = defaultdict(lambda: [0, Decimal("0")])
+        unidades = 0
+        importe = Decimal("0")
+        for idvariante, idcategoria, cantidad, subtotal in lineas:
+            cantidad = cantidad or 0
+            subtotal = Decimal(subtotal or 0)
+            unidades += cantidad
+            importe += subtotal
+            for dimension, clave in (("variante", idvariante), ("categoria", idcategoria)):
+                if clave is None:
+                    continue
+                acumulado = por_dimension[(dimension, str(clave))]
+                acumulado[0] += cantidad
+                acumulado[1] += subtotal
+
+        importe = Decimal(total) if total is not None else importe
+        por_dimension[("total", "")] = [unidades, importe]
+        por_dimension[("empleado", "" if idempleado is None else str(idempleado))] = [
+            unidades,
+            importe,
+        ]
+        por_dimension[("metodopago", metodopago or "")] = [unidades, importe]
+
+        for granularidad in GRANULARIDADES:
+            periodo = truncar(fecha, granularidad)
+            for (dimension, clave), (cantidad, subtotal) in por_dimension.items():
+                fila = self.filas[(granularidad, dimension, periodo, clave)]
+                fila[0] += 1
+                fila[1] += cantidad
+                fila[2] += subtotal
+
+
+def aplicar_resumen(session: Session, filas: Mapping[Clave, list]) -> None:
+    """Add ``filas`` to ``ventas_resumen`` inside the caller's transaction.
+
+    Rows are written in key order so concurrent sales lock the shared rollup
+    rows (the store total for the current hour and day) in the same sequence.
+    """
+
+    if not filas:
+        return
+
+    claves = ("granularidad", "dimension", "periodo", "clave")
+    valores = ("ventas", "unidades", "importe")
+    items = [
+        {**dict(zip(claves, clave)), **dict(zip(valores, fila))}
+        for clave, fila in sorted(filas.items())
+    ]
+    for start in range(0, len(items), UPSERT_CHUNK):
+        stmt = upsert_insert(session, VentaResumen).values(items[start : start + UPSERT_CHUNK])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                VentaResumen.granularidad,
+                VentaResumen.dimension,
+                VentaResumen.periodo,
+                VentaResumen.clave,
+            ],
+            set_={
+                "ventas": VentaResumen.ventas + stmt.excluded.ventas,
+                "unidades": VentaResumen.unidades + stmt.excluded.unidades,
+                "importe": VentaResumen.importe + stmt.excluded.importe,
+            },
+        )
+        session.execute(stmt)
+    mark_changed(session, VentaResumen.__tablename__, ())
+
+
+def reconstruir_resumen(
+    session: Session, desde: datetime | None = None, hasta: datetime | None = None
+) -> int:
+    """Rebuild the rollups for ``[desde, hasta)`` from the sales tables.
+
+    Both bounds are widened to whole days so hourly and daily rows are rebuilt
+    together. Existing rows in the range are deleted and the sales are
+    streamed back in, so the rebuild is idempotent and memory stays bounded.
+    Sales recorded concurrently are not lost: their additive upserts wait on
+    the deleted rows and land on top of the rebuilt totals. Returns the
+    number of sales processed.
+    """
+
+    desde = truncar(desde, "dia") if desde else None
+    if hasta and hasta != truncar(hasta, "dia"):
+        hasta = truncar(hasta, "dia") + timedelta(days=1)
+
+    borrar = delete(VentaResumen)
+    ventas_query = (
+        select(
+            Venta.idventa,
+            Venta.fecha,
+            Venta.idempleado,
+            Venta.metodopago,
+            Venta.total,
+            DetalleVenta.idvariante,
+            Producto.idcategoria,
+            DetalleVenta.cantidad,
+            DetalleVenta.subtotal,
+        )
+        .join(DetalleVenta, DetalleVenta.idventa == Venta.idventa, isouter=True)
+        .join(Producto, Producto.idproducto == DetalleVenta.idproducto, isouter=True)
+        .where(Venta.fecha.is_not(None))
+        .order_by(Venta.idventa)
+    )
+    if desde:
+        borrar = borrar.where(VentaResumen.periodo >= desde)
+        ventas_query = ventas_query.where(Venta.fecha >= desde)
+    if hasta:
+        borrar = borrar.where(VentaResumen.periodo < hasta)
+        ventas_query = ventas_query.where(Venta.fecha < hasta)
+
+    session.execute(borrar)
+    acumulador = Acumulador()
+    procesadas = 0
+    rows = session.execute(ventas_query, execution_options={"yield_per": UPSERT_CHUNK})
+    for _, lineas in groupby(rows, key=lambda row: row.idventa):
+        lineas = list(lineas)
+        venta = lineas[0]
+        acumulador.agregar_venta(
+            venta.fecha,
+            venta.idempleado,
+            venta.metodopago,
+            venta.total,
+            ((row.idvariante, row.idcategoria, row.cantidad, row.subtotal) for row in lineas),
+        )
+        procesadas += 1
+        if len(acumulador) >= RECONSTRUIR_FLUSH:
+            aplicar_resumen(session, acumulador.filas)
+            acumulador = Acumulador()
+    aplicar_resumen(session, acumulador.filas)
+    return procesadas
+
+
+def serie_query(
+    granularidad: str, dimension: str, desde: datetime, hasta: datetime, clave: str | None
+) -> Select:
+    """Rollup rows for one dimension over ``[desde, hasta)``, ordered by period."""
+
+    query = select(VentaResumen).where(
+        VentaResumen.granularidad == granularidad,
+        VentaResumen.dimension == dimension,
+        VentaResumen.periodo >= desde,
+        VentaResumen.periodo < hasta,
+    )
+    if clave is not None:
+        query = query.where(VentaResumen.clave == clave)
+    return query.order_by(VentaResumen.periodo, VentaResumen.clave)
+
+
+def ranking_query(dimension: str, desde: datetime, hasta: datetime, limite: int) -> Select:
+    """Top keys of ``dimension`` by amount over the daily rows of ``[desde, hasta)``."""
+
+    importe = func.sum(VentaResumen.importe)
+    return (
+        select(
+            VentaResumen.clave,
+            func.sum(VentaResumen.ventas).label("ventas"),
+            func.sum(VentaResumen.unidades).label("unidades"),
+            importe.label("importe"),
+        )
+        .where(
+            VentaResumen.granularidad == "dia",
+            VentaResumen.dimension == dimension,
+            VentaResumen.periodo >= desde,
+            VentaResumen.periodo < hasta,
+        )
+        .group_by(VentaResumen.clave)
+        .order_by(importe.desc(), VentaResumen.clave)
+        .limit(limite)
+    )
+
+
+def serialize_clave(dimension: str, clave: str):
+    if dimension in DIMENSIONES_ID:
+        return int(clave) if clave else None
+    return clave or None
+
+
+def serialize_resumen(dimension: str, row) -> dict:
+    data = {
+        "clave": serialize_clave(dimension, row.clave),
+        "ventas": int(row.ventas or 0),
+        "unidades": int(row.unidades or 0),
+        "importe": float(row.importe or 0),
+    }
+    if isinstance(row, VentaResumen):
+        data = {"periodo": row.periodo.isoformat(), **data}
+    return data
@@ -4,9 +4,17 @@ from __future__ import annotations
 from flask import Blueprint
 
 from .auth import bp as auth_bp
+from .facturas import bp as facturas_bp
 from .inventory import bp as inventory_bp
+from .reportes import bp as reportes_bp
+from .sync import bp as sync_bp
+from .ventas import bp as ventas_bp
 
 
 def register_blueprints(app) -> None:
     app.register_blueprint(auth_bp, url_prefix="/api/auth")
     app.register_blueprint(inventory_bp, url_prefix="/api")
+    app.register_blueprint(ventas_bp, url_prefix="/api")
+    app.register_blueprint(reportes_bp, url_prefix="/api/reportes")
+    app.register_blueprint(sync_bp, url_prefix="/api/sync")
+    app.register_blueprint(facturas_bp, url_prefix="/api/facturas")
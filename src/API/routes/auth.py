@@ -1,16 +1,19 @@
 """Authentication routes."""
 from __future__ import annotations
 
+import logging
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
 
-import bcrypt
-from flask import Blueprint, jsonify, request
-from sqlalchemy import select
+from flask import Blueprint, current_app, g, jsonify, request
+from sqlalchemy import select, update
 
 from ..db import get_session
 from ..models import Usuario
+from ..security import HasherBusy, create_token, get_hasher, login_required
 
 bp = Blueprint("auth", __name__)
+logger = logging.getLogger(__name__)
 
 
 @bp.post("/login")
@@ -27,14 +30,32 @@ def login():
             select(Usuario).where(Usuario.username == username)
         ).scalar_one_or_none()
 
-        if not user or not user.activo:
-            return jsonify({"error": "Usuario no encontrado o deshabilitado"}), 401
+    if not user or not user.activo:
+        return jsonify({"error": "Usuario no encontrado o deshabilitado"}), 401
 
-        if not bcrypt.checkpw(password.encode("utf-8"), user.password_hash.encode("utf-8")):
+    # The session is closed before hashing so no connection is held meanwhile.
+    hasher = get_hasher()
+    try:
+        if not hasher.verify(password, user.password_hash):
             return jsonify({"error": "Credenciales inválidas"}), 401
+    except (HasherBusy, FutureTimeoutError):
+        return jsonify({"error": "Servidor ocupado, intente nuevamente"}), 503
 
-        user.ultimo_login = datetime.utcnow()
-        session.add(user)
+    # The rehash is best effort: a busy hasher must not fail a valid login.
+    nuevo_hash = None
+    if hasher.needs_rehash(user.password_hash):
+        try:
+            nuevo_hash = hasher.hash(password)
+        except (HasherBusy, FutureTimeoutError):
+            logger.warning("Rehash pospuesto para el usuario %s: hasher ocupado", user.idusuario)
+
+    valores = {"ultimo_login": datetime.utcnow()}
+    if nuevo_hash:
+        valores["password_hash"] = nuevo_hash
+    with get_session() as session:
+        session.execute(
+            update(Usuario).where(Usuario.idusuario == user.idusuario).values(**valores)
+        )
 
     return jsonify(
         {
@@ -43,6 +64,14 @@ def login():
                 "username": user.username,
                 "rol": user.rol,
                 "email": user.email,
-            }
+            },
+            "token": create_token(user.idusuario, user.rol),
+            "expires_in": current_app.config["AUTH_TOKEN_TTL"],
         }
     )
+
+
+@bp.get("/me")
+@login_required
+def me():
+    return jsonify({"user": {"id": g.usuario["uid"], "rol": g.usuario["rol"]}})
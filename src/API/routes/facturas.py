@@ -0,0 +1,123 @@
+"""Invoice documents for recorded sales."""
+from __future__ import annotations
+
+import os
+
+from flask import Blueprint, Response, jsonify, request, send_file, url_for
+from sqlalchemy import select
+
+from ..db import get_session
+from ..facturas import (
+    cargar_facturas,
+    generador_facturas,
+    numero_factura,
+    render_pdf,
+    serialize_factura,
+)
+from ..kardex import parse_fecha
+from ..models import Venta
+
+bp = Blueprint("facturas", __name__)
+
+MAX_FACTURAS_LOTE = 50_000
+
+
+@bp.get("/<int:idventa>")
+def factura(idventa: int):
+    """One invoice, as a PDF (default) or, with ``formato=json``, the structured export."""
+
+    formato = request.args.get("formato", "pdf")
+    if formato not in ("pdf", "json"):
+        return jsonify({"error": "formato debe ser pdf o json"}), 400
+
+    with get_session() as session:
+        facturas = cargar_facturas(session, [idventa])
+    if not facturas:
+        return jsonify({"error": "Venta no encontrada"}), 404
+
+    empresa = generador_facturas.empresa
+    if formato == "json":
+        return jsonify(serialize_factura(facturas[0], empresa))
+    response = Response(render_pdf(facturas[0], empresa), mimetype="application/pdf")
+    response.headers["Content-Disposition"] = (
+        f"inline; filename=factura-{numero_factura(idventa, empresa)}.pdf"
+    )
+    return response
+
+
+@bp.post("/lotes")
+def crear_lote():
+    """Start a batch job for ``{"ids": [...]}`` or a ``{"desde", "hasta"}`` range.
+
+    Answers ``202`` right away; poll the returned ``estado`` URL for progress
+    and download the zip from ``archivo`` once ``estado`` is ``terminado``.
+    """
+
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get("ids")
+    if ids is not None:
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+            return jsonify({"error": "ids debe ser una lista de enteros"}), 400
+        ids = sorted(set(ids))
+    else:
+        if not payload.get("desde") or not payload.get("hasta"):
+            return jsonify({"error": "indicá ids o el rango desde/hasta"}), 400
+        try:
+            desde = parse_fecha(str(payload["desde"]), "desde")
+            hasta = parse_fecha(str(payload["hasta"]), "hasta")
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        with get_session() as session:
+            ids = list(
+                session.scalars(
+                    select(Venta.idventa)
+                    .where(Venta.fecha >= desde, Venta.fecha < hasta)
+                    .order_by(Venta.idventa)
+                    .limit(MAX_FACTURAS_LOTE + 1)
+                )
+            )
+    if len(ids) > MAX_FACTURAS_LOTE:
+        return jsonify({"error": f"máximo {MAX_FACTURAS_LOTE} facturas por lote"}), 400
+    if not ids:
+        return jsonify({"error": "No hay ventas para facturar"}), 404
+
+    estado = generador_facturas.iniciar(ids)
+    return jsonify(_con_urls(estado)), 202
+
+
+@bp.get("/lotes/<ident>")
+def estado_lote(ident: str):
+    try:
+        estado = generador_facturas.estado(ident)
+    except ValueError:
+        estado = None
+    if estado is None:
+        return jsonify({"error": "Lote no encontrado"}), 404
+    return jsonify(_con_urls(estado))
+
+
+@bp.get("/lotes/<ident>/archivo")
+def archivo_lote(ident: str):
+    try:
+        estado = generador_facturas.estado(ident)
+    except ValueError:
+        estado = None
+    if estado is None:
+        return jsonify({"error": "Lote no encontrado"}), 404
+    if estado["estado"] != "terminado":
+        return jsonify({"error": "El lote todavía no terminó", "estado": estado["estado"]}), 409
+    return send_file(
+        os.path.abspath(generador_facturas.ruta_archivo(ident)),
+        mimetype="application/zip",
+        as_attachment=True,
+        download_name=f"facturas-{ident}.zip",
+    )
+
+
+def _con_urls(estado: dict) -> dict:
+    terminado = estado["estado"] == "terminado"
+    return {
+        **estado,
+        "url_estado": url_for(".estado_lote", ident=estado["id"]),
+        "url_archivo": url_for(".archivo_lote", ident=estado["id"]) if terminado else None,
+    }
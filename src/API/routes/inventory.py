@@ -1,132 +1,378 @@
 """Inventory and product related routes."""
 from __future__ import annotations
 
-from collections import defaultdict
-
-from flask import Blueprint, jsonify, request
-from sqlalchemy import case, func, select
-
-from ..db import get_session
-from ..models import (
-    Atributo,
-    Categoria,
-    MovimientoStock,
-    Producto,
-    ProductoVariante,
-    VarianteValor,
+import queue
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Iterator
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy import insert, select
+
+from ..alertas import AYUDA_INSTALAR, alertas_feed, alertas_query, serialize_alerta
+from ..busqueda import buscador_productos
+from ..cache import cached_response
+from ..catalog import (
+    STREAM_PAGE_SIZE,
+    categorias_query,
+    decode_cursor,
+    filtros_productos,
+    page_size,
+    pagina_productos,
+    parse_bool,
+    parse_int,
+    serialize_categoria,
+)
+from ..db import get_session, tabla_instalada, use_primary
+from ..diario import DiarioNoDisponible, diario_movimientos
+from ..facetas import indice_facetas
+from ..importacion import ErrorImportacion, Resolutor, importar, leer_archivo, validar_columnas
+from ..invalidation import mark_changed
+from ..kardex import (
+    csv_chunks,
+    exportar_kardex,
+    filtros_kardex,
+    pagina_kardex,
+)
+from ..kardex import decode_cursor as decode_kardex_cursor
+from ..lookup import indice_variantes
+from ..models import MovimientoStock, ProductoVariante, StockAlerta
+from ..stock import (
+    ALLOWED_MOV_TYPES,
+    MOV_TIPO_NEGATIVO,
+    acumular_deltas,
+    aplicar_deltas,
+    delta_movimiento,
+    reservar_stock,
 )
 
 bp = Blueprint("inventory", __name__)
 
-MOV_TIPO_NEGATIVO = {"SALIDA"}
-ALLOWED_MOV_TYPES = {"ENTRADA", "SALIDA", "AJUSTE"}
+MAX_BATCH_SIZE = 5000
+SPOOL_IMPORTACION = 8 * 1024 * 1024
+PARAMETROS_FACETAS = {"limit", "cursor"}
+MAX_BUSQUEDA = 100
+MAX_RESULTADOS_BUSQUEDA = 50
+KARDEX_FORMATOS = {
+    "json": "application/json",
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
 
 
 @bp.get("/categorias")
+@cached_response("categorias")
 def list_categorias():
     with get_session() as session:
-        categorias = session.scalars(select(Categoria).order_by(Categoria.nombre)).all()
+        categorias = session.scalars(categorias_query()).all()
 
-    return jsonify(
-        [
-            {
-                "id": cat.idcategoria,
-                "nombre": cat.nombre,
-                "slug": cat.slug,
-                "estado": cat.estado,
-            }
-            for cat in categorias
-        ]
-    )
+    return jsonify([serialize_categoria(cat) for cat in categorias])
 
 
 @bp.get("/productos")
+@cached_response("productos")
 def list_productos():
-    with get_session() as session:
-        stock_subquery = (
-            select(
-                MovimientoStock.idvariante.label("mv_idvariante"),
-                func.coalesce(
-                    func.sum(
-                        case(
-                            (MovimientoStock.tipo.in_(MOV_TIPO_NEGATIVO), -MovimientoStock.cantidad),
-                            else_=MovimientoStock.cantidad,
-                        )
-                    ),
-                    0,
-                ).label("stock_actual"),
-            )
-            .group_by(MovimientoStock.idvariante)
-            .subquery()
+    try:
+        filtros = filtros_productos(request.args)
+        cursor = decode_cursor(request.args.get("cursor"))
+        limit = page_size(request.args.get("limit"))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    if parse_bool(request.args.get("stream")):
+        return Response(
+            stream_with_context(_stream_productos(filtros, cursor)),
+            mimetype="application/json",
         )
 
-        rows = session.execute(
-            select(
-                Producto,
-                ProductoVariante,
-                stock_subquery.c.stock_actual,
-            )
-            .join(ProductoVariante, Producto.variantes, isouter=True)
-            .join(stock_subquery, stock_subquery.c.mv_idvariante == ProductoVariante.idvariante, isouter=True)
-            .order_by(Producto.nombre, ProductoVariante.idvariante)
-        ).all()
-
-        variantes_ids = [row[1].idvariante for row in rows if row[1] is not None]
-
-        valores_map: dict[int, list[dict]] = defaultdict(list)
-        if variantes_ids:
-            valores_rows = session.execute(
-                select(VarianteValor, Atributo)
-                .join(Atributo, VarianteValor.idatributo == Atributo.idatributo)
-                .where(VarianteValor.idvariante.in_(variantes_ids))
-            ).all()
-            for valor, atributo in valores_rows:
-                valores_map[valor.idvariante].append(
-                    {
-                        "atributo": atributo.nombre,
-                        "slug": atributo.slug,
-                        "valor": _serialize_valor(valor),
-                    }
-                )
+    with get_session() as session:
+        productos, next_cursor = pagina_productos(session, filtros, cursor, limit)
 
-    productos: dict[int, dict] = {}
-    for producto, variante, stock in rows:
-        prod_entry = productos.setdefault(
-            producto.idproducto,
-            {
-                "id": producto.idproducto,
-                "nombre": producto.nombre,
-                "descripcion": producto.descripcion,
-                "precio_venta": float(producto.precioventa or 0),
-                "categoria_id": producto.idcategoria,
-                "proveedor_id": producto.idproveedor,
-                "variantes": [],
-            },
-        )
-        if variante:
-            prod_entry["variantes"].append(
+    return jsonify({"items": productos, "next_cursor": next_cursor})
+
+
+def _stream_productos(filtros: list, cursor: tuple[str, int] | None) -> Iterator[str]:
+    """Yield the whole (filtered) catalog as a JSON array, one page at a time.
+
+    Each page uses its own short-lived session, so memory and connection use
+    stay bounded by ``STREAM_PAGE_SIZE`` whatever the catalog size.
+    """
+
+    dumps = current_app.json.dumps
+    yield "["
+    first = True
+    while True:
+        with get_session() as session:
+            productos, next_cursor = pagina_productos(session, filtros, cursor, STREAM_PAGE_SIZE)
+        for producto in productos:
+            yield ("" if first else ",") + dumps(producto)
+            first = False
+        if next_cursor is None:
+            break
+        cursor = decode_cursor(next_cursor)
+    yield "]"
+
+
+@bp.get("/productos/buscar")
+def buscar_productos():
+    """Typeahead search over product name, description and variant SKUs."""
+
+    q = (request.args.get("q") or "").strip()
+    if len(q) > MAX_BUSQUEDA:
+        return jsonify({"error": f"q admite como máximo {MAX_BUSQUEDA} caracteres"}), 400
+    try:
+        limit = request.args.get("limit")
+        limit = min(parse_int(limit, "limit"), MAX_RESULTADOS_BUSQUEDA) if limit else 10
+        if limit <= 0:
+            raise ValueError("limit debe ser un entero positivo")
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    if not q:
+        return jsonify([])
+    with get_session() as session:
+        resultados = buscador_productos.buscar(session, q, limit)
+    return jsonify(resultados)
+
+
+@bp.get("/productos/facetas")
+def buscar_facetas():
+    """Faceted variant search over attribute values and category.
+
+    Every query parameter other than ``limit`` and ``cursor`` is a facet
+    slug; repeat it to match any of several values (``maceta=12cm&maceta=14cm``).
+    Returns one page of matching variants plus per-value counts.
+    """
+
+    filtros: dict[str, list[str]] = {}
+    for faceta in request.args:
+        if faceta not in PARAMETROS_FACETAS:
+            filtros[faceta] = [valor for valor in request.args.getlist(faceta) if valor]
+    try:
+        limit = page_size(request.args.get("limit"))
+        cursor = request.args.get("cursor")
+        cursor = parse_int(cursor, "cursor") if cursor else None
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    with get_session() as session:
+        desconocidas = set(filtros) - indice_facetas.facetas(session)
+        if desconocidas:
+            return jsonify({"error": f"faceta desconocida: {', '.join(sorted(desconocidas))}"}), 400
+        resultado = indice_facetas.buscar(session, filtros, cursor, limit)
+        items = indice_variantes.get_many(session, resultado.ids)
+
+    return jsonify(
+        {
+            "total": resultado.total,
+            "items": items,
+            "next_cursor": resultado.next_cursor,
+            "facetas": resultado.facetas,
+        }
+    )
+
+
+@bp.post("/productos/importar")
+def importar_productos():
+    """Bulk create/update products and variants from an uploaded CSV or XLSX.
+
+    The file goes in the multipart field ``archivo``. The response is NDJSON:
+    one progress line per chunk with that chunk's row errors, then a summary.
+    """
+
+    archivo = request.files.get("archivo")
+    if archivo is None or not archivo.filename:
+        return jsonify({"error": "archivo es obligatorio"}), 400
+    # Werkzeug closes the upload when the view returns, before the response
+    # is streamed; a spooled copy owned by the generator outlives it.
+    copia = tempfile.SpooledTemporaryFile(max_size=SPOOL_IMPORTACION)
+    shutil.copyfileobj(archivo.stream, copia)
+    copia.seek(0)
+    try:
+        columnas, filas = leer_archivo(copia, archivo.filename)
+        with get_session() as session:
+            resolutor = Resolutor(session)
+        validar_columnas(columnas, resolutor.atributos)
+    except ErrorImportacion as exc:
+        copia.close()
+        return jsonify({"error": str(exc)}), 400
+
+    lote = current_app.config["IMPORTACION_LOTE"]
+    return Response(
+        stream_with_context(_stream_importacion(copia, filas, resolutor, lote)),
+        mimetype="application/x-ndjson",
+    )
+
+
+def _stream_importacion(copia, filas, resolutor: Resolutor, lote: int) -> Iterator[str]:
+    dumps = current_app.json.dumps
+    try:
+        for reporte in importar(filas, resolutor, chunk=lote):
+            yield dumps(reporte) + "\n"
+    except ErrorImportacion as exc:
+        # Decoding errors can only show up once the rows are being read.
+        yield dumps({"tipo": "error", "error": str(exc)}) + "\n"
+    finally:
+        copia.close()
+
+
+@bp.get("/variantes/lookup")
+def lookup_variante():
+    codigo = (request.args.get("codigo") or "").strip()
+    if not codigo:
+        return jsonify({"error": "codigo es obligatorio"}), 400
+
+    with get_session() as session:
+        variante = indice_variantes.get(session, codigo)
+
+    if variante is None:
+        return jsonify({"error": "Variante no encontrada"}), 404
+    return jsonify(variante)
+
+
+@bp.get("/stock/kardex")
+def kardex():
+    """Movements of one variant with their running balance.
+
+    ``formato=json`` (default) returns keyset pages; ``csv`` and ``ndjson``
+    stream the whole ``desde``/``hasta`` range without buffering it.
+    """
+
+    formato = (request.args.get("formato") or "json").lower()
+    if formato not in KARDEX_FORMATOS:
+        return jsonify({"error": "formato debe ser json, csv o ndjson"}), 400
+    try:
+        idvariante, filtros, desde = filtros_kardex(request.args)
+        cursor = decode_kardex_cursor(request.args.get("cursor"))
+        limit = page_size(request.args.get("limit"))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    with get_session() as session:
+        if session.get(ProductoVariante, idvariante) is None:
+            return jsonify({"error": "Variante no encontrada"}), 404
+        if formato == "json":
+            saldo, movimientos, next_cursor = pagina_kardex(
+                session, idvariante, filtros, desde, cursor, limit
+            )
+            return jsonify(
                 {
-                    "id": variante.idvariante,
-                    "sku": variante.sku,
-                    "codigo_barras": variante.codigo_barras,
-                    "precio_venta": float(variante.precio_venta or 0),
-                    "stock_actual": int(stock or 0),
-                    "stock_minimo": variante.stock_minimo,
-                    "atributos": valores_map.get(variante.idvariante, []),
+                    "idvariante": idvariante,
+                    "saldo_inicial": saldo,
+                    "items": movimientos,
+                    "next_cursor": next_cursor,
                 }
             )
 
-    return jsonify(list(productos.values()))
+    response = Response(
+        stream_with_context(_stream_kardex(formato, idvariante, filtros, desde, cursor)),
+        mimetype=KARDEX_FORMATOS[formato],
+    )
+    response.headers["Content-Disposition"] = f"attachment; filename=kardex-{idvariante}.{formato}"
+    return response
 
 
-def _serialize_valor(valor: VarianteValor) -> str | float | bool | None:
-    if valor.valor_texto is not None:
-        return valor.valor_texto
-    if valor.valor_numero is not None:
-        return float(valor.valor_numero)
-    if valor.valor_booleano is not None:
-        return bool(valor.valor_booleano)
-    return None
+def _stream_kardex(formato: str, idvariante: int, filtros: list, desde, cursor) -> Iterator[str]:
+    with get_session() as session:
+        movimientos = exportar_kardex(session, idvariante, filtros, desde, cursor)
+        if formato == "csv":
+            yield from csv_chunks(movimientos)
+            return
+        dumps = current_app.json.dumps
+        for movimiento in movimientos:
+            yield dumps(movimiento) + "\n"
+
+
+@bp.get("/stock/alertas")
+def list_alertas():
+    """Variants at or below their minimum stock, the largest shortfall first."""
+
+    with get_session() as session:
+        if not tabla_instalada(session, StockAlerta, AYUDA_INSTALAR):
+            return _alertas_no_instaladas()
+        alertas = session.execute(alertas_query()).all()
+
+    return jsonify([serialize_alerta(row) for row in alertas])
+
+
+@bp.get("/stock/alertas/stream")
+def stream_alertas():
+    """Server-sent events: a ``snapshot`` first, then ``alerta``/``resuelta`` per change."""
+
+    with get_session() as session:
+        if not tabla_instalada(session, StockAlerta, AYUDA_INSTALAR):
+            return _alertas_no_instaladas()
+
+    cola = alertas_feed.conectar()
+    if cola is None:
+        return jsonify({"error": "Demasiados clientes conectados"}), 503
+
+    response = Response(
+        stream_with_context(_stream_alertas(cola, current_app.config["ALERTAS_SSE_KEEPALIVE"])),
+        mimetype="text/event-stream",
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _alertas_no_instaladas():
+    return jsonify({"error": "Alertas de stock no instaladas"}), 503
+
+
+def _stream_alertas(cola: queue.Queue, keepalive: int) -> Iterator[str]:
+    """Yield SSE frames until the client disconnects.
+
+    The client is subscribed before the snapshot is read, so no change can
+    fall between the two. Changes are read from the primary because the
+    notification arrives right after the commit.
+    """
+
+    dumps = current_app.json.dumps
+    try:
+        ids: set[int] | None = None
+        while True:
+            with get_session() as session, use_primary(session):
+                rows = session.execute(alertas_query(ids)).all()
+            if ids is None:
+                data = [serialize_alerta(row) for row in rows]
+                yield f"event: snapshot\ndata: {dumps(data)}\n\n"
+            else:
+                activas = {row.StockAlerta.idvariante: row for row in rows}
+                for idvariante in sorted(ids):
+                    if idvariante in activas:
+                        data = dumps(serialize_alerta(activas[idvariante]))
+                        yield f"event: alerta\ndata: {data}\n\n"
+                    else:
+                        yield f"event: resuelta\ndata: {dumps({'idvariante': idvariante})}\n\n"
+
+            ids = _siguientes_cambios(cola, keepalive)
+            while ids == set():
+                yield ": ping\n\n"
+                ids = _siguientes_cambios(cola, keepalive)
+    finally:
+        alertas_feed.desconectar(cola)
+
+
+def _siguientes_cambios(cola: queue.Queue, timeout: int) -> set[int] | None:
+    """Wait for changes and merge everything already queued.
+
+    Returns an empty set on timeout and ``None`` when a full resync is due.
+    """
+
+    try:
+        pendientes = [cola.get(timeout=timeout)]
+    except queue.Empty:
+        return set()
+    while True:
+        try:
+            pendientes.append(cola.get_nowait())
+        except queue.Empty:
+            break
+    if any(item is None for item in pendientes):
+        return None
+    return set().union(*pendientes)
 
 
 @bp.post("/stock/movimientos")
@@ -137,17 +383,26 @@ def registrar_movimiento():
     cantidad = payload.get("cantidad")
     descripcion = payload.get("descripcion")
 
-    if not idvariante or not isinstance(idvariante, int):
-        return jsonify({"error": "idvariante es obligatorio"}), 400
-    if tipo not in ALLOWED_MOV_TYPES:
-        return jsonify({"error": "tipo de movimiento inválido"}), 400
-    if not isinstance(cantidad, int) or cantidad <= 0:
-        return jsonify({"error": "cantidad debe ser un entero positivo"}), 400
+    error = _validar_movimiento(payload)
+    if error:
+        return jsonify({"error": error}), 400
+
+    verificar = not current_app.config["STOCK_PERMITIR_NEGATIVO"]
+    # A SALIDA needs an answer on availability, so it is never deferred.
+    if current_app.config["MOVIMIENTOS_DIFERIDOS"] and not (
+        verificar and tipo in MOV_TIPO_NEGATIVO
+    ):
+        return _registrar_diferido(idvariante, tipo, cantidad, descripcion)
 
+    delta = delta_movimiento(tipo, cantidad)
     with get_session() as session:
         variante = session.get(ProductoVariante, idvariante)
         if not variante:
             return jsonify({"error": "Variante no encontrada"}), 404
+        if verificar:
+            faltantes = reservar_stock(session, {idvariante: delta})
+            if faltantes:
+                return jsonify({"error": "Stock insuficiente", "faltantes": faltantes}), 409
 
         movimiento = MovimientoStock(
             idvariante=idvariante,
@@ -156,5 +411,133 @@ def registrar_movimiento():
             descripcion=descripcion,
         )
         session.add(movimiento)
+        aplicar_deltas(session, {idvariante: delta})
 
     return jsonify({"status": "ok", "idmovimiento": movimiento.idmovimiento}), 201
+
+
+def _registrar_diferido(idvariante: int, tipo: str, cantidad: int, descripcion: str | None):
+    """Journal the movement and answer before it reaches the database."""
+
+    with get_session() as session:
+        # The in-process index answers without a round trip once warm.
+        if not indice_variantes.get_many(session, [idvariante]):
+            return jsonify({"error": "Variante no encontrada"}), 404
+
+    try:
+        ident = diario_movimientos.registrar(
+            {
+                "idvariante": idvariante,
+                "tipo": tipo,
+                "cantidad": cantidad,
+                "descripcion": descripcion,
+                "fecha": datetime.utcnow().isoformat(),
+            }
+        )
+    except DiarioNoDisponible as exc:
+        error = {"error": str(exc)}
+        if exc.ident is not None:
+            # It may still be applied: the client must check before retrying.
+            error["id"] = exc.ident
+        return jsonify(error), 503
+    return jsonify({"status": "pendiente", "id": ident}), 202
+
+
+@bp.get("/stock/movimientos/diferidos/<ident>")
+def estado_movimiento_diferido(ident: str):
+    """Whether a movement accepted with ``202`` is already in ``movimientos_stock``."""
+
+    estado = diario_movimientos.estado(ident)
+    if estado is None:
+        return jsonify({"error": "Movimiento no encontrado"}), 404
+    return jsonify({"id": ident, "estado": estado})
+
+
+@bp.post("/stock/movimientos/batch")
+def registrar_movimientos_batch():
+    """Insert many movements in a single transaction.
+
+    Accepts ``{"movimientos": [...], "parcial": false}``. Every item is
+    validated up front and all variant ids are checked with one query. By
+    default any invalid item rejects the whole batch; with ``parcial`` the
+    valid items are stored and the invalid ones reported. A batch that would
+    leave any variant below zero is rejected whole with ``409``.
+    """
+
+    payload = request.get_json(silent=True) or {}
+    items = payload.get("movimientos")
+    parcial = bool(payload.get("parcial"))
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "movimientos debe ser una lista no vacía"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"máximo {MAX_BATCH_SIZE} movimientos por lote"}), 400
+
+    errores: list[dict] = []
+    validos: list[tuple[int, dict]] = []
+    for index, item in enumerate(items):
+        error = _validar_movimiento(item) if isinstance(item, dict) else "movimiento inválido"
+        if error:
+            errores.append({"index": index, "error": error})
+        else:
+            validos.append((index, item))
+
+    with get_session() as session:
+        ids = {item["idvariante"] for _, item in validos}
+        existentes = (
+            set(
+                session.scalars(
+                    select(ProductoVariante.idvariante).where(ProductoVariante.idvariante.in_(ids))
+                )
+            )
+            if ids
+            else set()
+        )
+        for index, item in validos:
+            if item["idvariante"] not in existentes:
+                errores.append({"index": index, "error": "Variante no encontrada"})
+        validos = [(index, item) for index, item in validos if item["idvariante"] in existentes]
+        errores.sort(key=lambda err: err["index"])
+
+        if not validos or (errores and not parcial):
+            return jsonify({"error": "lote inválido", "errores": errores}), 400
+
+        deltas = acumular_deltas(
+            (item["idvariante"], item["tipo"], item["cantidad"]) for _, item in validos
+        )
+        if not current_app.config["STOCK_PERMITIR_NEGATIVO"]:
+            faltantes = reservar_stock(session, deltas)
+            if faltantes:
+                return jsonify({"error": "Stock insuficiente", "faltantes": faltantes}), 409
+
+        fecha = datetime.utcnow()
+        session.execute(
+            insert(MovimientoStock),
+            [
+                {
+                    "idvariante": item["idvariante"],
+                    "tipo": item["tipo"],
+                    "cantidad": item["cantidad"],
+                    "descripcion": item.get("descripcion"),
+                    "fecha": fecha,
+                }
+                for _, item in validos
+            ],
+        )
+        aplicar_deltas(session, deltas)
+        mark_changed(session, MovimientoStock.__tablename__, existentes)
+
+    return jsonify({"status": "ok", "insertados": len(validos), "errores": errores}), 201
+
+
+def _validar_movimiento(payload: dict) -> str | None:
+    idvariante = payload.get("idvariante")
+    cantidad = payload.get("cantidad")
+
+    if not idvariante or not isinstance(idvariante, int):
+        return "idvariante es obligatorio"
+    if payload.get("tipo") not in ALLOWED_MOV_TYPES:
+        return "tipo de movimiento inválido"
+    if not isinstance(cantidad, int) or cantidad <= 0:
+        return "cantidad debe ser un entero positivo"
+    return None
@@ -0,0 +1,117 @@
+"""Sales reports answered from the ``ventas_resumen`` rollups."""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from flask import Blueprint, jsonify, request
+
+from ..catalog import parse_int
+from ..db import get_session
+from ..kardex import parse_fecha
+from ..reportes import (
+    DIMENSIONES,
+    GRANULARIDADES,
+    MAX_RANGO,
+    ranking_query,
+    serialize_resumen,
+    serie_query,
+    truncar,
+)
+
+bp = Blueprint("reportes", __name__)
+
+RANGO_DEFAULT = {"hora": timedelta(hours=24), "dia": timedelta(days=30)}
+RANKING_DEFAULT = 10
+RANKING_MAX = 100
+
+
+@bp.get("/ventas")
+def serie_ventas():
+    """Sales per period for one dimension.
+
+    Query: ``granularidad`` (``hora``/``dia``), ``dimension`` (``total``,
+    ``variante``, ``categoria``, ``empleado``, ``metodopago``), optional
+    ``clave`` and the ``desde``/``hasta`` range.
+    """
+
+    granularidad = request.args.get("granularidad", "dia")
+    dimension = request.args.get("dimension", "total")
+    clave = request.args.get("clave")
+    try:
+        _validar(granularidad, dimension)
+        desde, hasta = _rango(request.args, granularidad)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    with get_session() as session:
+        filas = session.scalars(serie_query(granularidad, dimension, desde, hasta, clave)).all()
+
+    return jsonify(
+        {
+            "granularidad": granularidad,
+            "dimension": dimension,
+            "desde": desde.isoformat(),
+            "hasta": hasta.isoformat(),
+            "items": [serialize_resumen(dimension, fila) for fila in filas],
+        }
+    )
+
+
+@bp.get("/ventas/ranking")
+def ranking_ventas():
+    """Top variants, categories, employees or payment methods by amount."""
+
+    dimension = request.args.get("dimension", "variante")
+    try:
+        _validar("dia", dimension)
+        desde, hasta = _rango(request.args, "dia")
+        limite = min(
+            parse_int(request.args.get("limite") or str(RANKING_DEFAULT), "limite"), RANKING_MAX
+        )
+        if limite <= 0:
+            raise ValueError("limite debe ser un entero positivo")
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    with get_session() as session:
+        filas = session.execute(ranking_query(dimension, desde, hasta, limite)).all()
+
+    return jsonify(
+        {
+            "dimension": dimension,
+            "desde": desde.isoformat(),
+            "hasta": hasta.isoformat(),
+            "items": [serialize_resumen(dimension, fila) for fila in filas],
+        }
+    )
+
+
+def _validar(granularidad: str, dimension: str) -> None:
+    if granularidad not in GRANULARIDADES:
+        raise ValueError("granularidad debe ser hora o dia")
+    if dimension not in DIMENSIONES:
+        raise ValueError(f"dimension debe ser una de: {', '.join(DIMENSIONES)}")
+
+
+def _rango(args, granularidad: str) -> tuple[datetime, datetime]:
+    """Return ``[desde, hasta)`` aligned to ``granularidad``; a date-only ``hasta`` is inclusive."""
+
+    if args.get("hasta"):
+        hasta = parse_fecha(args["hasta"], "hasta")
+        if len(args["hasta"].strip()) == 10:
+            hasta += timedelta(days=1)
+    else:
+        hasta = truncar(datetime.utcnow(), granularidad) + (
+            timedelta(hours=1) if granularidad == "hora" else timedelta(days=1)
+        )
+    if args.get("desde"):
+        desde = truncar(parse_fecha(args["desde"], "desde"), granularidad)
+    else:
+        desde = hasta - RANGO_DEFAULT[granularidad]
+
+    if desde >= hasta:
+        raise ValueError("desde debe ser anterior a hasta")
+    if hasta - desde > MAX_RANGO[granularidad]:
+        dias = MAX_RANGO[granularidad].days
+        raise ValueError(f"el rango máximo para {granularidad} es {dias} días")
+    return desde, hasta
@@ -0,0 +1,48 @@
+"""Delta sync for POS terminals that keep a local copy of the catalog."""
+from __future__ import annotations
+
+from flask import Blueprint, jsonify, request
+
+from ..catalog import parse_int
+from ..db import get_session
+from ..sync import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    cambios_desde,
+    decode_cursor,
+    encode_cursor,
+    sellar_pendientes,
+    version_actual,
+)
+
+bp = Blueprint("sync", __name__)
+
+
+@bp.get("/cambios")
+def cambios():
+    """Entities changed since ``desde`` (a cursor from a previous response).
+
+    Without ``desde`` only the current cursor is returned with
+    ``reinicio: true``: the terminal keeps it, downloads the full catalog
+    from ``/api/productos`` and then pulls changes from that cursor, so
+    nothing committed during the download is missed. Repeat while ``mas``
+    is true.
+    """
+
+    desde = request.args.get("desde")
+    try:
+        cursor = decode_cursor(desde) if desde else None
+        limit = parse_int(request.args["limit"], "limit") if request.args.get("limit") else None
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if limit is not None and limit <= 0:
+        return jsonify({"error": "limit debe ser un entero positivo"}), 400
+    limit = min(limit or DEFAULT_LIMIT, MAX_LIMIT)
+
+    # Commits whose stamp is still on its way would otherwise wait for the next poll.
+    with get_session() as session:
+        sellar_pendientes(session)
+    with get_session() as session:
+        if cursor is None:
+            return jsonify({"cursor": encode_cursor(version_actual(session)), "reinicio": True})
+        return jsonify({**cambios_desde(session, cursor, limit), "reinicio": False})
@@ -0,0 +1,179 @@
+"""Sales (checkout) routes."""
+from __future__ import annotations
+
+from datetime import datetime
+from decimal import Decimal
+
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy import insert, select
+
+from ..db import get_session
+from ..invalidation import mark_changed
+from ..models import DetalleVenta, Empleado, MovimientoStock, Producto, ProductoVariante, Venta
+from ..reportes import Acumulador, aplicar_resumen
+from ..stock import acumular_deltas, aplicar_deltas, reservar_stock
+
+bp = Blueprint("ventas", __name__)
+
+REFERENCIA_VENTA = "VENTA"
+MAX_ITEMS_VENTA = 500
+
+
+@bp.post("/ventas")
+def registrar_venta():
+    """Record a whole cart in one transaction.
+
+    Accepts ``{"idempleado", "metodopago", "items": [{"idvariante", "cantidad"}]}``.
+    Prices, subtotals and the total are computed here from the catalog; the
+    sale, its lines and the matching ``SALIDA`` movements are written with one
+    statement each. A cart the stock cannot cover is rejected with ``409``
+    before anything is written.
+    """
+
+    payload = request.get_json(silent=True) or {}
+    idempleado = payload.get("idempleado")
+    metodopago = payload.get("metodopago")
+    items = payload.get("items")
+
+    if idempleado is not None and not isinstance(idempleado, int):
+        return jsonify({"error": "idempleado debe ser un entero"}), 400
+    if metodopago is not None and not isinstance(metodopago, str):
+        return jsonify({"error": "metodopago inválido"}), 400
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items debe ser una lista no vacía"}), 400
+    if len(items) > MAX_ITEMS_VENTA:
+        return jsonify({"error": f"máximo {MAX_ITEMS_VENTA} items por venta"}), 400
+
+    errores = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errores.append({"index": index, "error": "item inválido"})
+        elif not isinstance(item.get("idvariante"), int) or not item["idvariante"]:
+            errores.append({"index": index, "error": "idvariante es obligatorio"})
+        elif not isinstance(item.get("cantidad"), int) or item["cantidad"] <= 0:
+            errores.append({"index": index, "error": "cantidad debe ser un entero positivo"})
+    if errores:
+        return jsonify({"error": "venta inválida", "errores": errores}), 400
+
+    with get_session() as session:
+        if idempleado is not None and session.get(Empleado, idempleado) is None:
+            return jsonify({"error": "Empleado no encontrado"}), 404
+
+        ids = {item["idvariante"] for item in items}
+        variantes = {
+            row.idvariante: row
+            for row in session.execute(
+                select(
+                    ProductoVariante.idvariante,
+                    ProductoVariante.idproducto,
+                    ProductoVariante.precio_venta,
+                    ProductoVariante.estado,
+                    Producto.precioventa,
+                    Producto.idcategoria,
+                )
+                .join(Producto, Producto.idproducto == ProductoVariante.idproducto)
+                .where(ProductoVariante.idvariante.in_(ids))
+            )
+        }
+
+        for index, item in enumerate(items):
+            variante = variantes.get(item["idvariante"])
+            if variante is None:
+                errores.append({"index": index, "error": "Variante no encontrada"})
+            elif not variante.estado:
+                errores.append({"index": index, "error": "Variante deshabilitada"})
+        if errores:
+            return jsonify({"error": "venta inválida", "errores": errores}), 400
+
+        deltas = acumular_deltas((item["idvariante"], "SALIDA", item["cantidad"]) for item in items)
+        if not current_app.config["STOCK_PERMITIR_NEGATIVO"]:
+            faltantes = reservar_stock(session, deltas)
+            if faltantes:
+                return jsonify({"error": "Stock insuficiente", "faltantes": faltantes}), 409
+
+        detalles = []
+        total = Decimal("0")
+        for item in items:
+            variante = variantes[item["idvariante"]]
+            precio = Decimal(variante.precio_venta or variante.precioventa or 0)
+            subtotal = precio * item["cantidad"]
+            total += subtotal
+            detalles.append(
+                {
+                    "idproducto": variante.idproducto,
+                    "idvariante": variante.idvariante,
+                    "cantidad": item["cantidad"],
+                    "preciounitario": precio,
+                    "subtotal": subtotal,
+                }
+            )
+
+        fecha = datetime.utcnow()
+        idventa = session.execute(
+            insert(Venta)
+            .values(fecha=fecha, idempleado=idempleado, total=total, metodopago=metodopago)
+            .returning(Venta.idventa)
+        ).scalar_one()
+
+        session.execute(
+            insert(DetalleVenta), [{"idventa": idventa, **detalle} for detalle in detalles]
+        )
+        session.execute(
+            insert(MovimientoStock),
+            [
+                {
+                    "idvariante": detalle["idvariante"],
+                    "tipo": "SALIDA",
+                    "cantidad": detalle["cantidad"],
+                    "referencia_id": idventa,
+                    "referencia_tipo": REFERENCIA_VENTA,
+                    "idempleado": idempleado,
+                    "fecha": fecha,
+                }
+                for detalle in detalles
+            ],
+        )
+
+        aplicar_deltas(session, deltas)
+        mark_changed(session, MovimientoStock.__tablename__, deltas.keys())
+
+        # Rollups last: their rows are the most contended, so hold them briefly.
+        resumen = Acumulador()
+        resumen.agregar_venta(
+            fecha,
+            idempleado,
+            metodopago,
+            total,
+            (
+                (
+                    detalle["idvariante"],
+                    variantes[detalle["idvariante"]].idcategoria,
+                    detalle["cantidad"],
+                    detalle["subtotal"],
+                )
+                for detalle in detalles
+            ),
+        )
+        aplicar_resumen(session, resumen.filas)
+
+    return (
+        jsonify(
+            {
+                "idventa": idventa,
+                "fecha": fecha.isoformat(),
+                "total": float(total),
+                "metodopago": metodopago,
+                "detalles": [
+                    {
+                        "idvariante": detalle["idvariante"],
+                        "idproducto": detalle["idproducto"],
+                        "cantidad": detalle["cantidad"],
+                        "preciounitario": float(detalle["preciounitario"]),
+                        "subtotal": float(detalle["subtotal"]),
+                    }
+                    for detalle in detalles
+                ],
+            }
+        ),
+        201,
+    )
@@ -0,0 +1,115 @@
+"""Password hashing and signed session tokens."""
+from __future__ import annotations
+
+import logging
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import bcrypt
+from flask import Flask, current_app, g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = "vivero-auth"
+
+
+class HasherBusy(RuntimeError):
+    """Raised when too many password checks are already queued."""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated pool with a cap on queued work.
+
+    bcrypt releases the GIL while hashing, so a few threads use real cores
+    while the cap keeps a login burst from eating every worker: requests over
+    the limit are rejected immediately instead of piling up.
+    """
+
+    def __init__(self, rounds: int, workers: int, max_pending: int, timeout: float) -> None:
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        return self._run(bcrypt.checkpw, password.encode("utf-8"), password_hash.encode("utf-8"))
+
+    def hash(self, password: str) -> str:
+        salt = bcrypt.gensalt(self.rounds)
+        return self._run(bcrypt.hashpw, password.encode("utf-8"), salt).decode("utf-8")
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        try:
+            return int(password_hash.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy("Demasiados inicios de sesión simultáneos")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot stays taken until the hash actually finishes, even when the
+        # caller stops waiting: a timed out hash still occupies a worker.
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result(timeout=self.timeout)
+
+
+def init_security(app: Flask) -> None:
+    if not app.config.get("SECRET_KEY"):
+        logger.warning("SECRET_KEY no configurada; los tokens no sobrevivirán a un reinicio")
+        app.config["SECRET_KEY"] = secrets.token_hex(32)
+
+    app.extensions["password_hasher"] = PasswordHasher(
+        rounds=app.config["BCRYPT_ROUNDS"],
+        workers=app.config["AUTH_HASH_WORKERS"],
+        max_pending=app.config["AUTH_HASH_MAX_PENDING"],
+        timeout=app.config["AUTH_HASH_TIMEOUT"],
+    )
+
+
+def get_hasher() -> PasswordHasher:
+    return current_app.extensions["password_hasher"]
+
+
+def _serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt=TOKEN_SALT)
+
+
+def create_token(user_id: int, rol: str | None) -> str:
+    return _serializer().dumps({"uid": user_id, "rol": rol})
+
+
+def verify_token(token: str) -> dict | None:
+    """Return the token payload, or ``None`` if it is invalid or expired."""
+
+    try:
+        return _serializer().loads(token, max_age=current_app.config["AUTH_TOKEN_TTL"])
+    except (SignatureExpired, BadSignature):
+        return None
+
+
+def login_required(view):
+    """Require a valid ``Authorization: Bearer <token>`` header.
+
+    The decoded payload is available as ``g.usuario`` inside the view. Only an
+    HMAC check is done per request; the database is not touched.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get("Authorization", "")
+        scheme, _, token = header.partition(" ")
+        payload = verify_token(token.strip()) if scheme.lower() == "bearer" else None
+        if payload is None:
+            return jsonify({"error": "Sesión inválida o expirada"}), 401
+        g.usuario = payload
+        return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,18 @@
+"""Helpers shared by the routes to turn ORM values into JSON friendly data."""
+from __future__ import annotations
+
+from sqlalchemy import Row
+
+from .models import VarianteValor
+
+
+def serialize_valor(valor: VarianteValor | Row) -> str | float | bool | None:
+    """JSON value of an attribute value (an ORM object or a row with its columns)."""
+
+    if valor.valor_texto is not None:
+        return valor.valor_texto
+    if valor.valor_numero is not None:
+        return float(valor.valor_numero)
+    if valor.valor_booleano is not None:
+        return bool(valor.valor_booleano)
+    return None
@@ -0,0 +1,194 @@
+"""Materialized stock balances kept in step with the movement ledger."""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Mapping
+
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from .alertas import evaluar_alertas
+from .db import upsert_insert
+from .invalidation import mark_changed
+from .models import MovimientoStock, ProductoVariante, StockVariante
+
+MOV_TIPO_NEGATIVO = {"SALIDA"}
+ALLOWED_MOV_TYPES = {"ENTRADA", "SALIDA", "AJUSTE"}
+
+# Keeps multi-row upserts well below the driver's bind parameter limit.
+UPSERT_CHUNK = 1000
+
+
+def delta_movimiento(tipo: str, cantidad: int) -> int:
+    """Signed effect of a movement on the variant balance."""
+
+    return -cantidad if tipo in MOV_TIPO_NEGATIVO else cantidad
+
+
+def delta_expr():
+    """SQL expression equivalent to :func:`delta_movimiento` over the ledger."""
+
+    return case(
+        (MovimientoStock.tipo.in_(MOV_TIPO_NEGATIVO), -MovimientoStock.cantidad),
+        else_=MovimientoStock.cantidad,
+    )
+
+
+def acumular_deltas(movimientos: Iterable[tuple[int, str, int]]) -> dict[int, int]:
+    """Collapse ``(idvariante, tipo, cantidad)`` tuples into one delta per variant."""
+
+    deltas: dict[int, int] = defaultdict(int)
+    for idvariante, tipo, cantidad in movimientos:
+        deltas[idvariante] += delta_movimiento(tipo, cantidad)
+    return dict(deltas)
+
+
+def aplicar_deltas(session: Session, deltas: Mapping[int, int]) -> None:
+    """Add ``deltas`` to the stored balances inside the caller's transaction.
+
+    Every write path that inserts ``MovimientoStock`` rows must call this in the
+    same session so the balance and the ledger commit (or roll back) together.
+    Variants are processed in id order so concurrent writers lock rows in a
+    consistent sequence.
+    """
+
+    if not deltas:
+        return
+
+    now = datetime.utcnow()
+    items = sorted(deltas.items())
+    for start in range(0, len(items), UPSERT_CHUNK):
+        stmt = upsert_insert(session, StockVariante).values(
+            [
+                {"idvariante": idvariante, "cantidad": delta, "fecha_actualizacion": now}
+                for idvariante, delta in items[start : start + UPSERT_CHUNK]
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StockVariante.idvariante],
+            set_={
+                "cantidad": StockVariante.cantidad + stmt.excluded.cantidad,
+                "fecha_actualizacion": stmt.excluded.fecha_actualizacion,
+            },
+        )
+        session.execute(stmt)
+    mark_changed(session, StockVariante.__tablename__, deltas.keys())
+    evaluar_alertas(session, deltas.keys())
+
+
+def reservar_stock(session: Session, deltas: Mapping[int, int]) -> list[dict]:
+    """Lock the variants ``deltas`` decrease and report those short of stock.
+
+    Must run before the caller writes anything. On Postgres the
+    ``producto_variantes`` rows are locked ``FOR NO KEY UPDATE`` in id order,
+    so concurrent writers touching the same variants queue up without
+    deadlocking, while unrelated variants and foreign-key inserts (new
+    movements, sale lines) are not blocked. Balances are read after the
+    locks are granted, so they include every committed decrement. SQLite has
+    no row locks; ``BEGIN IMMEDIATE`` takes its single write lock instead.
+
+    Returns ``{"idvariante", "disponible", "solicitado"}`` for each variant
+    whose balance would go negative; the locks are held until commit.
+    """
+
+    ids = sorted(idvariante for idvariante, delta in deltas.items() if delta < 0)
+    if not ids:
+        return []
+
+    conexion = session.connection(bind_arguments={"mapper": StockVariante})
+    if conexion.dialect.name == "sqlite":
+        dbapi = conexion.connection.dbapi_connection
+        # A transaction open in pysqlite has already written, so holds the lock.
+        if not dbapi.in_transaction:
+            conexion.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        session.execute(
+            select(ProductoVariante.idvariante)
+            .where(ProductoVariante.idvariante.in_(ids))
+            .order_by(ProductoVariante.idvariante)
+            .with_for_update(of=ProductoVariante, key_share=True)
+        )
+
+    disponibles = dict(
+        session.execute(
+            select(StockVariante.idvariante, StockVariante.cantidad).where(
+                StockVariante.idvariante.in_(ids)
+            )
+        ).all()
+    )
+    faltantes = []
+    for idvariante in ids:
+        disponible = disponibles.get(idvariante) or 0
+        if disponible + deltas[idvariante] < 0:
+            faltantes.append(
+                {
+                    "idvariante": idvariante,
+                    "disponible": disponible,
+                    "solicitado": -deltas[idvariante],
+                }
+            )
+    return faltantes
+
+
+def saldos_desde_libro(session: Session) -> dict[int, int]:
+    """Recompute every variant balance by summing the full ledger."""
+
+    rows = session.execute(
+        select(MovimientoStock.idvariante, func.coalesce(func.sum(delta_expr()), 0))
+        .group_by(MovimientoStock.idvariante)
+    ).all()
+    return {idvariante: int(total) for idvariante, total in rows}
+
+
+def recalcular_saldos(session: Session, *, solo_verificar: bool = False) -> list[dict]:
+    """Compare stored balances against the ledger and optionally repair them.
+
+    Returns the list of discrepancies found as dicts with ``idvariante``,
+    ``esperado`` and ``almacenado`` keys.
+    """
+
+    esperados = saldos_desde_libro(session)
+    almacenados = {
+        idvariante: cantidad
+        for idvariante, cantidad in session.execute(
+            select(StockVariante.idvariante, StockVariante.cantidad)
+        )
+    }
+
+    diferencias = []
+    for idvariante in sorted(esperados.keys() | almacenados.keys()):
+        esperado = esperados.get(idvariante, 0)
+        almacenado = almacenados.get(idvariante)
+        if almacenado != esperado:
+            diferencias.append(
+                {"idvariante": idvariante, "esperado": esperado, "almacenado": almacenado}
+            )
+
+    if diferencias and not solo_verificar:
+        now = datetime.utcnow()
+        for start in range(0, len(diferencias), UPSERT_CHUNK):
+            stmt = upsert_insert(session, StockVariante).values(
+                [
+                    {
+                        "idvariante": item["idvariante"],
+                        "cantidad": item["esperado"],
+                        "fecha_actualizacion": now,
+                    }
+                    for item in diferencias[start : start + UPSERT_CHUNK]
+                ]
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[StockVariante.idvariante],
+                set_={
+                    "cantidad": stmt.excluded.cantidad,
+                    "fecha_actualizacion": stmt.excluded.fecha_actualizacion,
+                },
+            )
+            session.execute(stmt)
+        mark_changed(
+            session, StockVariante.__tablename__, (item["idvariante"] for item in diferencias)
+        )
+        evaluar_alertas(session, (item["idvariante"] for item in diferencias))
+
+    return diferencias
@@ -0,0 +1,391 @@
+"""Change log for delta sync of POS terminals.
+
+Every commit that touches products, variants, attribute values, stock,
+categories or attributes upserts one row per changed entity into
+``sync_cambios`` with version ``0`` (pending). Versions are stamped right
+after, in a short transaction of their own that bumps the single-row
+``sync_version`` counter and moves every committed pending row to the new
+version. Stamps are serialized by the counter row lock and hold it only
+for milliseconds, while the writes themselves never touch it. Versions are
+therefore still handed out in commit order, without making every write
+transaction in the system queue behind the counter. Once a reader sees
+version ``n`` every change up to ``n`` is visible, and a terminal holding a
+cursor never misses a commit that was still in flight.
+
+Each process stamps its own commits from a background thread, coalescing
+bursts into one stamp; readers stamp whatever is left before reading. On
+SQLite, which serializes writers anyway, the stamp runs inline before
+``COMMIT``.
+
+``sync_cambios`` keeps one row per entity, not one per change, so it never
+needs pruning. Entities that no longer exist are reported as deleted.
+"""
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable
+
+from sqlalchemy import event, func, or_, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from .catalog import agrupar_valores, precio_float, serialize_categoria, valores_query
+from .db import SessionLocal, get_session, tabla_instalada, upsert_insert, use_primary
+from .invalidation import pending_changes
+from .models import (
+    Atributo,
+    Categoria,
+    Producto,
+    ProductoVariante,
+    StockVariante,
+    SyncCambio,
+    SyncVersion,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+# Invalidation table -> entity kind recorded in ``sync_cambios``.
+TIPOS = {
+    "productos": "producto",
+    "producto_variantes": "variante",
+    "variante_valores": "variante",
+    "stock_variantes": "stock",
+    "movimientos_stock": "stock",
+    "categorias": "categoria",
+    "atributos": "atributo",
+}
+
+# Version of entities changed by a committed transaction not stamped yet.
+PENDIENTE = 0
+AYUDA_INSTALAR = "corré `flask sync inicializar` para activar la sincronización"
+REINTENTO_SEGUNDOS = 1.0
+_SESSION_KEY = "sync_pendiente"
+
+Cursor = tuple[int, str | None, int | None]
+
+
+def inicializar(session: Session) -> None:
+    """Create the counter row if it does not exist yet."""
+
+    if session.get(SyncVersion, 1) is None:
+        session.add(SyncVersion(id=1, version=0))
+
+
+def version_actual(session: Session) -> int:
+    return session.scalar(select(SyncVersion.version).where(SyncVersion.id == 1)) or 0
+
+
+def registrar_cambios(session: Session) -> bool:
+    """Record this transaction's synced changes as pending.
+
+    Called from ``before_commit``; returns whether anything was recorded
+    (nothing is when no synced data changed or the sync tables are not
+    installed). Only the changed entities' rows are locked.
+    """
+
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    cambios = {
+        (tipo, entidad_id)
+        for tabla, tipo in TIPOS.items()
+        for entidad_id in pending_changes(session).get(tabla, ())
+    }
+    if not cambios or not tabla_instalada(session, SyncCambio, AYUDA_INSTALAR):
+        return False
+
+    stmt = upsert_insert(session, SyncCambio)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SyncCambio.tipo, SyncCambio.entidad_id],
+        set_={"version": stmt.excluded.version},
+    )
+    session.execute(
+        stmt,
+        [
+            {"tipo": tipo, "entidad_id": entidad_id, "version": PENDIENTE}
+            for tipo, entidad_id in sorted(cambios)
+        ],
+    )
+    return True
+
+
+def sellar_pendientes(session: Session) -> int | None:
+    """Stamp every committed pending change with a new version.
+
+    Returns the version, or ``None`` when there was nothing to stamp. Rows
+    locked by a transaction that is rewriting them are skipped rather than
+    waited for: that transaction leaves them pending again and a later
+    stamp picks them up.
+    """
+
+    pendientes = (
+        select(SyncCambio.tipo, SyncCambio.entidad_id)
+        .where(SyncCambio.version == PENDIENTE)
+        .with_for_update(skip_locked=True)
+    )
+    with use_primary(session):
+        if session.execute(pendientes.limit(1)).first() is None:
+            return None
+        version = session.execute(
+            update(SyncVersion)
+            .where(SyncVersion.id == 1)
+            .values(version=SyncVersion.version + 1)
+            .returning(SyncVersion.version)
+        ).scalar()
+        if version is None:
+            logger.warning("sync_version no tiene su fila; corré `flask sync inicializar`")
+            return None
+        session.execute(
+            update(SyncCambio)
+            .where(tuple_(SyncCambio.tipo, SyncCambio.entidad_id).in_(pendientes))
+            .values(version=version)
+            .execution_options(synchronize_session=False)
+        )
+    return version
+
+
+class SelladorCambios:
+    """Per-process thread that stamps pending changes shortly after each commit."""
+
+    def __init__(self) -> None:
+        self._evento = threading.Event()
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+
+    def avisar(self) -> None:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._run, name="sync-sellos", daemon=True).start()
+        self._evento.set()
+
+    def _run(self) -> None:
+        while True:
+            self._evento.wait()
+            self._evento.clear()
+            try:
+                with get_session() as session:
+                    sellar_pendientes(session)
+            except Exception:
+                logger.exception("No se pudieron sellar los cambios; se reintenta")
+                time.sleep(REINTENTO_SEGUNDOS)
+                self._evento.set()
+            finally:
+                SessionLocal.remove()
+
+
+sellador = SelladorCambios()
+
+
+def cambios_desde(session: Session, cursor: Cursor, limit: int) -> dict:
+    """Current state of the entities changed after ``cursor``, oldest first.
+
+    At most ``limit`` log rows are read per call; ``mas`` tells the caller
+    to ask again with the returned cursor.
+    """
+
+    version, tipo, entidad_id = cursor
+    query = select(SyncCambio.version, SyncCambio.tipo, SyncCambio.entidad_id).where(
+        SyncCambio.version > PENDIENTE
+    )
+    if tipo is None:
+        query = query.where(SyncCambio.version > version)
+    else:
+        query = query.where(
+            or_(
+                SyncCambio.version > version,
+                tuple_(SyncCambio.version, SyncCambio.tipo, SyncCambio.entidad_id)
+                > tuple_(version, tipo, entidad_id),
+            )
+        )
+    filas = session.execute(
+        query.order_by(SyncCambio.version, SyncCambio.tipo, SyncCambio.entidad_id).limit(
+            limit + 1
+        )
+    ).all()
+    mas = len(filas) > limit
+    filas = filas[:limit]
+
+    ids: dict[str, set[int]] = defaultdict(set)
+    for fila in filas:
+        ids[fila.tipo].add(fila.entidad_id)
+
+    productos = _productos(session, ids["producto"])
+    variantes = _variantes(session, ids["variante"])
+    stock = _stock(session, ids["stock"] - ids["variante"])
+    categorias = [
+        serialize_categoria(categoria)
+        for categoria in session.scalars(
+            select(Categoria).where(Categoria.idcategoria.in_(ids["categoria"]))
+        )
+    ]
+    atributos = [
+        serialize_atributo(atributo)
+        for atributo in session.scalars(
+            select(Atributo).where(Atributo.idatributo.in_(ids["atributo"]))
+        )
+    ]
+
+    if filas:
+        ultima = filas[-1]
+        siguiente = encode_cursor(ultima.version, ultima.tipo, ultima.entidad_id)
+    else:
+        siguiente = encode_cursor(version, tipo, entidad_id)
+    return {
+        "productos": productos,
+        "variantes": variantes,
+        "stock": stock,
+        "categorias": categorias,
+        "atributos": atributos,
+        "eliminados": {
+            "productos": _faltantes(ids["producto"], productos),
+            "variantes": _faltantes(ids["variante"] | ids["stock"], variantes, stock),
+            "categorias": _faltantes(ids["categoria"], categorias),
+            "atributos": _faltantes(ids["atributo"], atributos),
+        },
+        "cursor": siguiente,
+        "mas": mas,
+    }
+
+
+def _productos(session: Session, ids: set[int]) -> list[dict]:
+    if not ids:
+        return []
+    query = select(
+        Producto.idproducto,
+        Producto.nombre,
+        Producto.descripcion,
+        precio_float(Producto.precioventa).label("precio_venta"),
+        Producto.idcategoria,
+        Producto.idproveedor,
+        Producto.estado,
+    ).where(Producto.idproducto.in_(ids))
+    return [
+        {
+            "id": row.idproducto,
+            "nombre": row.nombre,
+            "descripcion": row.descripcion,
+            "precio_venta": row.precio_venta,
+            "categoria_id": row.idcategoria,
+            "proveedor_id": row.idproveedor,
+            "estado": row.estado,
+        }
+        for row in session.execute(query.order_by(Producto.idproducto))
+    ]
+
+
+def _variantes(session: Session, ids: set[int]) -> list[dict]:
+    """Variant entries in the catalog shape plus ``producto_id`` and ``estado``."""
+
+    if not ids:
+        return []
+    query = (
+        select(
+            ProductoVariante.idvariante,
+            ProductoVariante.idproducto,
+            ProductoVariante.sku,
+            ProductoVariante.codigo_barras,
+            precio_float(ProductoVariante.precio_venta).label("precio_variante"),
+            ProductoVariante.stock_minimo,
+            ProductoVariante.estado,
+            func.coalesce(StockVariante.cantidad, 0).label("stock"),
+        )
+        .join(StockVariante, StockVariante.idvariante == ProductoVariante.idvariante, isouter=True)
+        .where(ProductoVariante.idvariante.in_(ids))
+        .order_by(ProductoVariante.idvariante)
+    )
+    atributos = agrupar_valores(session.execute(valores_query(list(ids))))
+    return [
+        {
+            "id": row.idvariante,
+            "producto_id": row.idproducto,
+            "sku": row.sku,
+            "codigo_barras": row.codigo_barras,
+            "precio_venta": row.precio_variante,
+            "stock_actual": row.stock,
+            "stock_minimo": row.stock_minimo,
+            "estado": row.estado,
+            "atributos": atributos.get(row.idvariante, []),
+        }
+        for row in session.execute(query)
+    ]
+
+
+def _stock(session: Session, ids: set[int]) -> list[dict]:
+    if not ids:
+        return []
+    query = (
+        select(ProductoVariante.idvariante, func.coalesce(StockVariante.cantidad, 0))
+        .join(StockVariante, StockVariante.idvariante == ProductoVariante.idvariante, isouter=True)
+        .where(ProductoVariante.idvariante.in_(ids))
+        .order_by(ProductoVariante.idvariante)
+    )
+    return [
+        {"id": idvariante, "stock_actual": cantidad}
+        for idvariante, cantidad in session.execute(query)
+    ]
+
+
+def serialize_atributo(atributo: Atributo) -> dict:
+    return {
+        "id": atributo.idatributo,
+        "nombre": atributo.nombre,
+        "slug": atributo.slug,
+        "tipo_dato": atributo.tipo_dato,
+        "activo": atributo.activo,
+    }
+
+
+def encode_cursor(version: int, tipo: str | None = None, entidad_id: int | None = None) -> str:
+    valor = [version] if tipo is None else [version, tipo, entidad_id]
+    raw = json.dumps(valor, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(value: str) -> Cursor:
+    try:
+        padded = value + "=" * (-len(value) % 4)
+        valor = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("cursor inválido") from None
+    if not isinstance(valor, list) or not valor or not isinstance(valor[0], int):
+        raise ValueError("cursor inválido")
+    if len(valor) == 1:
+        return valor[0], None, None
+    if len(valor) != 3 or not isinstance(valor[1], str) or not isinstance(valor[2], int):
+        raise ValueError("cursor inválido")
+    return valor[0], valor[1], valor[2]
+
+
+def _faltantes(ids: Iterable[int], *presentes: list[dict]) -> list[int]:
+    encontrados = {item["id"] for lista in presentes for item in lista}
+    return sorted(set(ids) - encontrados)
+
+
+@event.listens_for(Session, "before_commit")
+def _stamp_changes(session: Session) -> None:
+    if not registrar_cambios(session):
+        return
+    if session.get_bind(mapper=SyncCambio).dialect.name == "sqlite":
+        sellar_pendientes(session)
+    else:
+        session.info[_SESSION_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_stamper(session: Session) -> None:
+    if session.info.pop(_SESSION_KEY, False):
+        sellador.avisar()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_stamp(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
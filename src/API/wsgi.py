@@ -0,0 +1,10 @@
+"""WSGI entry point for production servers, e.g. ``gunicorn src.API.wsgi:app``.
+
+Building the app does no database work and never prompts, so it is safe to
+import in a pre-fork master; each worker opens its own connections lazily.
+"""
+from __future__ import annotations
+
+from .app import create_app
+
+app = create_app(interactive=False)
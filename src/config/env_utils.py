@@ -1,6 +1,7 @@
 from __future__ import annotations 
 
 import os
+import sys
 from pathlib import Path 
 from urllib.parse import urlparse
 
@@ -8,12 +9,19 @@ from dotenv import load_dotenv, set_key
 
 ENV_PATH = Path(".env")
 
-def ensureDatabaseUrl() -> str:
+def ensureDatabaseUrl(interactive: bool | None = None) -> str:
     load_dotenv(ENV_PATH)
     url = os.getenv("DATABASE_URL")
     if url:
         return url
 
+    if interactive is None:
+        interactive = isInteractive()
+    if not interactive:
+        raise RuntimeError(
+            "DATABASE_URL no esta definida. Configurela en el entorno o en el archivo .env"
+        )
+
     while True:
         url = input(
             "Ingrese la cadena de conexion a la base de datos "
@@ -29,6 +37,20 @@ def ensureDatabaseUrl() -> str:
     print ("Cadena de conexion guardada en el archivo .env")
     return url
 
+def isInteractive() -> bool:
+    if os.getenv("VIVERO_NONINTERACTIVE"):
+        return False
+    return sys.stdin is not None and sys.stdin.isatty()
+
 def isValidDatabaseUrl(value: str) -> bool:
     parsed = urlparse(value)
-    return parsed.scheme in {"postgresql", "postgres"} and parsed.hostname and parsed.path
\ No newline at end of file
+    return parsed.scheme in {"postgresql", "postgres"} and parsed.hostname and parsed.path
+
+def getEnvInt(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise RuntimeError(f"{name} debe ser un numero entero") from None